@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+────────────────────────────────────────────────────────────────────
+Per-line vs. token-window chunking for tools/index_pdf.py.
+
+Builds one throw-away Chroma index per chunking setting from the PDFs
+in ./data/ and, for each, reports
+
+    vectors     how many chunks were embedded and stored
+    build_s     wall time of index_pdfs() (model load included)
+    query       latency of collection.query() per question (p50/p95/p99)
+    recall@k    share of questions whose answer line is inside one of
+                the top-k retrieved documents
+
+The question set is generated from the PDFs themselves: for every line
+that names a city, a few questions about that city's office, each
+expecting that exact line back.  `--queries FILE` adds (or, with
+`--no-generated`, replaces them with) JSON lines of
+{"query": ..., "expect": "substring of the right document"}.
+
+Examples
+--------
+    python benchmarks/chunking.py
+    python benchmarks/chunking.py --settings lines tokens:96:24 tokens:160:32 --k 1 3 5
+    python benchmarks/chunking.py --queries my_questions.jsonl --repeat 50
+────────────────────────────────────────────────────────────────────
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from run import RESULTS_DIR, ROOT, summarize
+
+sys.path.insert(0, str(ROOT / "tools"))
+sys.path.insert(0, str(ROOT / "code"))
+import index_pdf                                         # noqa: E402
+from city_extractor import get_extractor                 # noqa: E402
+
+TEMPLATES = [
+    "Tell me about the {city} office",
+    "How many employees work in {city}?",
+    "What services does the {city} office offer?",
+]
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 1.  Questions                                                      ║
+# ╚══════════════════════════════════════════════════════════════════╝
+def generated_queries(pdf_dir: Path) -> list[dict]:
+    """One question per template for every PDF line that names a city."""
+    extractor = get_extractor()
+    queries = []
+    for pdf in sorted(pdf_dir.glob("*.pdf")):
+        for line in index_pdf.extract_lines(pdf):
+            for city in extractor.find_all(line)[:1]:
+                queries += [{"query": t.format(city=city), "expect": line} for t in TEMPLATES]
+    return queries
+
+def load_queries(path: Path) -> list[dict]:
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+def parse_setting(spec: str) -> dict:
+    """`lines`, `tokens` or `tokens:MAX:OVERLAP` → index_pdf.chunk_settings()."""
+    mode, *numbers = spec.split(":")
+    if mode == "tokens" and numbers:
+        return index_pdf.chunk_settings("tokens", *map(int, numbers))
+    return index_pdf.chunk_settings(mode)
+
+def label(settings: dict) -> str:
+    if settings["mode"] == "lines":
+        return "lines"
+    return f"tokens:{settings['max_tokens']}:{settings['overlap']}"
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 2.  One chunking setting                                           ║
+# ╚══════════════════════════════════════════════════════════════════╝
+def evaluate(settings: dict, pdf_dir: Path, workdir: Path, embed_model,
+             queries: list[dict], query_vecs, ks: list[int], repeat: int) -> dict:
+    """Build the index for `settings`, then time and score every question."""
+    from chromadb import PersistentClient
+    from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
+
+    db_path = workdir / label(settings).replace(":", "_")
+    started = time.perf_counter()
+    index_pdf.index_pdfs(pdf_dir=pdf_dir, db_path=db_path, chunking=settings["mode"],
+                         chunk_tokens=settings.get("max_tokens", index_pdf.CHUNK_TOKENS),
+                         chunk_overlap=settings.get("overlap", index_pdf.CHUNK_OVERLAP))
+    build_s = time.perf_counter() - started
+
+    client = PersistentClient(path=str(db_path), settings=Settings(),
+                              tenant=DEFAULT_TENANT, database=DEFAULT_DATABASE)
+    coll = client.get_collection(index_pdf.COLLECTION_NAME)
+    vectors = coll.count()
+    top_k = min(max(ks), vectors)
+
+    latencies, hits = [], {k: 0 for k in ks}
+    for item, vec in zip(queries, query_vecs):
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            docs = coll.query(query_embeddings=[vec.tolist()], n_results=top_k,
+                              include=["documents"])["documents"][0]
+            latencies.append(time.perf_counter() - t0)
+        for k in ks:
+            hits[k] += any(item["expect"] in doc for doc in docs[:k])
+
+    return {
+        "setting":    label(settings),
+        "vectors":    vectors,
+        "build_s":    round(build_s, 3),
+        "query":      summarize(latencies),
+        "recall":     {f"@{k}": round(hits[k] / len(queries), 4) for k in ks},
+    }
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 3.  CLI                                                            ║
+# ╚══════════════════════════════════════════════════════════════════╝
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare chunking settings of tools/index_pdf.py.")
+    parser.add_argument("--settings", nargs="+", default=["lines", "tokens"],
+                        help="lines | tokens | tokens:MAX:OVERLAP (default: lines tokens)")
+    parser.add_argument("--pdf-dir", type=Path, default=ROOT / "data")
+    parser.add_argument("--queries", type=Path, help="extra JSONL questions {query, expect}")
+    parser.add_argument("--no-generated", action="store_true",
+                        help="only use --queries, not the questions generated from the PDFs")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--repeat", type=int, default=20, help="timed queries per question")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    queries = [] if args.no_generated else generated_queries(args.pdf_dir)
+    if args.queries:
+        queries += load_queries(args.queries)
+    if not queries:
+        parser.error("no questions: the PDFs name no known city and --queries was not given")
+
+    from sentence_transformers import SentenceTransformer
+    embed_model = SentenceTransformer(index_pdf.EMBED_MODEL_NAME)
+    query_vecs = embed_model.encode([q["query"] for q in queries],
+                                    normalize_embeddings=True, convert_to_numpy=True)
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="chunking-") as tmp:
+        for spec in args.settings:
+            rows.append(evaluate(parse_setting(spec), args.pdf_dir, Path(tmp), embed_model,
+                                 queries, query_vecs, args.k, args.repeat))
+
+    print(f"\n{len(queries)} questions, {args.repeat} timed queries each\n")
+    print(f"{'setting':<16} {'vectors':>7} {'build s':>8} {'q p50 ms':>9} {'q p95 ms':>9} "
+          + " ".join(f"{'recall@' + str(k):>9}" for k in args.k))
+    for row in rows:
+        q = row["query"]
+        print(f"{row['setting']:<16} {row['vectors']:>7} {row['build_s']:>8.2f} "
+              f"{q['p50'] * 1000:>9.3f} {q['p95'] * 1000:>9.3f} "
+              + " ".join(f"{row['recall']['@' + str(k)]:>9.2%}" for k in args.k))
+
+    output = args.output or RESULTS_DIR / f"chunking-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "meta": {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                 "pdf_dir": str(args.pdf_dir), "questions": len(queries),
+                 "repeat": args.repeat, "model": index_pdf.EMBED_MODEL_NAME},
+        "settings": rows,
+    }, indent=2), encoding="utf-8")
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+────────────────────────────────────────────────────────────────────
+Load test for the async travel-assistant service (code/service.py).
+
+Runs the service under uvicorn against the local upstream stubs
+(benchmarks/stubs.py) and fires streamed requests at increasing
+concurrency levels, e.g. 1 → 2 → 4 → 8 → 16 → 32 clients.  For each
+level it reports throughput (requests/s), time to the first streamed
+event, end-to-end latency percentiles and how many requests admission
+control refused (503) or cut off at the deadline (504).  With the LLM
+stub sleeping rather than computing, throughput should scale with
+concurrency until SERVICE_MAX_CONCURRENT is reached, then flatten
+while latency stays bounded and extra requests are shed.
+
+Examples
+--------
+    python benchmarks/loadtest.py                       # agent flow
+    python benchmarks/loadtest.py --flow rag --levels 1 4 16
+    python benchmarks/loadtest.py --max-concurrent 4 --max-queue 4 --levels 8 32
+    python benchmarks/loadtest.py --url http://127.0.0.1:8080   # existing server
+────────────────────────────────────────────────────────────────────
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+from run import RESULTS_DIR, ROOT, free_port, summarize, wait_for_port
+from stubs import StubConfig, StubServer
+
+PROMPTS = [
+    "Tell me about Paris", "How far is Chicago?", "I want to visit Kyoto",
+    "Tell me about Boise", "What is Lagos like?", "Compare Boston and Denver",
+]
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 1.  One concurrency level                                          ║
+# ╚══════════════════════════════════════════════════════════════════╝
+async def one_request(client: httpx.AsyncClient, url: str, prompt: str) -> dict:
+    """Stream one request; status, time to first event and total seconds."""
+    started = time.perf_counter()
+    first = None
+    try:
+        async with client.stream("POST", url, json={"prompt": prompt, "stream": True}) as resp:
+            if resp.status_code != 200:
+                await resp.aread()
+                return {"status": resp.status_code, "seconds": time.perf_counter() - started}
+            status = 200
+            async for line in resp.aiter_lines():
+                if not line:
+                    continue
+                if first is None:
+                    first = time.perf_counter() - started
+                event = json.loads(line)
+                if event["type"] == "error":
+                    status = event.get("status", 502)
+    except httpx.HTTPError:
+        status = 0
+    return {"status": status, "ttfb": first, "seconds": time.perf_counter() - started}
+
+async def run_level(url: str, concurrency: int, total: int) -> dict:
+    """`total` requests from `concurrency` clients that each send back-to-back."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(PROMPTS[i % len(PROMPTS)])
+    results: list[dict] = []
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        while True:
+            try:
+                prompt = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results.append(await one_request(client, url, prompt))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    ok = [r for r in results if r["status"] == 200]
+    return {
+        "concurrency":    concurrency,
+        "requests":       len(results),
+        "ok":             len(ok),
+        "rejected_503":   sum(r["status"] == 503 for r in results),
+        "timed_out_504":  sum(r["status"] == 504 for r in results),
+        "other_errors":   sum(r["status"] not in (200, 503, 504) for r in results),
+        "wall_s":         round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else None,
+        "ttfb":           summarize([r["ttfb"] for r in ok if r["ttfb"] is not None]),
+        "latency":        summarize([r["seconds"] for r in ok]),
+    }
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 2.  Service under test                                             ║
+# ╚══════════════════════════════════════════════════════════════════╝
+class ServiceProcess:
+    """`uvicorn service:app` from code/, wired to the stubs."""
+
+    def __init__(self, env: dict, log_path: Path) -> None:
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._log = open(log_path, "wb")
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "service:app", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=ROOT / "code", env=env, stdout=self._log, stderr=subprocess.STDOUT)
+        wait_for_port(self.port, self.proc)
+
+    def close(self) -> None:
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self._log.close()
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 3.  CLI                                                            ║
+# ╚══════════════════════════════════════════════════════════════════╝
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Throughput vs. concurrency for code/service.py.")
+    parser.add_argument("--flow", choices=["agent", "rag"], default="agent")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=4,
+                        help="requests per client at each level (default 4)")
+    parser.add_argument("--url", help="use an already running service instead of starting one")
+    parser.add_argument("--max-concurrent", type=int, default=8, help="SERVICE_MAX_CONCURRENT")
+    parser.add_argument("--max-queue", type=int, default=32, help="SERVICE_MAX_QUEUE")
+    parser.add_argument("--timeout", type=float, default=60, help="SERVICE_REQUEST_TIMEOUT")
+    parser.add_argument("--output", type=Path)
+    for field, default in asdict(StubConfig()).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default,
+                            help=f"stub setting (default {default})")
+    args = parser.parse_args()
+
+    stubs: Optional[StubServer] = None
+    service: Optional[ServiceProcess] = None
+    base_url = args.url
+    if base_url is None:
+        stubs = StubServer(StubConfig(**{f: getattr(args, f) for f in asdict(StubConfig())})).start()
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        env = {**os.environ, **stubs.env(), "LLM_CACHE_DISK": "0",
+               "GEOCODE_CACHE": str(RESULTS_DIR / "loadtest-geocode.sqlite"),
+               "SERVICE_MAX_CONCURRENT": str(args.max_concurrent),
+               "SERVICE_MAX_QUEUE": str(args.max_queue),
+               "SERVICE_REQUEST_TIMEOUT": str(args.timeout)}
+        service = ServiceProcess(env, RESULTS_DIR / "loadtest-service.log")
+        base_url = service.base_url
+
+    levels = []
+    try:
+        print(f"{'clients':>7} {'ok':>5} {'503':>5} {'504':>5} {'req/s':>8} "
+              f"{'ttfb p50':>9} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for level in args.levels:
+            result = asyncio.run(run_level(f"{base_url}/{args.flow}", level, level * args.requests))
+            levels.append(result)
+            lat, ttfb = result["latency"], result["ttfb"]
+            fmt = lambda s, k: f"{s[k]:.3f}" if s.get("n") else "-"
+            print(f"{level:>7} {result['ok']:>5} {result['rejected_503']:>5} {result['timed_out_504']:>5} "
+                  f"{result['throughput_rps'] or 0:>8.2f} {fmt(ttfb, 'p50'):>9} {fmt(lat, 'p50'):>8} "
+                  f"{fmt(lat, 'p95'):>8} {fmt(lat, 'p99'):>8}", flush=True)
+        with httpx.Client() as client:
+            health = client.get(f"{base_url}/health").json()
+    finally:
+        if service is not None:
+            service.close()
+        if stubs is not None:
+            stubs.shutdown()
+
+    output = args.output or RESULTS_DIR / f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "meta": {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                 "flow": args.flow, "max_concurrent": args.max_concurrent,
+                 "max_queue": args.max_queue, "timeout": args.timeout,
+                 "stubs": None if args.url else {f: getattr(args, f) for f in asdict(StubConfig())}},
+        "levels": levels,
+        "service_health": health,
+    }, indent=2), encoding="utf-8")
+    print(f"(seconds)\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
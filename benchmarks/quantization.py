@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+────────────────────────────────────────────────────────────────────
+Recall and latency of tools/quant_store.py against exact search.
+
+For every code (int8, binary) and every first-pass candidate count it
+reports
+
+    memory      bytes the first pass scans, and the ratio to float32
+    latency     per-query wall time of QuantizedStore.search()
+                (first pass + exact rerank), p50/p95
+    recall@k    overlap of the returned top-k with the exact top-k
+                (brute-force float32 cosine over the same vectors)
+
+next to the current exact path: Chroma's query with embeddings plus
+the cosine recomputed in Python, as tools/search.py does it.
+
+The office index is tiny, so `--synthetic N` replaces it with N random
+clustered unit vectors (and noisy copies of them as questions) to show
+how the codes behave at a size where memory and the first pass matter.
+
+Examples
+--------
+    python benchmarks/quantization.py                      # ./chroma_db
+    python benchmarks/quantization.py --synthetic 200000 --k 10
+    python benchmarks/quantization.py --candidates 10 40 160 --repeat 5
+────────────────────────────────────────────────────────────────────
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from run import RESULTS_DIR, ROOT, summarize
+
+sys.path.insert(0, str(ROOT / "tools"))
+import quant_store                                       # noqa: E402
+from quant_store import MODES, QuantizedStore            # noqa: E402
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 1.  Corpora                                                        ║
+# ╚══════════════════════════════════════════════════════════════════╝
+def synthetic_store(n: int, dim: int, questions: int, workdir: Path,
+                    seed: int = 0) -> tuple[QuantizedStore, np.ndarray]:
+    """N clustered unit vectors and noisy copies of some of them as queries."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(1, n // 100), dim))
+    raw = centres[rng.integers(0, len(centres), n)] + rng.normal(scale=0.6, size=(n, dim))
+    queries = raw[rng.integers(0, n, questions)] + rng.normal(scale=0.3, size=(questions, dim))
+    path = workdir / "synthetic"
+    quant_store.write_store(path, raw, [str(i) for i in range(n)], [""] * n, [{}] * n)
+    return QuantizedStore(path), quant_store.normalise(queries)
+
+def office_store(db_path: Path) -> tuple[QuantizedStore, np.ndarray, Callable]:
+    """The real index, its generated questions, and a timer for the Chroma path."""
+    from chromadb import PersistentClient
+    from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
+    from sentence_transformers import SentenceTransformer
+    from chunking import generated_queries
+    import index_pdf
+
+    client = PersistentClient(path=str(db_path), settings=Settings(),
+                              tenant=DEFAULT_TENANT, database=DEFAULT_DATABASE)
+    coll = client.get_collection(quant_store.COLLECTION_NAME)
+    store = QuantizedStore.open(db_path, coll)
+    questions = [q["query"] for q in generated_queries(ROOT / "data")]
+    model = SentenceTransformer(index_pdf.EMBED_MODEL_NAME)
+    queries = model.encode(questions, normalize_embeddings=True, convert_to_numpy=True)
+
+    def chroma_exact(query: np.ndarray, k: int) -> None:
+        results = coll.query(query_embeddings=[query.tolist()], n_results=k,
+                             include=["documents", "metadatas", "embeddings"])
+        [float(np.dot(query, e) / (np.linalg.norm(query) * np.linalg.norm(e) + 1e-10))
+         for e in results["embeddings"][0]]
+
+    return store, np.asarray(queries, dtype=np.float32), chroma_exact
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 2.  Measurements                                                   ║
+# ╚══════════════════════════════════════════════════════════════════╝
+def timed(fn: Callable, queries: np.ndarray, repeat: int) -> tuple[dict, list]:
+    """Per-query latency summary (ms) and the last result of every query."""
+    latencies, results = [], []
+    for q in queries:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            out = fn(q)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        results.append(out)
+    return summarize(latencies), results
+
+def recall(found: list, truth: list, k: int) -> float:
+    return float(np.mean([len(set(f[:k]) & set(t[:k])) / min(k, len(t)) for f, t in zip(found, truth)]))
+
+def evaluate(store: QuantizedStore, queries: np.ndarray, k: int, candidates: list[int],
+             repeat: int, chroma_exact: Optional[Callable]) -> dict:
+    k = min(k, len(store))
+    vectors = np.asarray(store.vectors)
+
+    def exact(q: np.ndarray) -> list[int]:
+        scores = vectors @ q
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        return [int(i) for i in top[np.argsort(-scores[top])]]
+
+    exact_latency, truth = timed(exact, queries, repeat)
+    rows = [{"method": "numpy exact", "candidates": None, "latency_ms": exact_latency,
+             "recall": 1.0}]
+    if chroma_exact is not None:
+        latency, _ = timed(lambda q: chroma_exact(q, k), queries, repeat)
+        rows.insert(0, {"method": "chroma + cosine (search.py)", "candidates": None,
+                        "latency_ms": latency, "recall": None})
+
+    for mode in MODES:
+        for n in candidates:
+            latency, found = timed(
+                lambda q: [row for row, _ in store.search(q, k, mode, n)[0]], queries, repeat)
+            rows.append({"method": mode, "candidates": n, "latency_ms": latency,
+                         "recall": round(recall(found, truth, k), 4)})
+    return {"vectors": len(store), "dim": store.meta["dim"], "k": k,
+            "memory": store.memory(), "rows": rows}
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 3.  CLI                                                            ║
+# ╚══════════════════════════════════════════════════════════════════╝
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall/latency of the quantized vector store.")
+    parser.add_argument("--db", type=Path, default=ROOT / "chroma_db")
+    parser.add_argument("--synthetic", type=int, metavar="N",
+                        help="use N random clustered vectors instead of the office index")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic vector size")
+    parser.add_argument("--questions", type=int, default=200, help="synthetic queries")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--candidates", type=int, nargs="+",
+                        help="first-pass sizes to try (default k × 1, 4, 8, 16)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per query")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    candidates = args.candidates or [args.k * f for f in (1, 4, 8, 16)]
+
+    with tempfile.TemporaryDirectory(prefix="quant-") as tmp:
+        if args.synthetic:
+            store, queries = synthetic_store(args.synthetic, args.dim, args.questions, Path(tmp))
+            chroma_exact = None
+        else:
+            store, queries, chroma_exact = office_store(args.db)
+        report = evaluate(store, queries, args.k, candidates, args.repeat, chroma_exact)
+        del store                                          # release the memmaps
+
+    mem = report["memory"]
+    print(f"\n{report['vectors']} vectors × {report['dim']} dims, {len(queries)} queries, "
+          f"k={report['k']}")
+    print(f"first-pass bytes: float32 {mem['float32']:,}  int8 {mem['int8']:,} "
+          f"({mem['int8_ratio']}× smaller)  binary {mem['binary']:,} ({mem['binary_ratio']}× smaller)\n")
+    print(f"{'method':<30} {'cand':>6} {'p50 ms':>9} {'p95 ms':>9} {'recall@' + str(report['k']):>9}")
+    for row in report["rows"]:
+        lat = row["latency_ms"]
+        rec = "-" if row["recall"] is None else f"{row['recall']:.2%}"
+        print(f"{row['method']:<30} {row['candidates'] or '-':>6} {lat['p50']:>9.3f} "
+              f"{lat['p95']:>9.3f} {rec:>9}")
+
+    output = args.output or RESULTS_DIR / f"quantization-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "meta": {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                 "corpus": f"synthetic:{args.synthetic}" if args.synthetic else str(args.db),
+                 "repeat": args.repeat},
+        **report,
+    }, indent=2), encoding="utf-8")
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+────────────────────────────────────────────────────────────────────
+Hermetic end-to-end latency benchmark for the demos.
+
+Starts the local upstream stubs (benchmarks/stubs.py), points every
+script at them through environment variables, and drives
+
+    code/local.py   code/agent.py   code/rag.py     (REPLs, via stdin)
+    extra/mcp_agent.py                              (REPL, via stdin)
+    extra/mcp_server.py                             (FastMCP client calls)
+
+through the prompts in benchmarks/scenarios.json.  For every prompt the
+wall time from sending it to the next input prompt is the end-to-end
+latency; the stub's request log splits it into stages:
+
+    llm / nominatim / open_meteo   wall time spent waiting on that upstream
+    local                          everything else (embedding, vector search,
+                                   parsing, printing, process overhead)
+
+p50 / p95 / p99 per stage and end to end are printed and written as JSON
+(default benchmarks/results/<timestamp>.json).  Pass `--baseline FILE`
+to compare against an earlier result; any percentile that got slower by
+more than `--tolerance` makes the run exit with status 1.
+
+Examples
+--------
+    python benchmarks/run.py                               # everything
+    python benchmarks/run.py --targets local agent --repeat 5
+    python benchmarks/run.py --llm-ttft 1.0 --baseline benchmarks/baseline.json
+    python benchmarks/run.py --trace       # + per-span timings from code/tracing.py
+
+Notes
+-----
+* rag.py still loads the real sentence-transformers model and builds the
+  Chroma index on first start; that time shows up as `startup_s`.
+* Each script gets a fresh geocode cache and no on-disk LLM cache, so
+  runs are comparable; in-process caches warm up across prompts just as
+  they would in an interactive session.
+────────────────────────────────────────────────────────────────────
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import select
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from stubs import StubConfig, StubServer
+
+ROOT = Path(__file__).resolve().parent.parent
+SCENARIOS = Path(__file__).resolve().parent / "scenarios.json"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+PROMPT_TIMEOUT = 120.0      # seconds per prompt
+STARTUP_TIMEOUT = 600.0     # first start of rag.py may build the index
+SERVICES = ("llm", "nominatim", "open_meteo")
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 1.  Targets                                                        ║
+# ╚══════════════════════════════════════════════════════════════════╝
+# name → (script, working dir, input prompt the REPL prints when idle)
+REPL_TARGETS = {
+    "local":     ("code/local.py",      "code", "User: "),
+    "agent":     ("code/agent.py",      "code", "User: "),
+    "rag":       ("code/rag.py",        "code", "User: "),
+    "mcp_agent": ("extra/mcp_agent.py", ".",    "Ask about the weather: "),
+}
+ALL_TARGETS = [*REPL_TARGETS, "mcp_server"]
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 2.  Statistics                                                     ║
+# ╚══════════════════════════════════════════════════════════════════╝
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Linear-interpolated percentile of an already sorted list (q in 0-100)."""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    pos = (len(sorted_values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+def summarize(samples: list[float]) -> dict:
+    """n / mean / p50 / p95 / p99 / max in seconds."""
+    if not samples:
+        return {"n": 0}
+    values = sorted(samples)
+    return {
+        "n":    len(values),
+        "mean": round(sum(values) / len(values), 6),
+        "p50":  round(percentile(values, 50), 6),
+        "p95":  round(percentile(values, 95), 6),
+        "p99":  round(percentile(values, 99), 6),
+        "max":  round(values[-1], 6),
+    }
+
+def busy_time(intervals: list[tuple[float, float]]) -> float:
+    """Length of the union of (start, end) intervals (overlapping calls count once)."""
+    total, cur_start, cur_end = 0.0, None, None
+    for start, end in sorted(intervals):
+        if cur_end is None or start > cur_end:
+            if cur_end is not None:
+                total += cur_end - cur_start
+            cur_start, cur_end = start, end
+        else:
+            cur_end = max(cur_end, end)
+    if cur_end is not None:
+        total += cur_end - cur_start
+    return total
+
+def stage_breakdown(server: StubServer, windows: list[tuple[float, float]]) -> tuple[dict, dict, dict]:
+    """
+    Split each (start, end) window into upstream stages and local time.
+
+    Returns ``(stage samples, call counts, end-to-end samples)``.  Events
+    are read after the run so that log entries written just after a
+    response was sent are not missed.
+    """
+    stages = {name: [] for name in (*SERVICES, "local")}
+    calls = {name: 0 for name in SERVICES}
+    totals = []
+    for start, end in windows:
+        events = server.log.between(start, end)
+        for name in SERVICES:
+            spans = [(e.start, min(e.end, end)) for e in events if e.service == name]
+            stages[name].append(busy_time(spans))
+            calls[name] += len(spans)
+        upstream = busy_time([(e.start, min(e.end, end)) for e in events])
+        stages["local"].append(max(0.0, (end - start) - upstream))
+        totals.append(end - start)
+    return stages, calls, totals
+
+def report(server: StubServer, windows: list, errors: int, startup: Optional[float]) -> dict:
+    stages, calls, totals = stage_breakdown(server, windows)
+    return {
+        "startup_s":  round(startup, 3) if startup is not None else None,
+        "errors":     errors,
+        "end_to_end": summarize(totals),
+        "stages":     {name: summarize(s) for name, s in stages.items()},
+        "calls":      calls,
+    }
+
+def span_summary(trace_path: Path) -> dict:
+    """Durations (seconds) per span name from a TRACE=<file> JSON-lines export."""
+    if not trace_path.exists():
+        return {}
+    durations: dict[str, list[float]] = {}
+    with open(trace_path, encoding="utf-8") as fh:
+        for line in fh:
+            record = json.loads(line)
+            durations.setdefault(record["name"], []).append(record["duration_ms"] / 1000)
+    return {name: summarize(values) for name, values in sorted(durations.items())}
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 3.  Driving the REPL scripts                                       ║
+# ╚══════════════════════════════════════════════════════════════════╝
+class ReplDriver:
+    """Run a script with pipes and talk to it one prompt at a time."""
+
+    def __init__(self, argv: list[str], cwd: Path, env: dict, marker: str, log_path: Path) -> None:
+        self.marker = marker.encode("utf-8")
+        self.log_path = log_path
+        self._log = open(log_path, "wb")
+        self._buf = b""
+        self.proc = subprocess.Popen(argv, cwd=cwd, env=env, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, stderr=self._log)
+
+    def read_until_prompt(self, timeout: float) -> str:
+        """Output up to the next input prompt; raises on timeout or exit."""
+        fd = self.proc.stdout.fileno()
+        deadline = time.monotonic() + timeout
+        while self.marker not in self._buf:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"no prompt within {timeout:g}s")
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if ready:
+                data = os.read(fd, 65536)
+                if not data:
+                    raise RuntimeError(f"exited with status {self.proc.wait()}: {self.stderr_tail()}")
+                self._buf += data
+        out, _, self._buf = self._buf.partition(self.marker)
+        return out.decode("utf-8", errors="replace")
+
+    def send(self, line: str) -> None:
+        self.proc.stdin.write(line.encode("utf-8") + b"\n")
+        self.proc.stdin.flush()
+
+    def stderr_tail(self, lines: int = 5) -> str:
+        self._log.flush()
+        tail = self.log_path.read_text(errors="replace").strip().splitlines()[-lines:]
+        return " | ".join(tail)
+
+    def close(self) -> None:
+        try:
+            if self.proc.poll() is None:
+                self.send("exit")
+                self.proc.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self._log.close()
+
+def run_repl_target(name: str, prompts: list[str], repeat: int, server: StubServer,
+                    env: dict, workdir: Path) -> dict:
+    script, cwd, marker = REPL_TARGETS[name]
+    driver = ReplDriver([sys.executable, str(ROOT / script)], ROOT / cwd, env,
+                        marker, workdir / f"{name}.stderr.log")
+    windows, errors, startup = [], 0, None
+    try:
+        started = time.perf_counter()
+        driver.read_until_prompt(STARTUP_TIMEOUT)
+        startup = time.perf_counter() - started
+
+        for prompt in prompts * repeat:
+            t0 = time.perf_counter()
+            driver.send(prompt)
+            try:
+                driver.read_until_prompt(PROMPT_TIMEOUT)
+            except TimeoutError as e:
+                print(f"  [{name}] {prompt!r}: {e}", file=sys.stderr)
+                errors += 1
+                break
+            windows.append((t0, time.perf_counter()))
+    except RuntimeError as e:
+        print(f"  [{name}] {e}", file=sys.stderr)
+        errors += 1
+    finally:
+        driver.close()
+    return report(server, windows, errors, startup)
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 4.  Driving the MCP server directly                                ║
+# ╚══════════════════════════════════════════════════════════════════╝
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for_port(port: int, proc: subprocess.Popen, timeout: float = 60.0) -> float:
+    """Seconds until something accepts connections on `port`."""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"MCP server exited with status {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return time.perf_counter() - started
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"MCP server not listening on {port} after {timeout:g}s")
+
+class MCPServerProcess:
+    """extra/mcp_server.py on a free port, wired to the Open-Meteo stub."""
+
+    def __init__(self, env: dict, workdir: Path) -> None:
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}/mcp/"
+        self._log = open(workdir / "mcp_server.stderr.log", "wb")
+        self.proc = subprocess.Popen(
+            [sys.executable, str(ROOT / "extra" / "mcp_server.py")], cwd=ROOT,
+            env={**env, "MCP_PORT": str(self.port)},
+            stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        self.startup = wait_for_port(self.port, self.proc)
+
+    def close(self) -> None:
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self._log.close()
+
+async def drive_mcp_server(url: str, points: list, burst: int) -> tuple[dict, int]:
+    """
+    Time single calls (cold cache, then warm), a concurrent burst of
+    distinct points, and one get_weather_many over a fresh batch.
+    """
+    from fastmcp import Client
+
+    ops: dict[str, list[tuple[float, float]]] = {
+        "get_weather_cold": [], "get_weather_warm": [],
+        "get_weather_burst": [], "get_weather_many": [],
+    }
+    errors = 0
+
+    async def timed(op: str, tool: str, args: dict) -> None:
+        nonlocal errors
+        t0 = time.perf_counter()
+        try:
+            await mcp.call_tool(tool, args)
+        except Exception:
+            errors += 1
+            return
+        ops[op].append((t0, time.perf_counter()))
+
+    async with Client(url) as mcp:
+        for lat, lon in points:
+            await timed("get_weather_cold", "get_weather", {"lat": lat, "lon": lon})
+        for lat, lon in points:
+            await timed("get_weather_warm", "get_weather", {"lat": lat, "lon": lon})
+        # shifted by whole degrees so none of these hit the cache
+        await asyncio.gather(*(
+            timed("get_weather_burst", "get_weather",
+                  {"lat": (i % 150) - 75.0 + 0.5, "lon": (i * 7 % 340) - 170.0 + 0.5})
+            for i in range(burst)))
+        many = [{"lat": lat + 1.0, "lon": lon + 1.0} for lat, lon in points]
+        await timed("get_weather_many", "get_weather_many", {"points": many})
+    return ops, errors
+
+def run_mcp_server_target(spec: dict, repeat: int, server: StubServer, env: dict,
+                          workdir: Path) -> dict:
+    proc = MCPServerProcess(env, workdir)
+    try:
+        ops, errors = asyncio.run(drive_mcp_server(proc.url, spec["points"] * repeat,
+                                                   spec.get("burst", 50)))
+    finally:
+        proc.close()
+    result = report(server, [w for windows in ops.values() for w in windows], errors, proc.startup)
+    result["operations"] = {op: report(server, windows, 0, None) for op, windows in ops.items()}
+    for op in result["operations"].values():
+        del op["startup_s"], op["errors"]
+    return result
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 5.  Regression check against a stored result                       ║
+# ╚══════════════════════════════════════════════════════════════════╝
+def percentile_paths(node, path=()):
+    """Yield (path, value) for every p50/p95/p99 number in a result tree."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in ("p50", "p95", "p99") and isinstance(value, (int, float)):
+                yield path + (key,), value
+            else:
+                yield from percentile_paths(value, path + (key,))
+
+def compare(current: dict, baseline: dict, tolerance: float, min_delta: float) -> list[str]:
+    """Human-readable lines for every percentile that regressed."""
+    base = dict(percentile_paths(baseline.get("targets", {})))
+    regressions = []
+    for path, value in percentile_paths(current.get("targets", {})):
+        old = base.get(path)
+        if old is None:
+            continue
+        if value > old * (1 + tolerance) and value - old > min_delta:
+            regressions.append(f"{'.'.join(path)}: {old * 1000:.1f} ms → {value * 1000:.1f} ms "
+                               f"(+{(value / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return regressions
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 6.  CLI                                                            ║
+# ╚══════════════════════════════════════════════════════════════════╝
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_table(targets: dict) -> None:
+    def ms(summary: dict, key: str) -> str:
+        return f"{summary[key] * 1000:8.1f}" if summary.get("n") else "       -"
+
+    print(f"\n{'target':<12}{'n':>4}{'p50':>9}{'p95':>9}{'p99':>9}   "
+          + "".join(f"{s + ' p50':>15}" for s in (*SERVICES, "local")))
+    for name, result in targets.items():
+        e2e = result["end_to_end"]
+        print(f"{name:<12}{e2e.get('n', 0):>4} {ms(e2e, 'p50')} {ms(e2e, 'p95')} {ms(e2e, 'p99')}   "
+              + "".join(f"{ms(result['stages'][s], 'p50'):>15}" for s in (*SERVICES, "local")))
+    print("(milliseconds)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=ALL_TARGETS, default=ALL_TARGETS)
+    parser.add_argument("--repeat", type=int, default=3, help="passes over each prompt list")
+    parser.add_argument("--scenarios", type=Path, default=SCENARIOS)
+    parser.add_argument("--trace", action="store_true",
+                        help="run the scripts with TRACE on and add per-span timings")
+    parser.add_argument("--output", type=Path, help="result file (default: results/<timestamp>.json)")
+    parser.add_argument("--baseline", type=Path, help="earlier result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="allowed slowdown (0.20 = 20%%)")
+    parser.add_argument("--min-delta", type=float, default=0.010,
+                        help="ignore regressions smaller than this many seconds")
+    for field, default in asdict(StubConfig()).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default,
+                            help=f"stub setting (default {default})")
+    args = parser.parse_args()
+
+    config = StubConfig(**{f: getattr(args, f) for f in asdict(StubConfig())})
+    scenarios = json.loads(args.scenarios.read_text(encoding="utf-8"))
+    server = StubServer(config).start()
+    workdir = Path(tempfile.mkdtemp(prefix="bench-"))
+
+    env = {**os.environ, **server.env(),
+           "PYTHONUNBUFFERED": "1",
+           "GEOCODE_CACHE": str(workdir / "geocode.sqlite"),
+           "LLM_CACHE_DISK": "0"}
+
+    targets = {}
+    mcp = None
+    try:
+        if "mcp_agent" in args.targets:
+            mcp = MCPServerProcess(env, workdir)
+            env["MCP_URL"] = mcp.url
+        for name in args.targets:
+            print(f"→ {name}", flush=True)
+            trace_path = workdir / f"{name}.trace.jsonl"
+            target_env = {**env, "TRACE": str(trace_path)} if args.trace else env
+            if name == "mcp_server":
+                targets[name] = run_mcp_server_target(scenarios[name], args.repeat,
+                                                      server, target_env, workdir)
+            else:
+                targets[name] = run_repl_target(name, scenarios[name], args.repeat,
+                                                server, target_env, workdir)
+            if args.trace:
+                targets[name]["spans"] = span_summary(trace_path)
+    finally:
+        if mcp is not None:
+            mcp.close()
+        server.shutdown()
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git":       git_revision(),
+            "python":    platform.python_version(),
+            "platform":  platform.platform(),
+            "repeat":    args.repeat,
+            "stubs":     asdict(config),
+            "logs":      str(workdir),
+        },
+        "targets": targets,
+    }
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+    print_table(targets)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        regressions = compare(result, json.loads(args.baseline.read_text(encoding="utf-8")),
+                              args.tolerance, args.min_delta)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) vs {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions vs {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+────────────────────────────────────────────────────────────────────
+Local stand-ins for every upstream service the demos talk to, so the
+benchmarks run without Ollama or the public internet.
+
+One threaded HTTP server answers:
+
+    POST /v1/chat/completions   OpenAI-compatible chat (Ollama's /v1 API),
+                                plain or SSE-streamed, with canned tool calls
+    POST /api/chat              Ollama native chat (used by ChatOllama)
+    GET  /search                Nominatim geocoder
+    GET  /v1/forecast           Open-Meteo current weather (multi-location)
+
+Replies are deterministic: cities are spotted with the repo's own
+gazetteer (code/city_extractor.py) and weather / coordinates are derived
+from the query, so every run sees the same answers.  Latency is
+configurable per service (`StubConfig`), and every request is recorded
+as an event (service, start, end, first byte) that the benchmark driver
+attributes to the prompt being measured.
+
+Point the demos at it with
+
+    OLLAMA_BASE_URL=http://127.0.0.1:PORT/v1   (code/*.py, OpenAI client)
+    OLLAMA_HOST=http://127.0.0.1:PORT          (extra/mcp_agent.py, ChatOllama)
+    NOMINATIM_URL=http://127.0.0.1:PORT/search
+    OPEN_METEO_URL=http://127.0.0.1:PORT/v1/forecast
+
+or run it standalone:  python benchmarks/stubs.py --port 11500
+────────────────────────────────────────────────────────────────────
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "code"))
+from city_extractor import CityExtractor
+from gazetteer import get_gazetteer
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 1.  Configuration and request log                                  ║
+# ╚══════════════════════════════════════════════════════════════════╝
+@dataclass
+class StubConfig:
+    """Simulated upstream behaviour (all times in seconds)."""
+    llm_ttft: float = 0.25          # prompt processing before the first token
+    llm_token_delay: float = 0.01   # per streamed token after that
+    geocode_latency: float = 0.08
+    weather_latency: float = 0.08
+    error_rate: float = 0.0         # share of geocode/weather calls answered 503
+    seed: int = 0
+
+@dataclass
+class Event:
+    service: str                    # "llm" | "nominatim" | "open_meteo"
+    route: str
+    start: float                    # time.perf_counter() on this host
+    end: float
+    first_byte: Optional[float] = None
+    status: int = 200
+
+class EventLog:
+    """Thread-safe list of served requests; `between()` slices by start time."""
+
+    def __init__(self) -> None:
+        self._events: list[Event] = []
+        self._lock = threading.Lock()
+
+    def add(self, event: Event) -> None:
+        with self._lock:
+            self._events.append(event)
+
+    def between(self, start: float, end: float) -> list[Event]:
+        with self._lock:
+            return [e for e in self._events if start <= e.start < end]
+
+    def all(self) -> list[Event]:
+        with self._lock:
+            return list(self._events)
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 2.  Canned answers                                                 ║
+# ╚══════════════════════════════════════════════════════════════════╝
+_extractor = CityExtractor()        # private counters, not the demos' shared one
+ARGS_C_RE = re.compile(r"Observation:\s*(-?[\d.]+)")
+PROPER_NOUN_RE = re.compile(r"(?<!^)(?<![.!?] )\b[A-Z][\w'-]+(?: [A-Z][\w'-]+)*")
+
+def find_city(text: str) -> Optional[str]:
+    found = _extractor.find_all(text or "")
+    return found[0] if found else None
+
+def find_places(text: str) -> list[str]:
+    """Known cities, else capitalised words mid-sentence ('Tell me about Boise')."""
+    return _extractor.find_all(text) or PROPER_NOUN_RE.findall(text)
+
+def fake_coords(query: str) -> tuple[float, float]:
+    """Gazetteer coordinates, else a stable pseudo-random point for the text."""
+    coords = get_gazetteer().lookup(query)
+    if coords is not None:
+        return coords
+    digest = hashlib.sha1(query.lower().encode("utf-8")).digest()
+    lat = int.from_bytes(digest[:4], "big") / 2**32 * 120 - 60
+    lon = int.from_bytes(digest[4:8], "big") / 2**32 * 360 - 180
+    return round(lat, 4), round(lon, 4)
+
+def fake_weather(lat: float, lon: float) -> dict:
+    seed = int(abs(lat * 1000) + abs(lon * 1000))
+    return {
+        "temperature": round(-5 + (seed % 350) / 10, 1),
+        "windspeed": round((seed % 200) / 10, 1),
+        "winddirection": seed % 360,
+        "weathercode": [0, 1, 2, 3, 45, 61, 63, 71, 80, 95][seed % 10],
+        "is_day": 1,
+        "time": "2026-01-01T12:00",
+    }
+
+def facts_reply(city: Optional[str]) -> str:
+    place = city or "this place"
+    return "\n".join(f"- Fact {i} about {place}: a canned benchmark answer." for i in (1, 2, 3))
+
+def last_user_text(messages: list[dict]) -> str:
+    for m in reversed(messages):
+        if m.get("role") == "user":
+            return m.get("content") or ""
+    return ""
+
+def system_text(messages: list[dict]) -> str:
+    return " ".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+
+def openai_reply(body: dict) -> dict:
+    """Assistant message for /v1/chat/completions: text or tool calls."""
+    messages = body.get("messages", [])
+    user = last_user_text(messages)
+    places = find_places(user)
+    city = places[0] if places else None
+    has_tool_results = any(m.get("role") == "tool" for m in messages)
+
+    if body.get("tools") and not has_tool_results and places:
+        return {"role": "assistant", "content": None, "tool_calls": [
+            {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+             "function": {"name": "calculate_distance_tool",
+                          "arguments": json.dumps({"destination_query": c})}}
+            for c in places
+        ]}
+    if "Only reply with the city name" in system_text(messages):
+        return {"role": "assistant", "content": city or "Unknown"}
+    return {"role": "assistant", "content": facts_reply(city)}
+
+def ollama_reply(body: dict) -> str:
+    """Assistant text for /api/chat (mcp_agent's extractor and TAO planner)."""
+    messages = body.get("messages", [])
+    user = last_user_text(messages)
+    if "Return ONLY the city name" in user:
+        return find_city(user) or "NONE"
+    if "emit exactly three lines" in system_text(messages):
+        observed = ARGS_C_RE.search(user)
+        if observed:
+            return ("Thought: convert the temperature.\nAction: convert_c_to_f\n"
+                    f"Args: {{\"c\": {observed.group(1)}}}")
+        city = find_city(" ".join(m.get("content") or "" for m in messages)) or user
+        lat, lon = fake_coords(city)
+        return ("Thought: I need the weather.\nAction: get_weather\n"
+                f"Args: {{\"lat\": {lat}, \"lon\": {lon}}}")
+    return facts_reply(find_city(user))
+
+def tokens(text: str) -> list[str]:
+    """Split into word-ish pieces so streaming looks like a real model."""
+    return re.findall(r"\S+\s*|\s+", text) or [""]
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 3.  HTTP handler                                                   ║
+# ╚══════════════════════════════════════════════════════════════════╝
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StubServer"
+
+    def log_message(self, *args) -> None:      # keep benchmark output clean
+        pass
+
+    # -- plumbing ----------------------------------------------------
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status: int, payload) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_chunked(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_chunked(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _record(self, service: str, start: float, first_byte=None, status=200) -> None:
+        self.server.log.add(Event(service, urlparse(self.path).path, start,
+                                  time.perf_counter(), first_byte, status))
+
+    def _fails(self) -> bool:
+        cfg = self.server.config
+        return cfg.error_rate > 0 and self.server.rng.random() < cfg.error_rate
+
+    # -- routes ------------------------------------------------------
+    def do_GET(self) -> None:
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        cfg = self.server.config
+
+        if url.path == "/search":
+            time.sleep(cfg.geocode_latency)
+            if self._fails():
+                self._send_json(503, {"error": "stub: injected failure"})
+                return self._record("nominatim", start, status=503)
+            q = query.get("q", "")
+            hits = [] if "nowhere" in q.lower() else [
+                dict(zip(("lat", "lon"), map(str, fake_coords(q))), display_name=q)]
+            self._send_json(200, hits)
+            return self._record("nominatim", start)
+
+        if url.path == "/v1/forecast":
+            time.sleep(cfg.weather_latency)
+            if self._fails():
+                self._send_json(503, {"error": "stub: injected failure"})
+                return self._record("open_meteo", start, status=503)
+            lats = [float(x) for x in query.get("latitude", "0").split(",")]
+            lons = [float(x) for x in query.get("longitude", "0").split(",")]
+            items = [{"latitude": la, "longitude": lo, "current_weather": fake_weather(la, lo)}
+                     for la, lo in zip(lats, lons)]
+            self._send_json(200, items if len(items) > 1 else items[0])
+            return self._record("open_meteo", start)
+
+        self._send_json(404, {"error": f"no stub for GET {url.path}"})
+
+    def do_POST(self) -> None:
+        start = time.perf_counter()
+        path = urlparse(self.path).path
+        body = self._read_json()
+        if path == "/v1/chat/completions":
+            return self._openai_chat(body, start)
+        if path == "/api/chat":
+            return self._ollama_chat(body, start)
+        self._send_json(404, {"error": f"no stub for POST {path}"})
+
+    def _openai_chat(self, body: dict, start: float) -> None:
+        cfg = self.server.config
+        message = openai_reply(body)
+        model = body.get("model", "llama3.2")
+        cid = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        finish = "tool_calls" if message.get("tool_calls") else "stop"
+        time.sleep(cfg.llm_ttft)
+
+        if not body.get("stream"):
+            if message.get("content"):
+                time.sleep(cfg.llm_token_delay * len(tokens(message["content"])))
+            self._send_json(200, {
+                "id": cid, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+            return self._record("llm", start)
+
+        def sse(delta: dict, finish_reason=None) -> None:
+            chunk = {"id": cid, "object": "chat.completion.chunk", "created": created,
+                     "model": model, "choices": [{"index": 0, "delta": delta,
+                                                  "finish_reason": finish_reason}]}
+            self._chunk(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+
+        self._start_chunked("text/event-stream")
+        first = time.perf_counter()
+        if message.get("tool_calls"):
+            sse({"role": "assistant", "tool_calls": [
+                {"index": i, **call} for i, call in enumerate(message["tool_calls"])]})
+        else:
+            for i, piece in enumerate(tokens(message["content"])):
+                if i:
+                    time.sleep(cfg.llm_token_delay)
+                sse({"role": "assistant", "content": piece} if i == 0 else {"content": piece})
+        sse({}, finish)
+        self._chunk(b"data: [DONE]\n\n")
+        self._end_chunked()
+        self._record("llm", start, first)
+
+    def _ollama_chat(self, body: dict, start: float) -> None:
+        cfg = self.server.config
+        text = ollama_reply(body)
+        model = body.get("model", "llama3.2")
+        time.sleep(cfg.llm_ttft)
+        pieces = tokens(text)
+        done = {"model": model, "created_at": "2026-01-01T00:00:00Z", "done": True,
+                "done_reason": "stop", "total_duration": 0, "load_duration": 0,
+                "prompt_eval_count": 0, "prompt_eval_duration": 0,
+                "eval_count": len(pieces), "eval_duration": 0}
+
+        if body.get("stream") is False:
+            time.sleep(cfg.llm_token_delay * len(pieces))
+            self._send_json(200, {**done, "message": {"role": "assistant", "content": text}})
+            return self._record("llm", start)
+
+        self._start_chunked("application/x-ndjson")
+        first = time.perf_counter()
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(cfg.llm_token_delay)
+            line = {"model": model, "created_at": done["created_at"], "done": False,
+                    "message": {"role": "assistant", "content": piece}}
+            self._chunk(json.dumps(line).encode("utf-8") + b"\n")
+        self._chunk(json.dumps({**done, "message": {"role": "assistant", "content": ""}})
+                    .encode("utf-8") + b"\n")
+        self._end_chunked()
+        self._record("llm", start, first)
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 4.  Server lifecycle                                               ║
+# ╚══════════════════════════════════════════════════════════════════╝
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__((host, port), StubHandler)
+        self.config = config
+        self.log = EventLog()
+        self.rng = random.Random(config.seed)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> dict[str, str]:
+        """Environment variables that point every demo at this server."""
+        return {
+            "OLLAMA_BASE_URL": f"{self.base_url}/v1",
+            "OLLAMA_HOST":     self.base_url,
+            "NOMINATIM_URL":   f"{self.base_url}/search",
+            "OPEN_METEO_URL":  f"{self.base_url}/v1/forecast",
+        }
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self.serve_forever, name="stubs", daemon=True).start()
+        return self
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the upstream stubs standalone.")
+    parser.add_argument("--port", type=int, default=11500)
+    for field, default in asdict(StubConfig()).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+
+    config = StubConfig(**{f: getattr(args, f) for f in asdict(StubConfig())})
+    server = StubServer(config, port=args.port)
+    for key, value in server.env().items():
+        print(f"export {key}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,20 @@
 # Import necessary libraries
 
+import os
 import json
-import requests
-import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from openai import OpenAI
 
+# Shared, cached geocoder (memory LRU + on-disk SQLite, see geocoding.py)
+from geocoding import geocode_location
+# Token streaming (STREAM=0 to wait for the whole reply, see streaming.py)
+from streaming import STREAM, ChatStream, BulletPrinter, write_raw, summary as streaming_summary
+from distance import haversine_distance, distances_from
+# Spans for each query, LLM call and tool call (TRACE=1 to record, see tracing.py)
+import tracing
+
 # ANSI color codes for terminal output
 BLUE = "\033[94m"
 GREEN = "\033[92m"
@@ -15,10 +25,15 @@ BOLD = "\033[1m"
 
 # Connect to local Ollama server (running Llama3.2 model)
 client = OpenAI(
-    base_url='http://localhost:11434/v1',
+    base_url=os.environ.get("OLLAMA_BASE_URL", 'http://localhost:11434/v1'),
     api_key='ollama',  # dummy key (Ollama ignores it)
 )
 
+# Tool dispatch limits (override with environment variables)
+MAX_TOOL_WORKERS = int(os.environ.get("MAX_TOOL_WORKERS", 4))   # tool calls run at once
+TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", 20))        # seconds per tool call, once running
+TOOL_QUEUE_TIMEOUT = float(os.environ.get("TOOL_QUEUE_TIMEOUT", TOOL_TIMEOUT))  # seconds waiting for a worker
+
 # Set hardcoded current location (Raleigh, NC)
 CURRENT_LAT = 35.7796
 CURRENT_LON = -78.6382
@@ -51,6 +66,21 @@ travel_tools = [
             },
             "strict": True,
         },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "calculate_distances_tool",
+            "description": "Calculate straight-line (haversine) distances in miles from Raleigh, NC to several destinations at once.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "destination_queries": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["destination_queries"],
+            },
+            "strict": True,
+        },
     }
 ]
 
@@ -61,24 +91,6 @@ def build_initial_messages(user_input):
         {"role": "user", "content": user_input}
     ]
 
-# Helper: Geocode destination using OpenStreetMap
-def geocode_location(location_query):
-    """Use OpenStreetMap Nominatim API to convert a city name into lat/lon."""
-    headers = {'User-Agent': 'SimpleAgent/1.0'}
-    geo = requests.get(f"https://nominatim.openstreetmap.org/search?q={location_query}&format=json", headers=headers).json()
-    if geo:
-        return float(geo[0]['lat']), float(geo[0]['lon'])
-    return None, None
-
-# Helper: Calculate straight-line distance (haversine formula)
-def haversine_distance(lat1, lon1, lat2, lon2):
-    R = 3958.8
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
 #  Tool: Find distance between Raleigh and user location
 def calculate_distance_tool(destination_query):
     """Helper function for calculating distance from Raleigh, NC."""
@@ -88,13 +100,73 @@ def calculate_distance_tool(destination_query):
     miles = haversine_distance(CURRENT_LAT, CURRENT_LON, lat2, lon2)
     return {"destination": destination_query, "distance_miles": round(miles, 2)}
 
+#  Tool: Distances from Raleigh to many destinations in one call
+def calculate_distances_tool(destination_queries):
+    """Geocode every destination, then compute all distances in one vectorised pass."""
+    distances = distances_from((CURRENT_LAT, CURRENT_LON), destination_queries, geocode_location)
+    return {"origin": "Raleigh, NC", "distances": distances}
+
+#  Tools the LLM may call, by name
+available_tools = {
+    "calculate_distance_tool": calculate_distance_tool,
+    "calculate_distances_tool": calculate_distances_tool,
+}
+
+# Shared worker pool so independent tool calls run concurrently;
+# a call that timed out still holds its worker until it returns
+tool_executor = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS, thread_name_prefix="tool")
+
+#  Run one tool, turning any failure into an error result for the LLM
+def run_tool(name, args):
+    tool = available_tools.get(name)
+    if tool is None:
+        return {"error": f"Unknown tool: {name}"}
+    with tracing.span(f"tool.{name}") as sp:
+        try:
+            return tool(**args)
+        except Exception as err:
+            sp.set(failed=True)
+            return {"error": f"{name} failed: {err}"}
+
+#  Queue one tool call; `started` is set (with the time) when a worker picks it up
+def submit_tool(name, args):
+    started = threading.Event()
+    started.queued = time.monotonic()
+    run = tracing.bind(run_tool)
+
+    def timed():
+        started.at = time.monotonic()
+        started.set()
+        return run(name, args)
+
+    return tool_executor.submit(timed), started
+
+#  Result of a submitted call, or an error once it has run for TOOL_TIMEOUT seconds.
+#  Waiting for a worker (behind other calls, or other prompts in batch mode) is
+#  limited separately by TOOL_QUEUE_TIMEOUT; a call that never started is
+#  cancelled.  A call that times out keeps running in its worker thread (Python
+#  cannot interrupt it); its result is simply dropped.
+def wait_tool(name, future, started):
+    if not started.wait(max(0.0, started.queued + TOOL_QUEUE_TIMEOUT - time.monotonic())):
+        if future.cancel():
+            return {"error": f"{name} did not start within {TOOL_QUEUE_TIMEOUT:g}s (all tool workers busy)"}
+        started.wait()               # a worker picked it up just now
+    try:
+        return future.result(timeout=max(0.0, started.at + TOOL_TIMEOUT - time.monotonic()))
+    except FutureTimeout:
+        return {"error": f"{name} timed out after {TOOL_TIMEOUT:g}s"}
+
 #  Ask LLM for initial action planning
 def get_initial_llm_response(messages):
-    return client.chat.completions.create(
-        model="llama3.2",
-        messages=messages,
-        tools=travel_tools,
-    )
+    with tracing.span("llm.plan", model="llama3.2") as sp:
+        completion = client.chat.completions.create(
+            model="llama3.2",
+            messages=messages,
+            tools=travel_tools,
+        )
+        sp.set(tool_calls=len(completion.choices[0].message.tool_calls or []),
+               **tracing.usage(completion))
+    return completion
 
 # Print the initial "thoughts" from the Assistant
 def print_assistant_thinking(completion):
@@ -105,14 +177,27 @@ def tool_call_required(completion):
     return bool(completion.choices[0].message.tool_calls)
 
 #  Handle tool execution and capture results
-def handle_tool_calls(completion, messages):
-    for tool_call in completion.choices[0].message.tool_calls:
+#  (all calls start at once; results are collected in the order the LLM asked)
+def handle_tool_calls(completion, messages, echo=True):
+    tool_calls = completion.choices[0].message.tool_calls
+    pending = []
+    for tool_call in tool_calls:
         name = tool_call.function.name
-        args = json.loads(tool_call.function.arguments)
-        print(f"{RED}{BOLD}Tool call: {name} with args: {args}{RESET}")
-
-        if name == "calculate_distance_tool":
-            result = calculate_distance_tool(**args)
+        try:
+            args = json.loads(tool_call.function.arguments)
+        except json.JSONDecodeError:
+            args = None
+        if echo:
+            print(f"{RED}{BOLD}Tool call: {name} with args: {args}{RESET}")
+        pending.append(None if args is None else submit_tool(name, args))
+
+    results = []
+    for tool_call, submitted in zip(tool_calls, pending):
+        if submitted is None:
+            result = {"error": "Invalid tool arguments."}
+        else:
+            result = wait_tool(tool_call.function.name, *submitted)
+        if echo:
             print(f"{RED}{BOLD}Tool call result: {result}{RESET}")
 
         messages.append({
@@ -120,14 +205,29 @@ def handle_tool_calls(completion, messages):
             "tool_call_id": tool_call.id,
             "content": json.dumps(result)
         })
-    return result
-
-#  After tool use, ask LLM for final answer
-def get_final_llm_response(messages):
-    return client.chat.completions.create(
-        model="llama3.2",
-        messages=messages,
-    )
+        results.append(result)
+    return results
+
+#  After tool use, ask LLM for final answer (a ChatStream when streaming)
+def get_final_llm_response(messages, stream=STREAM):
+    if stream:
+        return ChatStream(client, trace_name="llm.final", model="llama3.2", messages=messages)
+    with tracing.span("llm.final", model="llama3.2") as sp:
+        completion = client.chat.completions.create(
+            model="llama3.2",
+            messages=messages,
+        )
+        sp.set(**tracing.usage(completion))
+    return completion
+
+#  Bullet lines ("- fact" / "• fact") of a reply
+def parse_facts(raw_output):
+    facts = []
+    for line in (raw_output or "").split('\n'):
+        line = line.strip()
+        if line.startswith('-') or line.startswith('•'):
+            facts.append(line[1:].strip())
+    return facts
 
 # Format the assistant final user-facing answer
 def format_final_output(location_name, facts_list, distance_miles):
@@ -137,18 +237,38 @@ def format_final_output(location_name, facts_list, distance_miles):
     distance_section = f"{BOLD}{BLUE}\nDistance from Raleigh, NC: {RESET}{BLUE}{distance_miles} miles{RESET}"
     return f"{facts_section}{distance_section}"
 
+#  Streamed variant: bullets are formatted while the model is still typing
+def display_streamed_response(stream, tool_results):
+    tool_result = next((r for r in tool_results if "distance_miles" in r), None)
+    print(f"\n{GREEN}Assistant Final Response:{RESET}\n")
+    if tool_result is None:
+        stream.consume(write_raw())
+        print()
+        return
+
+    location_name = tool_result.get("destination", "Destination")
+    printer = BulletPrinter(
+        header=f"{BOLD}{BLUE}Facts about {location_name}:\n\n{RESET}",
+        prefix=f"{BLUE}\u2022 ",
+        suffix=f"\n{RESET}",
+    )
+    raw_output = stream.consume(printer.feed)
+    printer.close()
+    if printer.facts:
+        print(f"{BOLD}{BLUE}\nDistance from Raleigh, NC: {RESET}{BLUE}{tool_result.get('distance_miles')} miles{RESET}")
+    else:
+        print(raw_output)
+
 #  Final user-visible formatted output
-def display_final_response(final_completion, tool_result):
+def display_final_response(final_completion, tool_results):
+    if isinstance(final_completion, ChatStream):
+        display_streamed_response(final_completion, tool_results)
+        return
     raw_output = final_completion.choices[0].message.content
-    lines = raw_output.split('\n')
-    facts = []
+    facts = parse_facts(raw_output)
 
-    for line in lines:
-        line = line.strip()
-        if line.startswith('-') or line.startswith('•'):
-            facts.append(line[1:].strip())
-
-    if facts and "distance_miles" in tool_result:
+    tool_result = next((r for r in tool_results if "distance_miles" in r), None)
+    if facts and tool_result:
         final_output = format_final_output(tool_result.get("destination", "Destination"), facts, tool_result.get("distance_miles"))
         print(f"\n{GREEN}Assistant Final Response:{RESET}\n\n{final_output}")
     else:
@@ -158,34 +278,51 @@ def display_final_response(final_completion, tool_result):
 def display_direct_response(completion):
     print(f"\n{GREEN}Assistant Final Response:{RESET}\n{BLUE}{completion.choices[0].message.content}{RESET}")
 
-#  Main user interaction loop
-print("\nTravel Assistant ready! (Type 'exit' to quit)")
-
-while True:
-    #  User prompt
-    user_input = input("\nUser: ")
-    if user_input.lower() == "exit":
-        print("Goodbye!")
-        break
-
-    #  LLM plans tool call
-    messages = build_initial_messages(user_input)
-    completion = get_initial_llm_response(messages)
-    print_assistant_thinking(completion)
-
-    if tool_call_required(completion):
-        #  Tool runs
-        tool_result = handle_tool_calls(completion, messages)
-
-        #  Tool result added back into conversation
-        final_completion = get_final_llm_response(messages)
-
-        #  LLM reasons with tool output → ✨ Assistant final answer
-        display_final_response(final_completion, tool_result)
-    else:
-        display_direct_response(completion)
-
-
-
-
+#  One prompt, printed as it goes (the interactive flow)
+def handle_query(user_input):
+    with tracing.span("agent.query", prompt_chars=len(user_input)):
+        #  LLM plans tool call
+        messages = build_initial_messages(user_input)
+        completion = get_initial_llm_response(messages)
+        print_assistant_thinking(completion)
+
+        if tool_call_required(completion):
+            #  Tool runs
+            tool_results = handle_tool_calls(completion, messages)
+
+            #  Tool result added back into conversation
+            final_completion = get_final_llm_response(messages)
+
+            #  LLM reasons with tool output → ✨ Assistant final answer
+            display_final_response(final_completion, tool_results)
+        else:
+            display_direct_response(completion)
+
+#  One prompt, nothing printed: a JSON-serialisable result (used by batch.py)
+def answer_query(user_input):
+    with tracing.span("agent.query", prompt_chars=len(user_input), interactive=False):
+        messages = build_initial_messages(user_input)
+        completion = get_initial_llm_response(messages)
+        tool_results = []
+        if tool_call_required(completion):
+            tool_results = handle_tool_calls(completion, messages, echo=False)
+            completion = get_final_llm_response(messages, stream=False)
+        answer = completion.choices[0].message.content
+        return {"answer": answer, "facts": parse_facts(answer), "tool_results": tool_results}
 
+#  Main user interaction loop
+def main():
+    print("\nTravel Assistant ready! (Type 'exit' to quit)")
+
+    while True:
+        #  User prompt
+        user_input = input("\nUser: ")
+        if user_input.lower() == "exit":
+            if STREAM:
+                print(streaming_summary())
+            print("Goodbye!")
+            break
+        handle_query(user_input)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# Non-interactive batch runner for the travel assistants (agent.py, rag.py)
+#
+#     python batch.py agent prompts.jsonl -o answers.jsonl --concurrency 8
+#     cat prompts.jsonl | python batch.py rag - > answers.jsonl
+#
+# Input is JSON lines, one object per prompt with a "prompt" field (any
+# other fields, e.g. an "id", are copied to the output).  Prompts are
+# answered by the flow's answer_query() with at most --concurrency in
+# flight; the input is read lazily, so batches of thousands of prompts
+# never sit in memory at once.  Each output line is the input object plus
+# "ok", "seconds" and either "result" or "error", written as soon as it
+# is ready (so not necessarily in input order; "line" gives the position).
+# Status messages from loading the flow (opening or rebuilding the office
+# index) and a throughput summary at the end (plus the LLM cache hit
+# ratio for rag) go to stderr, so stdout carries nothing but result lines.
+
+import argparse
+import contextlib
+import json
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import tracing
+
+
+def read_prompts(fh):
+    """(line number, input object or error string) for every non-blank line."""
+    for number, raw in enumerate(fh, start=1):
+        if not raw.strip():
+            continue
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError as err:
+            yield number, f"invalid JSON: {err}"
+            continue
+        if not isinstance(item, dict) or not isinstance(item.get("prompt"), str):
+            yield number, 'expected an object with a string "prompt"'
+            continue
+        yield number, item
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q / 100))]
+
+
+class BatchStats:
+    """Counts and per-prompt latencies for the summary."""
+
+    def __init__(self):
+        self.ok = 0
+        self.failed = 0
+        self.latencies = []
+        self.started = time.perf_counter()
+
+    def add(self, record):
+        if record["ok"]:
+            self.ok += 1
+            self.latencies.append(record["seconds"])
+        else:
+            self.failed += 1
+
+    def summary(self):
+        wall = time.perf_counter() - self.started
+        done = self.ok + self.failed
+        latencies = sorted(self.latencies)
+        return {
+            "prompts": done,
+            "ok": self.ok,
+            "failed": self.failed,
+            "wall_seconds": round(wall, 3),
+            "prompts_per_second": round(done / wall, 3) if wall else None,
+            "p50_seconds": percentile(latencies, 50),
+            "p95_seconds": percentile(latencies, 95),
+        }
+
+
+def load_flow(name, concurrency):
+    """answer(prompt) -> dict for the chosen assistant, a shutdown hook and extra summary lines."""
+    if name == "agent":
+        import agent
+        return agent.answer_query, lambda: None, lambda: []
+
+    import rag
+    rag.open_index()
+    # every prompt runs up to three stages at once (city_facts, distance, office_facts)
+    stages = ThreadPoolExecutor(max_workers=concurrency * 3, thread_name_prefix="stage")
+    return ((lambda prompt: rag.answer_query(prompt, executor=stages)), stages.shutdown,
+            lambda: [rag.client.cache.summary()])
+
+
+def run_one(answer, number, item):
+    started = time.perf_counter()
+    record = {**item, "line": number}
+    try:
+        record["result"] = answer(item["prompt"])
+        record["ok"] = True
+    except Exception as err:
+        record["error"] = f"{type(err).__name__}: {err}"
+        record["ok"] = False
+    record["seconds"] = round(time.perf_counter() - started, 4)
+    return record
+
+
+def run_batch(answer, prompts, out, concurrency):
+    """Answer every prompt with at most `concurrency` in flight; return BatchStats."""
+    stats = BatchStats()
+    write_lock = threading.Lock()
+
+    def emit(record):
+        with write_lock:
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+        stats.add(record)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        running = set()
+        for number, item in prompts:
+            if isinstance(item, str):
+                emit({"line": number, "ok": False, "error": item, "seconds": 0.0})
+                continue
+            if len(running) >= concurrency:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    emit(future.result())
+            running.add(pool.submit(tracing.bind(run_one), answer, number, item))
+        for future in wait(running).done:
+            emit(future.result())
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer JSONL prompts with agent.py or rag.py.")
+    parser.add_argument("flow", choices=["agent", "rag"])
+    parser.add_argument("input", help="JSONL file of {\"prompt\": ...} objects, or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL results file (default: stdout)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4,
+                        help="prompts in flight at once (default 4)")
+    parser.add_argument("--trace", nargs="?", const="1", metavar="PATH",
+                        help="record spans (see tracing.py) to PATH or .cache/trace.jsonl")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.trace:
+        tracing.configure(args.trace)
+
+    # open_index()/index_pdfs() report progress with print(): keep it off stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        answer, shutdown, report = load_flow(args.flow, args.concurrency)
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        stats = run_batch(answer, read_prompts(src), out, args.concurrency)
+    finally:
+        shutdown()
+        if src is not sys.stdin:
+            src.close()
+        if out is not sys.stdout:
+            out.close()
+
+    s = stats.summary()
+    print(f"{s['prompts']} prompts ({s['ok']} ok, {s['failed']} failed) in {s['wall_seconds']:.1f}s"
+          f" = {s['prompts_per_second']:.2f} prompts/s with concurrency {args.concurrency}"
+          + (f"; latency p50 {s['p50_seconds']:.2f}s, p95 {s['p95_seconds']:.2f}s"
+             if s["p50_seconds"] is not None else ""),
+          file=sys.stderr)
+    for line in report():
+        print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Local city extractor: find gazetteer cities in free text without an LLM
+#
+# All city names and aliases from gazetteer.py are compiled into one
+# Aho-Corasick automaton, so a prompt is scanned once no matter how many
+# names there are.  Text and names are normalised the same way (case,
+# accents, punctuation -> spaces) and every pattern is padded with
+# spaces, so "New York," matches "new york" but "Parisian" does not
+# match "paris".  Overlapping hits resolve leftmost-longest
+# ("New York City" beats "York").
+#
+# extract() returns the city a prompt is about.  The assistants measure
+# distances from a hard-coded origin (Raleigh, NC), so in "From Raleigh,
+# how far is Tokyo?" the origin is only chosen if no other city is named.
+# It counts how often a prompt was resolved locally, so callers can
+# report what fraction never needed the model (stats()).
+
+import threading
+from collections import deque
+
+from gazetteer import get_gazetteer, normalize_name
+
+ORIGIN_CITY = "Raleigh"        # the assistants' current location (CURRENT_LAT/LON)
+
+
+class AhoCorasick:
+    """Character-level multi-pattern matcher (goto / fail / output tables)."""
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]                   # state -> [(pattern length, value)]
+        for pattern, value in patterns.items():
+            self._add(pattern, value)
+        self._build_failure_links()
+
+    def _add(self, pattern, value):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), value))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text):
+        """Yield (start, end, value) for every occurrence of every pattern."""
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, value in self._out[state]:
+                yield i + 1 - length, i + 1, value
+
+
+class CityExtractor:
+    """Find known cities in text; counts local hits vs. prompts left to the LLM."""
+
+    def __init__(self, gazetteer=None, origin=ORIGIN_CITY):
+        gazetteer = gazetteer or get_gazetteer()
+        self.origin = origin
+        self._automaton = AhoCorasick({f" {key} ": name for key, name in gazetteer.labels()})
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.misses = 0
+
+    def find_all(self, text):
+        """Cities mentioned in `text`, in order of appearance, without duplicates."""
+        padded = f" {normalize_name(text)} "
+        # shrink spans by the padding so adjacent names don't overlap
+        matches = sorted(((start + 1, end - 1, city)
+                          for start, end, city in self._automaton.iter_matches(padded)),
+                         key=lambda m: (m[0], -(m[1] - m[0])))
+        found, covered_to = [], -1
+        for start, end, city in matches:
+            if start < covered_to:
+                continue                     # inside a longer, earlier match
+            covered_to = end
+            if city not in found:
+                found.append(city)
+        return found
+
+    def extract(self, text):
+        """First city in `text` other than the origin, else the origin, else None (ask the LLM)."""
+        found = sorted(self.find_all(text), key=lambda city: city == self.origin)
+        with self._lock:
+            if found:
+                self.local_hits += 1
+            else:
+                self.misses += 1
+        return found[0] if found else None
+
+    def stats(self):
+        """How many prompts were resolved locally vs. left to the model."""
+        with self._lock:
+            total = self.local_hits + self.misses
+            return {
+                "prompts": total,
+                "resolved_locally": self.local_hits,
+                "needed_llm": self.misses,
+                "local_ratio": self.local_hits / total if total else 0.0,
+            }
+
+    def summary(self):
+        """One-line report for printing at exit."""
+        s = self.stats()
+        if not s["prompts"]:
+            return "City extraction: no prompts"
+        return (f"City extraction: {s['resolved_locally']}/{s['prompts']} prompts "
+                f"({s['local_ratio']:.0%}) resolved without the LLM")
+
+
+_default = None
+
+
+def get_extractor():
+    """Shared CityExtractor over the bundled gazetteer, built on first use."""
+    global _default
+    if _default is None:
+        _default = CityExtractor()
+    return _default
@@ -0,0 +1,62 @@
+# Vectorised great-circle (haversine) distances with NumPy
+#
+# haversine_matrix() takes N origins and M destinations as (lat, lon)
+# pairs in degrees and returns an (N, M) array of miles in one call, so
+# a trip with 50 destinations costs one array expression instead of 50
+# round trips through scalar math code.  distances_from() geocodes a list
+# of place names and measures them all from one origin in a single pass.
+
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def _as_lat_lon(points):
+    """(k, 2) float64 array in radians from a (lat, lon) pair or a sequence of pairs."""
+    arr = np.asarray(points, dtype=np.float64)
+    if arr.size == 0:
+        return arr.reshape(0, 2)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, 2)
+    if arr.ndim != 2 or arr.shape[1] != 2:
+        raise ValueError("expected (lat, lon) pairs")
+    return np.radians(arr)
+
+
+def haversine_matrix(origins, destinations, radius=EARTH_RADIUS_MILES):
+    """Distances (miles by default) from every origin to every destination, shape (N, M)."""
+    o = _as_lat_lon(origins)
+    d = _as_lat_lon(destinations)
+    lat1, lon1 = o[:, 0:1], o[:, 1:2]          # (N, 1) columns broadcast
+    lat2, lon2 = d[:, 0], d[:, 1]              # against (M,) rows
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    a = np.clip(a, 0.0, 1.0)                   # guard rounding at antipodes
+    return 2 * radius * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Single pair distance in miles (kept for the one-destination tool)."""
+    return float(haversine_matrix((lat1, lon1), (lat2, lon2))[0, 0])
+
+
+def distances_from(origin, destination_queries, geocode):
+    """
+    One result dict per query: distance in miles from `origin`, or an error.
+
+    `geocode(query)` returns (lat, lon), or (None, None) when the place is
+    unknown; every place found is measured in one vectorised pass.
+    """
+    found, results = [], []
+    for query in destination_queries:
+        lat, lon = geocode(query)
+        if lat is None or lon is None:
+            results.append({"destination": query, "error": "Could not find destination."})
+        else:
+            results.append({"destination": query})
+            found.append((len(results) - 1, (lat, lon)))
+    if found:
+        miles = haversine_matrix(origin, [pt for _, pt in found])[0]
+        for (pos, _), dist in zip(found, miles):
+            results[pos]["distance_miles"] = round(float(dist), 2)
+    return results
@@ -0,0 +1,124 @@
+# Offline gazetteer: city names, aliases and coordinates from data/cities.tsv
+#
+# The table is small, so it is loaded once into compact arrays:
+#   * coords   - (n, 2) float32 lat/lon, one row per city
+#   * _keys    - sorted normalised names + aliases, for exact and prefix
+#                lookup with bisect
+#   * _rows    - parallel list: which city rows each key points to
+#
+# geocoding.py asks lookup() first and only goes to the network on a miss;
+# city_extractor.py builds its free-text matcher from labels().
+
+import re
+import unicodedata
+from bisect import bisect_left
+from pathlib import Path
+
+import numpy as np
+
+DATA_PATH = Path(__file__).resolve().parent.parent / "data" / "cities.tsv"
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_name(text):
+    """Fold case and accents, turn punctuation into spaces: 'São Paulo,' -> 'sao paulo'."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", text.casefold()).strip()
+
+
+class Gazetteer:
+    """In-memory city table with exact, qualified ('Paris, France') and prefix lookup."""
+
+    def __init__(self, path=DATA_PATH):
+        self.names, self.regions, self.countries = [], [], []
+        lat_lon = []
+        by_key = {}
+
+        with open(path, encoding="utf-8") as fh:
+            for raw in fh:
+                if not raw.strip() or raw.startswith("#"):
+                    continue
+                cols = raw.rstrip("\n").split("\t") + [""] * 6
+                name, region, country, lat, lon, aliases = cols[:6]
+                row = len(self.names)
+                self.names.append(name)
+                self.regions.append(normalize_name(region))
+                self.countries.append(normalize_name(country))
+                lat_lon.append((float(lat), float(lon)))
+
+                for label in [name] + [a for a in aliases.split("|") if a]:
+                    key = normalize_name(label)
+                    rows = by_key.setdefault(key, [])
+                    if row not in rows:
+                        rows.append(row)
+
+        self.coords = np.asarray(lat_lon, dtype=np.float32).reshape(-1, 2)
+        self._keys = sorted(by_key)
+        self._rows = [by_key[k] for k in self._keys]
+
+    def __len__(self):
+        return len(self.names)
+
+    def _exact_rows(self, key):
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._rows[i]
+        return []
+
+    def lookup(self, query):
+        """
+        Coordinates for a place query, or None if not in the table.
+
+        'Portland' returns the first listed Portland; 'Portland, ME' only
+        matches a row whose region or country is ME (else None, so the
+        caller can fall back to the network).
+        """
+        parts = [normalize_name(p) for p in query.split(",")]
+        parts = [p for p in parts if p]
+        if not parts:
+            return None
+
+        rows = self._exact_rows(" ".join(parts))
+        if rows and len(parts) == 1:
+            return self._coords(rows[0])
+
+        qualifiers = set(parts[1:])
+        for row in self._exact_rows(parts[0]):
+            if self.regions[row] in qualifiers or self.countries[row] in qualifiers:
+                return self._coords(row)
+        return self._coords(rows[0]) if rows else None
+
+    def complete(self, prefix, limit=10):
+        """City names whose name or alias starts with `prefix` (for autocompletion)."""
+        key = normalize_name(prefix)
+        if not key:
+            return []
+        found = []
+        i = bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i].startswith(key) and len(found) < limit:
+            for row in self._rows[i]:
+                if self.names[row] not in found:
+                    found.append(self.names[row])
+            i += 1
+        return found[:limit]
+
+    def labels(self):
+        """(normalised name or alias, city name) pairs; an ambiguous label maps to its first city."""
+        return [(key, self.names[rows[0]]) for key, rows in zip(self._keys, self._rows)]
+
+    def _coords(self, row):
+        lat, lon = self.coords[row]
+        return round(float(lat), 4), round(float(lon), 4)   # undo float32 noise
+
+
+_default = None
+
+
+def get_gazetteer():
+    """Shared Gazetteer loaded from the bundled data file on first use."""
+    global _default
+    if _default is None:
+        _default = Gazetteer()
+    return _default
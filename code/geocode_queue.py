@@ -0,0 +1,219 @@
+# Rate-limited, deduplicating request queue in front of Nominatim
+#
+# Nominatim's usage policy allows about one request per second, so every
+# network lookup goes through one GeocodeQueue per process:
+#
+#   * a token bucket (rate / burst) decides when the next request may go,
+#     so bursts are smoothed to the allowed rate instead of earning 429s;
+#   * identical pending queries are merged: the second caller awaits the
+#     first caller's request instead of queueing another one;
+#   * every caller waits at most `timeout` seconds (queueing included),
+#     and each HTTP request is limited to REQUEST_TIMEOUT;
+#   * a 429 (or any answer with Retry-After) pauses the bucket for that
+#     long (PENALTY seconds if no Retry-After was given);
+#   * answers are handed to `on_result` (the geocode cache) even when every
+#     caller has already timed out, so the request is never wasted.
+#
+# The queue runs on its own event loop in a daemon thread, so the same
+# limiter serves every caller in the process: threads (the sync
+# geocode_location() path) call lookup_sync(), coroutines on any other
+# loop (service.py) await lookup().  stats() reports queue depth, merges,
+# timeouts and queue-wait percentiles.
+
+import asyncio
+import atexit
+import threading
+import time
+from collections import deque
+
+import httpx
+
+PENALTY = 5.0          # seconds to pause after a 429 without Retry-After
+
+
+class GeocodeError(Exception):
+    """Nominatim could not be asked or refused to answer."""
+
+
+class TokenBucket:
+    """`rate` tokens per second, at most `burst` saved up; acquire() waits for one."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Hand out nothing for `seconds` (upstream asked us to back off)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:          # callers are served in arrival order
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class GeocodeQueue:
+    """Async queue of Nominatim lookups: rate-limited, merged, with per-caller timeouts."""
+
+    def __init__(self, url, headers, rate=1.0, burst=1, timeout=15.0,
+                 request_timeout=10.0, workers=2, on_result=None):
+        self.url = url
+        self.headers = headers
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+        self.request_timeout = request_timeout
+        self.workers = workers
+        self.on_result = on_result     # called as on_result(key, value) on success
+        self._loop = None              # started on first use
+        self._queue = None
+        self._bucket = None
+        self._client = None
+        self._workers = []
+        self._pending = {}             # key -> Future shared by every caller
+        self._waits = deque(maxlen=1000)
+        self._thread_lock = threading.Lock()
+        self.requests = 0
+        self.merged = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.throttled = 0
+        self.max_depth = 0
+
+    # -- setup -------------------------------------------------------------
+    def _ensure_loop(self):
+        """The queue's own event loop, started (with its workers) on first use."""
+        with self._thread_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="geocode-queue", daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                self._loop = loop
+                atexit.register(self.close)
+            return self._loop
+
+    async def _setup(self):
+        self._queue = asyncio.Queue()
+        self._bucket = TokenBucket(self.rate, self.burst)
+        self._client = httpx.AsyncClient(headers=self.headers, timeout=self.request_timeout)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _shutdown(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await self._client.aclose()
+
+    def close(self):
+        """Stop the workers and the loop; pending callers get an error or time out."""
+        with self._thread_lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
+
+    # -- callers -----------------------------------------------------------
+    def lookup_sync(self, key, query, timeout=None):
+        """
+        (lat, lon), or None if Nominatim has no match.
+
+        `key` is the normalised query used for merging.  Raises
+        TimeoutError if no answer arrived within `timeout` seconds
+        (default self.timeout), GeocodeError if the request failed.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._lookup(key, query, timeout), self._ensure_loop()).result()
+
+    async def lookup(self, key, query, timeout=None):
+        """lookup_sync() for coroutines; the caller's event loop is never blocked."""
+        loop = await asyncio.to_thread(self._ensure_loop) if self._loop is None else self._loop
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(self._lookup(key, query, timeout), loop))
+
+    async def _lookup(self, key, query, timeout):
+        timeout = timeout or self.timeout
+        future = self._pending.get(key)
+        if future is not None:
+            self.merged += 1
+        else:
+            future = self._loop.create_future()
+            self._pending[key] = future
+            self._queue.put_nowait((key, query, time.monotonic()))
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+        try:
+            # shield: a caller giving up must not cancel the shared request
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError(f"geocoding {query!r} took longer than {timeout:g}s") from None
+
+    # -- worker ------------------------------------------------------------
+    async def _worker(self):
+        while True:
+            key, query, queued_at = await self._queue.get()
+            future = self._pending[key]
+            try:
+                await self._bucket.acquire()
+                self._waits.append(time.monotonic() - queued_at)
+                value = await self._fetch(query)
+                if self.on_result is not None:
+                    self.on_result(key, value)
+                future.set_result(value)
+            except Exception as exc:
+                self.errors += 1
+                future.set_exception(exc if isinstance(exc, GeocodeError) else GeocodeError(str(exc)))
+                future.exception()     # retrieved: no "never retrieved" warning if nobody waits
+            finally:
+                del self._pending[key]
+                self._queue.task_done()
+
+    async def _fetch(self, query):
+        self.requests += 1
+        resp = await self._client.get(self.url, params={"q": query, "format": "json", "limit": 1})
+        retry_after = resp.headers.get("Retry-After", "")
+        if resp.status_code == 429 or retry_after:
+            self.throttled += 1
+            self._bucket.pause(float(retry_after) if retry_after.isdigit() else PENALTY)
+        if resp.status_code != 200:
+            raise GeocodeError(f"Nominatim HTTP {resp.status_code}")
+        geo = resp.json()
+        if geo:
+            return float(geo[0]["lat"]), float(geo[0]["lon"])
+        return None
+
+    # -- metrics -----------------------------------------------------------
+    def stats(self):
+        """Queue depth, merges, timeouts and queue-wait percentiles (seconds)."""
+        waits = sorted(self._waits)
+
+        def pct(q):
+            return round(waits[min(len(waits) - 1, int(len(waits) * q))], 4) if waits else None
+
+        return {
+            "rate_per_s": self.rate,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_depth": self.max_depth,
+            "in_flight": len(self._pending),
+            "requests": self.requests,
+            "merged": self.merged,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "wait_p50": pct(0.50),
+            "wait_p95": pct(0.95),
+            "wait_max": round(waits[-1], 4) if waits else None,
+        }
@@ -0,0 +1,168 @@
+# Shared geocoding helpers for agent.py and rag.py
+#
+# geocode_location() answers from the bundled offline gazetteer first
+# (gazetteer.py), then from a small in-process LRU, then from an on-disk
+# SQLite cache that survives restarts, and only then asks OpenStreetMap
+# Nominatim.  Both "found" and "not found" network answers are cached, each
+# with its own TTL.  Network lookups go through one rate-limited queue
+# (geocode_queue.py) that keeps the whole process under Nominatim's
+# ~1 request/sec, merges identical pending queries and bounds every wait.
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import tracing
+from gazetteer import get_gazetteer
+from geocode_queue import GeocodeError, GeocodeQueue
+
+# Where / how long to cache (override with environment variables)
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+CACHE_PATH = Path(os.environ.get(
+    "GEOCODE_CACHE",
+    Path(__file__).resolve().parent.parent / ".cache" / "geocode.sqlite",
+))
+CACHE_TTL = float(os.environ.get("GEOCODE_TTL", 30 * 24 * 3600))              # found: 30 days
+NEGATIVE_TTL = float(os.environ.get("GEOCODE_NEGATIVE_TTL", 24 * 3600))       # not found: 1 day
+LRU_SIZE = int(os.environ.get("GEOCODE_LRU_SIZE", 1024))
+REQUEST_TIMEOUT = 10
+NOMINATIM_RATE = float(os.environ.get("NOMINATIM_RATE", 1.0))     # requests per second
+NOMINATIM_BURST = int(os.environ.get("NOMINATIM_BURST", 1))
+LOOKUP_TIMEOUT = float(os.environ.get("GEOCODE_TIMEOUT", 15))     # queueing + request, seconds
+
+HEADERS = {'User-Agent': 'SimpleAgent/1.0'}
+
+
+def normalize_query(location_query):
+    """Cache key for a place name: case-folded, single-spaced, no edge punctuation."""
+    return " ".join(location_query.casefold().split()).strip(" ,.;:!?")
+
+
+class GeoCache:
+    """Two-tier (memory LRU + SQLite) cache of query -> (lat, lon) or None."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, negative_ttl=NEGATIVE_TTL,
+                 max_entries=LRU_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lru = OrderedDict()          # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._db = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " query TEXT PRIMARY KEY, lat REAL, lon REAL, expires_at REAL)"
+            )
+            self._db.commit()
+
+    def _remember(self, key, expires_at, value):
+        self._lru[key] = (expires_at, value)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, key):
+        """Return (found, value); value is (lat, lon) or None for a cached miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry and entry[0] > now:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT lat, lon, expires_at FROM geocode WHERE query = ?", (key,)
+                ).fetchone()
+                if row and row[2] > now:
+                    value = None if row[0] is None else (row[0], row[1])
+                    self._remember(key, row[2], value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return True, value
+
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        """Store (lat, lon), or None to remember that the place was not found."""
+        expires_at = time.time() + (self.ttl if value is not None else self.negative_ttl)
+        lat, lon = value if value is not None else (None, None)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO geocode (query, lat, lon, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, lat, lon, expires_at),
+                )
+                self._db.commit()
+
+    def stats(self):
+        """Hit/miss counters for logging or metrics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._lru),
+            }
+
+
+cache = GeoCache()
+nominatim = GeocodeQueue(NOMINATIM_URL, HEADERS, rate=NOMINATIM_RATE, burst=NOMINATIM_BURST,
+                         timeout=LOOKUP_TIMEOUT, request_timeout=REQUEST_TIMEOUT,
+                         on_result=cache.put)
+
+_gazetteer_hits = 0
+_counter_lock = threading.Lock()
+
+
+def stats():
+    """Cache counters, offline gazetteer hits and the Nominatim queue metrics."""
+    with _counter_lock:
+        return {**cache.stats(), "gazetteer_hits": _gazetteer_hits, "nominatim": nominatim.stats()}
+
+
+def geocode_location(location_query):
+    """Convert a city name into (lat, lon), or (None, None) if unknown."""
+    with tracing.span("geocode", query=location_query) as sp:
+        return _geocode(location_query, sp)
+
+
+def _geocode(location_query, sp):
+    global _gazetteer_hits
+    key = normalize_query(location_query)
+    if not key:
+        return None, None
+
+    local = get_gazetteer().lookup(location_query)
+    if local is not None:
+        with _counter_lock:
+            _gazetteer_hits += 1
+        sp.set(source="gazetteer")
+        return local
+
+    found, value = cache.get(key)
+    if not found:
+        try:
+            with tracing.span("http.nominatim"):
+                value = nominatim.lookup_sync(key, location_query)   # cached by the queue
+        except (GeocodeError, TimeoutError):
+            sp.set(source="error")
+            return None, None          # network trouble or too slow: don't cache
+    sp.set(source="cache" if found else "nominatim", found=value is not None)
+
+    return value if value is not None else (None, None)
@@ -0,0 +1,234 @@
+# Response cache in front of the OpenAI client (used by local.py and rag.py)
+#
+# Asking llama3.2 for "3 facts about Paris" costs seconds of CPU
+# inference and the answer is as good the second time, so
+#
+#     client = CachingClient(OpenAI(...))
+#
+# answers repeated requests from memory.  The key is a hash of the
+# normalised model name, message list and remaining parameters.  Entries
+# live in a bounded LRU with a TTL, optionally backed by SQLite so they
+# survive restarts.  Requests with `tools`, or made with
+# `bypass_cache=True`, always go to the model.  Works for both plain and
+# `stream=True` calls: a cached stream is replayed as a single chunk.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+import tracing
+
+# Behaviour (override with environment variables)
+ENABLED = os.environ.get("LLM_CACHE", "1") != "0"
+CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 24 * 3600))
+LRU_SIZE = int(os.environ.get("LLM_CACHE_SIZE", 256))
+# set LLM_CACHE_DISK=1 (or a file path) to keep answers across restarts
+_disk = os.environ.get("LLM_CACHE_DISK", "")
+if _disk in ("", "0"):
+    DISK_PATH = None
+elif _disk == "1":
+    DISK_PATH = Path(__file__).resolve().parent.parent / ".cache" / "llm.sqlite"
+else:
+    DISK_PATH = Path(_disk)
+
+
+def _normalize_text(text):
+    return " ".join(text.split()) if isinstance(text, str) else text
+
+
+def cache_key(kwargs):
+    """Stable hash of a chat.completions.create(...) request (ignoring `stream`)."""
+    params = {k: v for k, v in kwargs.items() if k not in ("model", "messages", "stream")}
+    payload = {
+        "model": str(kwargs.get("model", "")).strip().lower(),
+        "messages": [{**m, "content": _normalize_text(m.get("content"))}
+                     for m in kwargs.get("messages", [])],
+        "params": params,
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Bounded LRU of key -> reply text, with TTL and an optional SQLite tier."""
+
+    def __init__(self, max_entries=LRU_SIZE, ttl=CACHE_TTL, path=DISK_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lru = OrderedDict()          # key -> (expires_at, text)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.bypassed = 0
+
+        self._db = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, text TEXT, expires_at REAL)"
+            )
+            self._db.commit()
+
+    def _remember(self, key, expires_at, text):
+        self._lru[key] = (expires_at, text)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, key):
+        """Cached reply text, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry and entry[0] > now:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._lru[key]         # expired
+                self.expired += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT text, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, text)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, text, expires_at) VALUES (?, ?, ?)",
+                    (key, text, expires_at),
+                )
+                self._db.commit()
+
+    def note_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self):
+        """Hit/miss counters for logging or metrics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "bypassed": self.bypassed,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._lru),
+            }
+
+    def summary(self):
+        """One-line report for printing at exit."""
+        s = self.stats()
+        lookups = s["hits"] + s["misses"]
+        if not lookups:
+            return "LLM cache: no cacheable requests"
+        return (f"LLM cache: {s['hits']}/{lookups} requests ({s['hit_ratio']:.0%}) answered "
+                f"from cache ({s['disk_hits']} from disk, {s['expired']} expired entries, "
+                f"{s['bypassed']} not cacheable)")
+
+
+def _completion_from_text(text, model):
+    return ChatCompletion.model_validate({
+        "id": f"cache-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": text}}],
+    })
+
+
+class _ReplayStream:
+    """A cached reply as a one-chunk stream; `from_cache` keeps it out of the TTFT stats."""
+
+    from_cache = True
+
+    def __init__(self, text, model):
+        self._chunk = ChatCompletionChunk.model_validate({
+            "id": f"cache-{uuid.uuid4().hex}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "delta": {"role": "assistant", "content": text}}],
+        })
+
+    def __iter__(self):
+        yield self._chunk
+
+
+class CachingClient:
+    """Drop-in wrapper: `client.chat.completions.create(...)` goes through the cache."""
+
+    def __init__(self, client, cache=None, enabled=ENABLED):
+        self._client = client
+        self.cache = cache or ResponseCache()
+        self.enabled = enabled
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def create(self, *, bypass_cache=False, **kwargs):
+        upstream = self._client.chat.completions.create
+        cacheable = "tools" not in kwargs and kwargs.get("n", 1) == 1
+        if bypass_cache or not self.enabled or not cacheable:
+            self.cache.note_bypass()
+            tracing.annotate(llm_cache="bypass")
+            return upstream(**kwargs)
+
+        key = cache_key(kwargs)
+        model = kwargs.get("model", "")
+        text = self.cache.get(key)
+        tracing.annotate(llm_cache="hit" if text is not None else "miss")
+        if text is not None:
+            return _ReplayStream(text, model) if kwargs.get("stream") else _completion_from_text(text, model)
+
+        if kwargs.get("stream"):
+            return self._record_stream(key, upstream(**kwargs))
+
+        completion = upstream(**kwargs)
+        choice = completion.choices[0]
+        if choice.message.content is not None and choice.finish_reason in ("stop", None):
+            self.cache.put(key, choice.message.content)
+        return completion
+
+    def _record_stream(self, key, stream):
+        """Pass chunks through unchanged; cache the text once the stream ends cleanly."""
+        parts, finish = [], None
+        for chunk in stream:
+            if chunk.choices:
+                choice = chunk.choices[0]
+                if choice.delta.content:
+                    parts.append(choice.delta.content)
+                finish = choice.finish_reason or finish
+            yield chunk
+        if finish in ("stop", None) and parts:
+            self.cache.put(key, "".join(parts))
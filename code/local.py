@@ -1,9 +1,17 @@
 # Import necessary libraries
+import os
 import json
 import requests
 import math
 from openai import OpenAI
 
+# Token streaming (STREAM=0 to wait for the whole reply, see streaming.py)
+from streaming import STREAM, ChatStream, write_raw, summary as streaming_summary
+# Cache for repeated LLM requests (LLM_CACHE=0 to disable)
+from llm_cache import CachingClient
+# Spans for each query and LLM call (TRACE=1 to record, see tracing.py)
+import tracing
+
 # ANSI color codes for terminal output
 BLUE = "\033[94m"
 GREEN = "\033[92m"
@@ -11,11 +19,12 @@ RED = "\033[91m"
 RESET = "\033[0m"
 BOLD = "\033[1m"
 
-# Connect to local Ollama server (running Llama3.2 model)
-client = OpenAI(
-    base_url='http://localhost:11434/v1',
+# Connect to local Ollama server (running Llama3.2 model);
+# repeated prompts are answered from the response cache (see llm_cache.py)
+client = CachingClient(OpenAI(
+    base_url=os.environ.get("OLLAMA_BASE_URL", 'http://localhost:11434/v1'),
     api_key='ollama',  # dummy key (Ollama ignores it)
-)
+))
 
 # System prompt to guide LLM behavior
 system_prompt = (
@@ -32,19 +41,29 @@ def build_initial_messages(user_input):
         {"role": "user", "content": user_input}
     ]
 
-#  Ask LLM for facts
+#  Ask LLM for facts (a ChatStream when streaming)
 def get_facts(messages):
     # note: no 'tools' passed
-    return client.chat.completions.create(
-        model="llama3.2",
-        messages=messages
-    )
+    if STREAM:
+        return ChatStream(client, trace_name="llm.facts", model="llama3.2", messages=messages)
+    with tracing.span("llm.facts", model="llama3.2") as sp:
+        completion = client.chat.completions.create(
+            model="llama3.2",
+            messages=messages
+        )
+        sp.set(**tracing.usage(completion))
+    return completion
 
 #  Final user-visible output
 def display_facts(completion):
+    print(f"\n{GREEN}Here are 3 facts for you:{RESET}\n")
+    if isinstance(completion, ChatStream):
+        # print tokens as they arrive
+        completion.consume(write_raw(BLUE))
+        print(RESET)
+        return
     content = completion.choices[0].message.content.strip()
     # assume the model already formats bullets as "- fact"
-    print(f"\n{GREEN}Here are 3 facts for you:{RESET}\n")
     print(f"{BLUE}{content}{RESET}")
 
 #  Main user interaction loop
@@ -53,10 +72,14 @@ print("\nTravel Assistant ready! (Type 'exit' to quit)")
 while True:
     user_input = input("\nUser: ")
     if user_input.lower() == "exit":
+        print(client.cache.summary())
+        if STREAM:
+            print(streaming_summary())
         print("Goodbye!")
         break
 
     # Ask the LLM for facts
-    messages   = build_initial_messages(user_input)
-    completion = get_facts(messages)
-    display_facts(completion)
+    with tracing.span("local.query", prompt_chars=len(user_input)):
+        messages   = build_initial_messages(user_input)
+        completion = get_facts(messages)
+        display_facts(completion)
@@ -0,0 +1,50 @@
+# Tiny dependency-graph runner for per-query pipelines (used by rag.py)
+#
+# A pipeline is a dict  {stage name: (function, [names of stages it needs])}.
+# Each function is called with the results of its dependencies, in the
+# order listed, and starts as soon as they are all finished.  Stages that
+# do not depend on each other (e.g. city facts from the LLM and distance
+# from the geocoder) therefore overlap, and a query takes roughly as long
+# as its slowest chain instead of the sum of every stage.
+
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import tracing
+
+
+def _timed(name, fn, args):
+    started = time.perf_counter()
+    with tracing.span(f"stage.{name}"):
+        result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def run_stages(stages, executor):
+    """Run `stages` on `executor`; return ({name: result}, {name: seconds})."""
+    for name, (_, deps) in stages.items():
+        missing = [d for d in deps if d not in stages]
+        if missing:
+            raise ValueError(f"stage {name!r} depends on unknown stage(s) {missing}")
+
+    results, timings = {}, {}
+    pending = dict(stages)
+    running = {}
+
+    while pending or running:
+        ready = [name for name, (_, deps) in pending.items()
+                 if all(d in results for d in deps)]
+        for name in ready:
+            fn, deps = pending.pop(name)
+            running[executor.submit(tracing.bind(_timed), name, fn,
+                                    [results[d] for d in deps])] = name
+
+        if not running:
+            raise ValueError(f"dependency cycle between stages {sorted(pending)}")
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = running.pop(future)
+            results[name], timings[name] = future.result()   # re-raises stage errors
+
+    return results, timings
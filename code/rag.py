@@ -1,13 +1,40 @@
 # Import necessary libraries
 import os
+import re
+import sys
 import json
-import requests
-import math
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
-import chromadb
-import pdfplumber
 from sentence_transformers import SentenceTransformer
-from chromadb.utils import embedding_functions
+from chromadb import PersistentClient
+from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
+
+# Reuse the indexer from tools/ so we share its model, IDs and metadata
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "tools"))
+import index_pdf
+# Top-k by NumPy brute force for small indexes, Chroma for large ones
+# (VECTOR_BACKEND=auto|numpy|chroma, see tools/vector_backend.py)
+from vector_backend import open_backend
+
+# Shared, cached geocoder (memory LRU + on-disk SQLite, see geocoding.py)
+from geocoding import geocode_location
+from distance import haversine_distance
+# Local city matcher for snippets, and for prompts before asking the LLM (see city_extractor.py)
+from city_extractor import get_extractor
+# Token streaming (STREAM=0 to wait for the whole reply, see streaming.py)
+from streaming import STREAM, ChatStream, BulletPrinter, summary as streaming_summary
+# Cache for repeated LLM requests (LLM_CACHE=0 to disable)
+from llm_cache import CachingClient
+# Per-query stages run as a small dependency graph (see pipeline.py)
+from pipeline import run_stages
+# Spans for retrieval, LLM calls, geocoding and each stage (TRACE=1, see tracing.py)
+import tracing
+
+PDF_DIR = ROOT_DIR / "data"
+CHROMA_PATH = ROOT_DIR / "chroma_db"
 
 # ANSI color codes for terminal output
 BLUE = "\033[94m"
@@ -17,11 +44,12 @@ RESET = "\033[0m"
 BOLD = "\033[1m"
 
 
-# Connect to local Ollama server (running Llama3.2 model)
-client = OpenAI(
-    base_url='http://localhost:11434/v1',
+# Connect to local Ollama server (running Llama3.2 model);
+# repeated prompts are answered from the response cache (see llm_cache.py)
+client = CachingClient(OpenAI(
+    base_url=os.environ.get("OLLAMA_BASE_URL", 'http://localhost:11434/v1'),
     api_key='ollama',  # dummy key (Ollama ignores it)
-)
+))
 
 # Set hardcoded current location (Raleigh, NC)
 CURRENT_LAT = 35.7796
@@ -55,27 +83,36 @@ travel_tools = [
     }
 ]
 
-#  Index the uploaded offices.pdf into ChromaDB
-print("\nLoading and indexing PDF into ChromaDB...")
-pdf_text = ""
-with pdfplumber.open("../data/offices.pdf") as pdf:
-    for page in pdf.pages:
-        pdf_text += page.extract_text() + "\n"
-
-model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
-
-# Create ChromaDB collection
-chroma_client = chromadb.Client()
-collection = chroma_client.get_or_create_collection(
-    name="office_docs",
-    embedding_function=embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
-)
-
-# Clean up and embed the PDF lines
-docs = [line.strip() for line in pdf_text.split('\n') if len(line.strip()) > 20]
-ids = [f"doc_{i}" for i in range(len(docs))]
-collection.add(documents=docs, ids=ids)
-print(f"Indexed {len(docs)} office documents.")
+#  Open the persistent office index built by tools/index_pdf.py
+#  (only (re)index when it is missing or the PDFs changed since);
+#  done on first use so the module can be imported cheaply
+_index = None
+_index_lock = threading.Lock()
+
+def open_index():
+    """(search backend, embed_model) for the office index, opened once."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            print("\nOpening office index in ChromaDB...")
+            if index_pdf.index_is_stale(PDF_DIR, CHROMA_PATH):
+                print("Index missing or stale, indexing PDFs...")
+                index_pdf.index_pdfs(incremental=True, pdf_dir=PDF_DIR, db_path=CHROMA_PATH)
+
+            chroma_client = PersistentClient(
+                path=str(CHROMA_PATH),
+                settings=Settings(),
+                tenant=DEFAULT_TENANT,
+                database=DEFAULT_DATABASE,
+            )
+            collection = chroma_client.get_or_create_collection(index_pdf.COLLECTION_NAME)
+            backend = open_backend(collection, db_path=CHROMA_PATH)
+
+            # Same model (and normalisation) the indexer used for the stored vectors
+            embed_model = SentenceTransformer(index_pdf.EMBED_MODEL_NAME)
+            print(f"Loaded {backend.count()} office documents ({backend.name} search).")
+            _index = (backend, embed_model)
+    return _index
 
 #  Functions
 
@@ -88,55 +125,65 @@ def build_initial_messages(user_input, context_snippets):
         {"role": "user", "content": user_input}
     ]
 
+WORD_RE = re.compile(r"\w+")
+
+def focus_lines(query, documents):
+    """
+    The lines of the retrieved chunks that share the most words with the query.
+
+    The index stores token windows of several lines (see tools/index_pdf.py);
+    city detection and the office facts want the line the question is about,
+    not its neighbours.  All lines are kept if none shares a word.
+    """
+    words = set(WORD_RE.findall(query.casefold()))
+    lines = list(dict.fromkeys(          # windows overlap: drop repeated lines
+        line.strip() for doc in documents for line in doc.splitlines() if line.strip()))
+    scores = [len(words & set(WORD_RE.findall(line.casefold()))) for line in lines]
+    best = max(scores, default=0)
+    return [line for line, score in zip(lines, scores) if score == best] if best else lines
+
 def search_vector_db(query):
     """Search ChromaDB for relevant office document snippets."""
-    results = collection.query(query_texts=[query], n_results=1)
-    return results["documents"][0] if results["documents"] else []
+    backend, embed_model = open_index()
+    with tracing.span("retrieval", n_results=1) as sp:
+        with tracing.span("embed", model=index_pdf.EMBED_MODEL_NAME):
+            query_vec = embed_model.encode(query, normalize_embeddings=True)
+        with tracing.span(f"{backend.name}.query"):
+            hits = backend.query(query_vec, 1)[0]
+        documents = [doc for _, doc, _, _ in hits]
+        snippets = focus_lines(query, documents)
+        sp.set(hits=len(documents), lines=len(snippets))
+    return snippets
 
 def extract_city_from_rag(snippets):
-    """Try to extract known cities directly from office snippets."""
-    possible_cities = []
+    """Try to extract known cities (offline gazetteer) directly from office snippets."""
+    extractor = get_extractor()
     for snippet in snippets:
-        for city in ["New York", "San Francisco", "Chicago", "Austin", "Boston",
-                     "London", "Toronto", "Tokyo", "Sydney", "Berlin"]:
-            if city.lower() in snippet.lower():
-                possible_cities.append(city)
-    if possible_cities:
-        return possible_cities[0]  # Return first match found
-    else:
-        return None
+        possible_cities = extractor.find_all(snippet)
+        if possible_cities:
+            return possible_cities[0]  # Return first match found
+    return None
 
 def fallback_detect_city_with_llm(text):
-    """If RAG fails, use LLM to detect a city from user query."""
+    """If RAG fails, detect a city in the user query: gazetteer match first, then the LLM."""
+    with tracing.span("extract_city") as sp:
+        city = get_extractor().extract(text)
+        sp.set(source="local" if city else "llm")
+    if city:
+        return city
     messages = [
         {"role": "system", "content": "Identify a city mentioned in the user query. Only reply with the city name."},
         {"role": "user", "content": text}
     ]
-    completion = client.chat.completions.create(
-        model="llama3.2",
-        messages=messages
-    )
+    with tracing.span("llm.extract_city", model="llama3.2") as sp:
+        completion = client.chat.completions.create(
+            model="llama3.2",
+            messages=messages
+        )
+        sp.set(**tracing.usage(completion))
     raw = completion.choices[0].message.content
     return raw.strip()
 
-# Helper: Geocode destination using OpenStreetMap
-def geocode_location(location_query):
-    """Use OpenStreetMap Nominatim API to convert a city name into lat/lon."""
-    headers = {'User-Agent': 'SimpleAgent/1.0'}
-    geo = requests.get(f"https://nominatim.openstreetmap.org/search?q={location_query}&format=json", headers=headers).json()
-    if geo:
-        return float(geo[0]['lat']), float(geo[0]['lon'])
-    return None, None
-
-# Helper: Calculate straight-line distance (haversine formula)
-def haversine_distance(lat1, lon1, lat2, lon2):
-    R = 3958.8
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
 #  Tool: Find distance between Raleigh and user location
 def calculate_distance_tool(destination_query):
     """Helper function for calculating distance from Raleigh, NC."""
@@ -146,36 +193,51 @@ def calculate_distance_tool(destination_query):
     miles = haversine_distance(CURRENT_LAT, CURRENT_LON, lat2, lon2)
     return {"destination": destination_query, "distance_miles": round(miles, 2)}
 
-def get_city_facts(location_name):
-    """Use LLM to retrieve 3 interesting facts about a city."""
+def get_city_facts(location_name, on_text=None):
+    """Use LLM to retrieve 3 interesting facts about a city (streamed to on_text if given)."""
     messages = [
         {"role": "system", "content": "Provide exactly 3 interesting facts about the city. Each fact starts with a dash (-)."},
         {"role": "user", "content": f"Tell me 3 interesting facts about {location_name}."}
     ]
-    completion = client.chat.completions.create(
-        model="llama3.2",
-        messages=messages,
-    )
+    if STREAM:
+        return ChatStream(client, trace_name="llm.city_facts", model="llama3.2",
+                          messages=messages).consume(on_text)
+    with tracing.span("llm.city_facts", model="llama3.2") as sp:
+        completion = client.chat.completions.create(
+            model="llama3.2",
+            messages=messages,
+        )
+        sp.set(**tracing.usage(completion))
     return completion.choices[0].message.content
 
-def get_city_facts_list(location_name):
+def get_city_facts_list(location_name, on_text=None):
     """Clean up LLM output into a list of 3 facts."""
-    text = get_city_facts(location_name)
+    text = get_city_facts(location_name, on_text)
     lines = [line.strip() for line in text.split('\n') if line.strip()]
     if not any(line.startswith('-') or line.startswith('•') for line in lines):
         return lines[:3]
     else:
         return [line[1:].strip() for line in lines if line.startswith('-') or line.startswith('•')]
 
-def format_final_output(location_name, office_facts_list, city_facts_list, distance_miles):
-    """Format final combined response for the user."""
+def format_office_section(location_name, office_facts_list):
     output = f"{BOLD}{BLUE}Facts about the Office in {location_name}:{RESET}{BLUE}\n\n"
     for fact in office_facts_list:
         output += f"• {fact.strip()}\n"
-    output += f"\n{BOLD}{BLUE}Facts about {location_name}:{RESET}{BLUE}\n\n"
+    return output
+
+def format_city_header(location_name):
+    return f"\n{BOLD}{BLUE}Facts about {location_name}:{RESET}{BLUE}\n\n"
+
+def format_distance_section(distance_miles):
+    return f"\n{BOLD}{BLUE}Distance from Raleigh, NC:{RESET}{BLUE} {distance_miles} miles"
+
+def format_final_output(location_name, office_facts_list, city_facts_list, distance_miles):
+    """Format final combined response for the user."""
+    output = format_office_section(location_name, office_facts_list)
+    output += format_city_header(location_name)
     for fact in city_facts_list:
         output += f"• {fact.strip()}\n"
-    output += f"\n{BOLD}{BLUE}Distance from Raleigh, NC:{RESET}{BLUE} {distance_miles} miles"
+    output += format_distance_section(distance_miles)
     return output
 
 def display_final_response(location, office_facts, city_facts, distance_miles):
@@ -183,23 +245,27 @@ def display_final_response(location, office_facts, city_facts, distance_miles):
     final_output = format_final_output(location, office_facts, city_facts, distance_miles)
     print(f"\n{GREEN}Assistant Final Response:{RESET}\n\n{BLUE}{final_output}{RESET}")
 
-#  Main user interaction loop
-print("\nTravel Assistant ready! (Type 'exit' to quit)")
-
-while True:
-    #  User prompt
-    user_input = input("\nUser: ")
-    if user_input.lower() == "exit":
-        print("Goodbye!")
-        break
-
-    # 1. Search vector DB (office documents) first
-    rag_snippets = search_vector_db(user_input)
-    
-    # Show what query was used
+def stream_city_facts_response(location, office_facts):
+    """Print office facts, then stream city facts as the LLM writes them; return the facts."""
+    print(f"\n{GREEN}Assistant Final Response:{RESET}\n\n{BLUE}"
+          f"{format_office_section(location, office_facts)}{format_city_header(location)}",
+          end="", flush=True)
+    printer = BulletPrinter()
+    city_facts = get_city_facts_list(location, on_text=printer.feed)
+    printer.close()
+    if not printer.facts:
+        # model ignored the dash format: show the cleaned-up lines instead
+        for fact in city_facts:
+            print(f"• {fact.strip()}")
+    return city_facts
+
+def display_distance(distance_miles):
+    """Finish a streamed response with the distance line."""
+    print(f"{BLUE}{format_distance_section(distance_miles)}{RESET}")
+
+def print_rag_snippets(user_input, rag_snippets):
+    """Show the RAG query and the office snippets it retrieved."""
     print(f"\n{RED}RAG Search Query:{RESET} {user_input}")
-
-    # Show retrieved office snippets
     if rag_snippets:
         print(f"\n{RED}RAG Retrieved Snippets:{RESET}")
         for idx, snippet in enumerate(rag_snippets, start=1):
@@ -207,28 +273,105 @@ while True:
     else:
         print(f"\n{RED}No snippets retrieved from RAG.{RESET}")
 
-    # 2. Try to extract city name from RAG first
-    detected_city = extract_city_from_rag(rag_snippets)
+def detect_city(user_input, rag_snippets):
+    """City from the RAG snippets, else from the user prompt via the LLM."""
+    return extract_city_from_rag(rag_snippets) or fallback_detect_city_with_llm(user_input)
 
-    # 3. If RAG fails, fallback to user prompt
+def select_office_facts(rag_snippets, detected_city):
+    """Snippets that mention the detected city."""
     if not detected_city:
-        detected_city = fallback_detect_city_with_llm(user_input)
-
-    if detected_city:
-        # 4. Prepare office facts (from RAG)
-        office_facts = [snippet for snippet in rag_snippets if detected_city.lower() in snippet.lower()]
-        if not office_facts:
-            office_facts = ["(No office information found)"]
-
-        # 5. Prepare city facts (from LLM)
-        city_facts = get_city_facts_list(detected_city)
-
-        # 6. Calculate distance
-        dist = calculate_distance_tool(detected_city)
-        distance_miles = dist.get("distance_miles", "unknown")
+        return None
+    office_facts = [snippet for snippet in rag_snippets if detected_city.lower() in snippet.lower()]
+    return office_facts or ["(No office information found)"]
+
+def build_query_stages(user_input, interactive=True):
+    """
+    The per-query pipeline as {stage: (function, dependencies)}.
+
+    city_facts (LLM) and distance (geocoder) only need the city, so they
+    run at the same time; in streaming mode city_facts also prints, so it
+    waits for the snippets and office facts to be on screen first.
+    With interactive=False nothing is printed.
+    """
+    if not interactive:
+        return {
+            "snippets":     (lambda: search_vector_db(user_input), []),
+            "city":         (lambda snippets: detect_city(user_input, snippets), ["snippets"]),
+            "office_facts": (select_office_facts, ["snippets", "city"]),
+            "city_facts":   (lambda city: get_city_facts_list(city) if city else None, ["city"]),
+            "distance":     (lambda city: calculate_distance_tool(city) if city else None, ["city"]),
+        }
+    if STREAM:
+        city_facts = (lambda city, office, _shown:
+                      stream_city_facts_response(city, office) if city else None,
+                      ["city", "office_facts", "shown"])
+    else:
+        city_facts = (lambda city: get_city_facts_list(city) if city else None, ["city"])
+    return {
+        "snippets":     (lambda: search_vector_db(user_input), []),
+        "shown":        (lambda snippets: print_rag_snippets(user_input, snippets), ["snippets"]),
+        "city":         (lambda snippets: detect_city(user_input, snippets), ["snippets"]),
+        "office_facts": (select_office_facts, ["snippets", "city"]),
+        "city_facts":   city_facts,
+        "distance":     (lambda city: calculate_distance_tool(city) if city else None, ["city"]),
+    }
 
-        # 7. Output everything nicely
-        display_final_response(detected_city, office_facts, city_facts, distance_miles)
+# Worker pool for the independent pipeline stages
+stage_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="stage")
+
+#  One prompt, printed as it goes (the interactive flow)
+def handle_query(user_input):
+    with tracing.span("rag.query", prompt_chars=len(user_input)) as query_span:
+        # 1-6. Search RAG, detect the city, then gather city facts (LLM) and
+        #      distance (geocoder) concurrently; run_stages joins them all
+        results, _ = run_stages(build_query_stages(user_input), stage_executor)
+        detected_city = results["city"]
+        query_span.set(city=detected_city)
+
+        if detected_city:
+            distance_miles = results["distance"].get("distance_miles", "unknown")
+
+            # 7. Output everything nicely
+            if STREAM:
+                display_distance(distance_miles)       # facts were streamed already
+            else:
+                display_final_response(detected_city, results["office_facts"],
+                                       results["city_facts"], distance_miles)
+
+        else:
+            print(f"\n{GREEN}Assistant Final Response:{RESET}\n{BOLD}Sorry, I couldn't find a relevant location.{RESET}")
+
+#  One prompt, nothing printed: a JSON-serialisable result (used by batch.py)
+def answer_query(user_input, executor=None):
+    with tracing.span("rag.query", prompt_chars=len(user_input), interactive=False) as query_span:
+        results, timings = run_stages(build_query_stages(user_input, interactive=False),
+                                      executor or stage_executor)
+        query_span.set(city=results["city"])
+        return {
+            "city": results["city"],
+            "snippets": results["snippets"],
+            "office_facts": results["office_facts"],
+            "city_facts": results["city_facts"],
+            "distance": results["distance"],
+            "stage_seconds": {name: round(t, 4) for name, t in timings.items()},
+        }
 
-    else:
-        print(f"\n{GREEN}Assistant Final Response:{RESET}\n{BOLD}Sorry, I couldn't find a relevant location.{RESET}")
+#  Main user interaction loop
+def main():
+    open_index()
+    print("\nTravel Assistant ready! (Type 'exit' to quit)")
+
+    while True:
+        #  User prompt
+        user_input = input("\nUser: ")
+        if user_input.lower() == "exit":
+            print(get_extractor().summary())
+            print(client.cache.summary())
+            if STREAM:
+                print(streaming_summary())
+            print("Goodbye!")
+            break
+        handle_query(user_input)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+# Async HTTP front-end for the travel assistant (agent.py and rag.py flows)
+#
+#     uvicorn service:app --port 8080            (run from code/)
+#
+#     POST /agent   {"prompt": "...", "stream": true, "timeout": 30}
+#     POST /rag     same body
+#     GET  /health  admission counters, latency percentiles, cache stats
+#
+# One AsyncOpenAI client (one pooled HTTP connection set to Ollama) is
+# shared by every request.  Each request gets a deadline (REQUEST_TIMEOUT,
+# or a smaller "timeout" in the body) that bounds every LLM and tool call
+# it makes.  Admission control caps the requests being worked on at
+# MAX_CONCURRENT; up to MAX_QUEUE more wait for a slot, and anything
+# beyond that is turned away at once with 503 + Retry-After rather than
+# piling up behind a busy model.
+#
+# Streaming responses are JSON lines, one event per line:
+#   {"type": "tool_result" | "snippets" | "city" | "office_facts" | "distance", ...}
+#   {"type": "token", "text": "..."}      as the model writes
+#   {"type": "done", "seconds": ...}      or {"type": "error", "error": "..."}
+# With "stream": false the same events are folded into one JSON object.
+#
+# The blocking helpers (geocoding, embedding, Chroma) run in worker
+# threads; the rest of a request never blocks the event loop.  Geocoding
+# that misses the gazetteer and cache waits in geocoding.nominatim, the
+# process-wide rate-limited queue, so a burst of requests never pushes
+# Nominatim past its limit; /health shows that queue's depth and waits.
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+import httpx
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+import agent
+import geocoding
+import tracing
+from city_extractor import get_extractor
+from llm_cache import ENABLED as LLM_CACHE_ENABLED, ResponseCache, cache_key
+
+# Limits (override with environment variables)
+MAX_CONCURRENT = int(os.environ.get("SERVICE_MAX_CONCURRENT", 8))      # requests worked on at once
+MAX_QUEUE = int(os.environ.get("SERVICE_MAX_QUEUE", 32))               # requests waiting for a slot
+REQUEST_TIMEOUT = float(os.environ.get("SERVICE_REQUEST_TIMEOUT", 60))  # seconds per request
+MODEL = "llama3.2"
+
+# One pooled async client for every request
+llm = AsyncOpenAI(
+    base_url=os.environ.get("OLLAMA_BASE_URL", 'http://localhost:11434/v1'),
+    api_key='ollama',  # dummy key (Ollama ignores it)
+    http_client=httpx.AsyncClient(limits=httpx.Limits(
+        max_connections=MAX_CONCURRENT * 2, max_keepalive_connections=MAX_CONCURRENT * 2)),
+)
+
+
+class Overloaded(Exception):
+    """Every slot is busy and the wait queue is full."""
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time."""
+
+
+class Admission:
+    """At most `limit` requests run at once and at most `queue` wait; the rest are refused."""
+
+    def __init__(self, limit, queue):
+        self.limit = limit
+        self.queue = queue
+        self._slots = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def acquire(self, deadline):
+        if self._slots.locked() and self.waiting >= self.queue:
+            self.rejected += 1
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), remaining(deadline))
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise DeadlineExceeded("no free slot before the deadline") from None
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+
+    def stats(self):
+        return {"limit": self.limit, "queue_limit": self.queue, "active": self.active,
+                "waiting": self.waiting, "admitted": self.admitted,
+                "rejected": self.rejected, "timed_out": self.timed_out}
+
+
+admission = Admission(MAX_CONCURRENT, MAX_QUEUE)
+_latencies = {"agent": deque(maxlen=1000), "rag": deque(maxlen=1000)}
+
+
+def remaining(deadline):
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return left
+
+
+async def within(deadline, awaitable):
+    """Await with whatever time the request has left."""
+    try:
+        return await asyncio.wait_for(awaitable, remaining(deadline))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("request deadline exceeded") from None
+
+
+async def stream_tokens(messages, deadline):
+    """Yield text deltas of a streamed completion, each within the deadline."""
+    stream = await within(deadline, llm.chat.completions.create(
+        model=MODEL, messages=messages, stream=True, timeout=remaining(deadline)))
+    chunks = stream.__aiter__()
+    while True:
+        try:
+            chunk = await within(deadline, chunks.__anext__())
+        except StopAsyncIteration:
+            return
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+# Replies to tool-free prompts (rag's city facts) are cached like in rag.py
+# (LLM_CACHE=0 to disable; LLM_CACHE_DISK shares the SQLite tier with the scripts)
+response_cache = ResponseCache()
+
+
+async def cached_tokens(messages, deadline):
+    """stream_tokens() through the response cache: a hit arrives as one delta."""
+    if not LLM_CACHE_ENABLED:
+        response_cache.note_bypass()
+        async for text in stream_tokens(messages, deadline):
+            yield text
+        return
+    key = cache_key({"model": MODEL, "messages": messages})
+    text = await asyncio.to_thread(response_cache.get, key)
+    if text is not None:
+        yield text
+        return
+    parts = []
+    async for text in stream_tokens(messages, deadline):
+        parts.append(text)
+        yield text
+    if parts:
+        await asyncio.to_thread(response_cache.put, key, "".join(parts))
+
+
+# ── Flows: async generators of events ──────────────────────────────────────
+async def agent_events(prompt, deadline):
+    """agent.py's plan → tools → answer, with tools run concurrently off the loop."""
+    messages = agent.build_initial_messages(prompt)
+    completion = await within(deadline, llm.chat.completions.create(
+        model=MODEL, messages=messages, tools=agent.travel_tools, timeout=remaining(deadline)))
+    message = completion.choices[0].message
+    if not message.tool_calls:
+        yield {"type": "token", "text": message.content or ""}
+        return
+
+    async def call(tool_call):
+        try:
+            args = json.loads(tool_call.function.arguments)
+        except json.JSONDecodeError:
+            return {"error": "Invalid tool arguments."}
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(agent.run_tool, tool_call.function.name, args),
+                min(agent.TOOL_TIMEOUT, remaining(deadline)))
+        except asyncio.TimeoutError:
+            return {"error": f"{tool_call.function.name} timed out"}
+
+    results = await asyncio.gather(*(call(tc) for tc in message.tool_calls))
+    for tool_call, result in zip(message.tool_calls, results):
+        messages.append({"role": "tool", "tool_call_id": tool_call.id, "content": json.dumps(result)})
+        yield {"type": "tool_result", "name": tool_call.function.name, "result": result}
+
+    async for text in stream_tokens(messages, deadline):
+        yield {"type": "token", "text": text}
+
+
+_rag = None
+
+
+def rag_module():
+    """rag.py, imported (and its index opened) on the first /rag request."""
+    global _rag
+    if _rag is None:
+        import rag
+        rag.open_index()
+        _rag = rag
+    return _rag
+
+
+async def detect_city(rag, prompt, snippets, deadline):
+    """Snippets, then the local extractor, then the LLM (like rag.detect_city, but async)."""
+    city = rag.extract_city_from_rag(snippets) or get_extractor().extract(prompt)
+    if city:
+        return city
+    completion = await within(deadline, llm.chat.completions.create(
+        model=MODEL, timeout=remaining(deadline), messages=[
+            {"role": "system", "content": "Identify a city mentioned in the user query. Only reply with the city name."},
+            {"role": "user", "content": prompt},
+        ]))
+    return (completion.choices[0].message.content or "").strip() or None
+
+
+async def rag_events(prompt, deadline):
+    """rag.py's retrieval → city → (city facts ∥ distance) pipeline."""
+    rag = await within(deadline, asyncio.to_thread(rag_module))
+    snippets = await within(deadline, asyncio.to_thread(rag.search_vector_db, prompt))
+    yield {"type": "snippets", "snippets": snippets}
+
+    city = await detect_city(rag, prompt, snippets, deadline)
+    yield {"type": "city", "city": city}
+    if not city:
+        return
+    yield {"type": "office_facts", "facts": rag.select_office_facts(snippets, city)}
+
+    distance = asyncio.create_task(asyncio.to_thread(rag.calculate_distance_tool, city))
+    try:
+        messages = [
+            {"role": "system", "content": "Provide exactly 3 interesting facts about the city. Each fact starts with a dash (-)."},
+            {"role": "user", "content": f"Tell me 3 interesting facts about {city}."},
+        ]
+        async for text in cached_tokens(messages, deadline):
+            yield {"type": "token", "text": text}
+        yield {"type": "distance", "result": await within(deadline, asyncio.shield(distance))}
+    finally:
+        distance.cancel()
+
+
+FLOWS = {"agent": agent_events, "rag": rag_events}
+
+
+# ── HTTP layer ─────────────────────────────────────────────────────────────
+class Query(BaseModel):
+    prompt: str
+    stream: bool = True
+    timeout: float | None = None
+
+
+async def run_flow(name, query, deadline):
+    """Events of one admitted request, ending with "done" or "error"."""
+    started = time.perf_counter()
+    sp = tracing.start_span(f"service.{name}", prompt_chars=len(query.prompt), stream=query.stream)
+    try:
+        async for event in FLOWS[name](query.prompt, deadline):
+            yield event
+        seconds = time.perf_counter() - started
+        _latencies[name].append(seconds)
+        sp.end()
+        yield {"type": "done", "seconds": round(seconds, 4)}
+    except DeadlineExceeded as err:
+        admission.timed_out += 1
+        sp.end(error=err)
+        yield {"type": "error", "error": str(err), "status": 504}
+    except Exception as err:
+        sp.end(error=err)
+        yield {"type": "error", "error": f"{type(err).__name__}: {err}", "status": 502}
+    finally:
+        sp.end()                     # no-op unless the client went away mid-stream
+
+
+def fold(events):
+    """Non-streaming body: the events merged into one result object."""
+    result = {"answer": "", "tool_results": []}
+    for event in events:
+        kind = event["type"]
+        if kind == "token":
+            result["answer"] += event["text"]
+        elif kind == "tool_result":
+            result["tool_results"].append(event["result"])
+        elif kind in ("snippets", "city", "distance"):
+            result[kind] = event.get(kind, event.get("result"))
+        elif kind == "office_facts":
+            result["office_facts"] = event["facts"]
+        elif kind == "done":
+            result["seconds"] = event["seconds"]
+        elif kind == "error":
+            raise HTTPException(event["status"], event["error"])
+    result["facts"] = agent.parse_facts(result["answer"])
+    return result
+
+
+class AdmittedStream(StreamingResponse):
+    """Streaming response that frees its admission slot however the response ends."""
+
+    def __init__(self, events, **kwargs):
+        self.events = events
+        super().__init__(self._lines(), **kwargs)
+
+    async def _lines(self):
+        async for event in self.events:
+            yield json.dumps(event, default=str) + "\n"
+
+    async def __call__(self, scope, receive, send):
+        # also reached when the client disconnects before the body starts,
+        # when the events generator has not run yet and has no finally to run
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.events.aclose()
+            admission.release()
+
+
+app = FastAPI(title="Travel assistant")
+
+
+async def handle(name, query):
+    timeout = min(query.timeout or REQUEST_TIMEOUT, REQUEST_TIMEOUT)
+    deadline = time.monotonic() + timeout
+    try:
+        await admission.acquire(deadline)
+    except Overloaded:
+        raise HTTPException(503, "server busy, try again shortly",
+                            headers={"Retry-After": "1"}) from None
+    except DeadlineExceeded as err:
+        raise HTTPException(504, str(err)) from None
+
+    events = run_flow(name, query, deadline)
+    if query.stream:
+        return AdmittedStream(events, media_type="application/x-ndjson")
+    try:
+        return JSONResponse(fold([event async for event in events]))
+    finally:
+        admission.release()
+
+
+@app.post("/agent")
+async def agent_endpoint(query: Query):
+    return await handle("agent", query)
+
+
+@app.post("/rag")
+async def rag_endpoint(query: Query):
+    return await handle("rag", query)
+
+
+@app.get("/health")
+async def health():
+    def percentiles(samples):
+        values = sorted(samples)
+        if not values:
+            return {"count": 0}
+        return {"count": len(values), "p50": values[len(values) // 2],
+                "p95": values[min(len(values) - 1, int(len(values) * 0.95))]}
+
+    return {
+        "status": "ok",
+        "admission": admission.stats(),
+        "latency_seconds": {name: percentiles(s) for name, s in _latencies.items()},
+        "geocoding": geocoding.stats(),
+        "city_extraction": get_extractor().stats(),
+        "llm_cache": response_cache.stats(),
+    }
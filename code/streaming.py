@@ -0,0 +1,208 @@
+# Streaming helpers for chat completions (local.py, agent.py, rag.py)
+#
+# ChatStream wraps client.chat.completions.create(stream=True, ...) so a
+# caller can print tokens as they arrive and still get the full text at
+# the end.  BulletPrinter parses "- fact" lines incrementally and renders
+# them in the scripts' "• fact" format while the model is still typing.
+# Time-to-first-token (TTFT) and total time of every stream are recorded;
+# the scripts print summary() on exit.  Replies replayed from the LLM
+# cache are not counted.  With TRACE on,
+# each stream is a span (named by `trace_name`) that ends when the last
+# token has been read or the consumer stops reading.
+
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import tracing
+
+# Stream replies by default; STREAM=0 restores the blocking behaviour
+STREAM = os.environ.get("STREAM", "1") != "0"
+
+BULLETS = ('-', '•')
+
+_ttft_samples = deque(maxlen=1000)
+_total_samples = deque(maxlen=1000)
+_ttft_lock = threading.Lock()
+
+
+def record_ttft(seconds):
+    """Remember one time-to-first-token measurement."""
+    with _ttft_lock:
+        _ttft_samples.append(seconds)
+
+
+def record_total(seconds):
+    """Remember how long one complete stream took, first token to last."""
+    with _ttft_lock:
+        _total_samples.append(seconds)
+
+
+def stats():
+    """TTFT and whole-reply metrics (seconds) over the most recent streams."""
+    with _ttft_lock:
+        samples = sorted(_ttft_samples)
+        totals = sorted(_total_samples)
+        last = _ttft_samples[-1] if _ttft_samples else None
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "last_ttft": last,
+        "mean_ttft": sum(samples) / len(samples),
+        "p50_ttft": samples[len(samples) // 2],
+        "max_ttft": samples[-1],
+        "p50_total": totals[len(totals) // 2] if totals else None,
+    }
+
+
+def summary():
+    """One-line report for printing at exit."""
+    s = stats()
+    if not s["count"]:
+        return "Streaming: no replies streamed from the model"
+    line = (f"Streaming: first token after {s['p50_ttft']:.2f}s median "
+            f"(max {s['max_ttft']:.2f}s) over {s['count']} replies")
+    if s["p50_total"] is not None:
+        line += f", whole reply after {s['p50_total']:.2f}s median"
+    return line
+
+
+class ChatStream:
+    """A streamed chat completion: iterate for text deltas, or call consume()."""
+
+    def __init__(self, client, trace_name="llm.stream", **kwargs):
+        self.started = time.perf_counter()
+        self.ttft = None
+        self.text = ""
+        self._span = tracing.start_span(trace_name, model=kwargs.get("model"), stream=True)
+        try:
+            with tracing.activate(self._span):
+                self._stream = client.chat.completions.create(stream=True, **kwargs)
+        except Exception as err:
+            self._span.end(error=err)
+            raise
+        # a reply replayed from llm_cache arrives in one chunk at once: not a TTFT sample
+        self.from_cache = getattr(self._stream, "from_cache", False)
+
+    def __iter__(self):
+        parts = []
+        error = None
+        finished = False
+        try:
+            for chunk in self._stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - self.started
+                    if not self.from_cache:
+                        record_ttft(self.ttft)
+                parts.append(delta)
+                yield delta
+            finished = True
+            if not self.from_cache and self.ttft is not None:
+                record_total(time.perf_counter() - self.started)
+        except Exception as err:
+            error = err
+            raise
+        finally:
+            # also reached when the consumer stops early (GeneratorExit)
+            self.text = "".join(parts)
+            self._span.end(error=error, chunks=len(parts), cached=self.from_cache,
+                           complete=finished,
+                           ttft_ms=round(self.ttft * 1000, 1) if self.ttft is not None else None)
+
+    def consume(self, on_text=None):
+        """Read the whole stream, passing each delta to on_text; return the full text."""
+        for delta in self:
+            if on_text:
+                on_text(delta)
+        return self.text
+
+
+def write_raw(color="", out=None):
+    """on_text callback that prints deltas unchanged (optionally coloured)."""
+    out = out or sys.stdout
+    started = []
+
+    def write(delta):
+        if not started:
+            out.write(color)
+            started.append(True)
+        out.write(delta)
+        out.flush()
+    return write
+
+
+class BulletPrinter:
+    """
+    Incrementally render '- fact' / '• fact' lines as `prefix + fact + suffix`.
+
+    Non-bullet lines are not printed but kept in `lines`; `facts` collects
+    the parsed bullets, matching the scripts' non-streaming parsers.  The
+    optional `header` is printed just before the first bullet.
+    """
+
+    def __init__(self, prefix="• ", suffix="\n", header="", out=None):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.header = header
+        self.out = out or sys.stdout
+        self.facts = []
+        self.lines = []
+        self._reset_line()
+
+    def _reset_line(self):
+        self._line = ""
+        self._is_bullet = None        # undecided until the first non-space char
+        self._fact_started = False
+
+    def feed(self, delta):
+        buf = []
+        for ch in delta:
+            if ch == "\n":
+                self._finish_line(buf)
+                continue
+            self._line += ch
+            if self._is_bullet is None:
+                stripped = self._line.lstrip()
+                if not stripped:
+                    continue
+                self._is_bullet = stripped[0] in BULLETS
+                if self._is_bullet:
+                    if self.header:
+                        buf.append(self.header)
+                        self.header = ""
+                    buf.append(self.prefix)
+                continue              # the marker itself is not echoed
+            if self._is_bullet:
+                if not self._fact_started and ch.isspace():
+                    continue
+                self._fact_started = True
+                buf.append(ch)
+        if buf:
+            self.out.write("".join(buf))
+            self.out.flush()
+
+    def _finish_line(self, buf):
+        line = self._line.strip()
+        if line:
+            self.lines.append(line)
+        if self._is_bullet:
+            self.facts.append(line[1:].strip())
+            buf.append(self.suffix)
+        self._reset_line()
+
+    def close(self):
+        """Flush a final line that had no trailing newline."""
+        buf = []
+        if self._line:
+            self._finish_line(buf)
+        if buf:
+            self.out.write("".join(buf))
+            self.out.flush()
@@ -0,0 +1,219 @@
+# Lightweight tracing: nested, timed spans written as JSON lines
+#
+#     with tracing.span("retrieval", top_k=1) as sp:
+#         ...
+#         sp.set(hits=len(docs))
+#
+# Spans nest through a context variable (so asyncio tasks inherit the
+# current span); threads do not inherit context, so work handed to an
+# executor is wrapped with tracing.bind(fn).  Every finished span becomes
+# one JSON line with OpenTelemetry-style fields (trace_id, span_id,
+# parent_id, name, start, duration_ms, attributes, status).
+#
+# Off unless TRACE is set:  TRACE=1 writes <repo>/.cache/trace.jsonl,
+# TRACE=<path> writes there, TRACE=- writes to stderr.  When off, span()
+# returns a shared no-op object, so instrumented code costs one function
+# call per span.  configure() turns it on from code (e.g. a --trace flag).
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_PATH = Path(__file__).resolve().parent.parent / ".cache" / "trace.jsonl"
+
+_current = contextvars.ContextVar("tracing_span", default=None)
+_exporter = None
+
+
+class JsonLinesExporter:
+    """Append one JSON object per finished span to a file (or stderr)."""
+
+    def __init__(self, target):
+        self._lock = threading.Lock()
+        if target == "-":
+            self._out, self._owned = sys.stderr, False
+        else:
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+            self._out, self._owned = open(target, "a", encoding="utf-8", buffering=1), True
+
+    def export(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._out.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            if self._owned:
+                self._out.close()
+            else:
+                self._out.flush()
+
+
+def configure(target=None):
+    """Enable tracing to `target` (path or '-'); None/'' or '0' disables it."""
+    global _exporter
+    if _exporter is not None:
+        _exporter.close()
+        _exporter = None
+    if target in (None, "", "0"):
+        return
+    _exporter = JsonLinesExporter(DEFAULT_PATH if target == "1" else target)
+
+
+def enabled():
+    return _exporter is not None
+
+
+class Span:
+    """A timed operation; use as a context manager or call end() yourself."""
+
+    __slots__ = ("name", "attributes", "trace_id", "span_id", "parent_id",
+                 "start", "_t0", "_token", "_ended")
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self._token = None
+        self._ended = False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def end(self, error=None, **attributes):
+        if self._ended:
+            return
+        self._ended = True
+        self.attributes.update(attributes)
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round((time.perf_counter() - self._t0) * 1000, 3),
+            "attributes": self.attributes,
+            "status": "error" if error is not None else "ok",
+        }
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        exporter = _exporter
+        if exporter is not None:
+            exporter.export(record)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.end(error=exc)
+        return False
+
+
+class _NoopSpan:
+    """Returned while tracing is off: every method does nothing."""
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        return self
+
+    def end(self, error=None, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP = _NoopSpan()
+
+
+def span(name, **attributes):
+    """Context manager: a child of the current span (or a new trace)."""
+    if _exporter is None:
+        return NOOP
+    return Span(name, _current.get(), attributes)
+
+
+def start_span(name, **attributes):
+    """A span that is ended explicitly (e.g. around a generator) and never becomes current."""
+    return span(name, **attributes)
+
+
+@contextlib.contextmanager
+def activate(sp):
+    """Make a start_span() span current for a block without ending it."""
+    if not isinstance(sp, Span):
+        yield sp
+        return
+    token = _current.set(sp)
+    try:
+        yield sp
+    finally:
+        _current.reset(token)
+
+
+def annotate(**attributes):
+    """Add attributes to the current span, if any."""
+    if _exporter is not None:
+        current = _current.get()
+        if current is not None:
+            current.set(**attributes)
+
+
+def usage(completion):
+    """Token counts of a chat completion as span attributes ({} if absent)."""
+    counts = getattr(completion, "usage", None)
+    if counts is None:
+        return {}
+    return {"prompt_tokens": counts.prompt_tokens, "completion_tokens": counts.completion_tokens}
+
+
+def traced(name=None):
+    """Decorator: run each call (sync or async) inside a span named `name` or after the function."""
+    def decorate(fn):
+        label = name or fn.__qualname__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if _exporter is None:
+                    return await fn(*args, **kwargs)
+                with span(label):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _exporter is None:
+                return fn(*args, **kwargs)
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def bind(fn):
+    """`fn` run in the caller's context, so spans it opens in another thread nest correctly."""
+    if _exporter is None:
+        return fn
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+configure(os.environ.get("TRACE"))
@@ -10,18 +10,51 @@ two tool calls:
     convert_c_to_f(c)       → °F
 
 The script prints the complete TAO trace on every run.
+
+Cities listed in the offline gazetteer are found in the prompt by a
+local multi-pattern matcher, so the model is only asked to extract a
+city it does not know; the share of prompts resolved locally is printed
+on exit.
+
+One event loop, one MCP session and one Ollama client are kept for the
+whole process, so a question only pays for its tool and model calls.
+If the MCP server goes away the session reconnects transparently on
+the next tool call.
+
+Plan templates
+--------------
+Planning is deterministic for known tool chains, so (unless
+PLAN_TEMPLATES=0) the agent writes those steps itself instead of asking
+the model:
+
+* step 1 — if the city is in the offline gazetteer (code/gazetteer.py),
+  `get_weather` is planned with its coordinates;
+* step 2 — `convert_c_to_f` always follows `get_weather`.
+
+Synthesized steps are marked `[template]` in the TAO trace; the LLM is
+only consulted when no template applies.
 """
 
 import asyncio
+import contextlib
 import json
+import os
 import re
+import sys
 import textwrap
+from pathlib import Path
 from typing import Optional
 
 from fastmcp import Client
 from fastmcp.exceptions import ToolError
 from langchain_ollama import ChatOllama   # local Llama-3.2 wrapper
 
+# Offline city table shared with the travel assistants in code/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "code"))
+from gazetteer import get_gazetteer
+from city_extractor import get_extractor
+import tracing                           # spans, recorded when TRACE is set
+
 # ──────────────────────────────────────────────────────────────────
 # 1.  System prompt that defines the TAO protocol
 # ──────────────────────────────────────────────────────────────────
@@ -45,6 +78,11 @@ Do NOT output anything else.
 
 ARGS_RE = re.compile(r"Args:\s*(\{.*?\})(?:\s|$)", re.S)
 
+MCP_URL = os.environ.get("MCP_URL", "http://127.0.0.1:8000/mcp/")
+
+# Skip LLM planning round trips for known tool chains (see docstring)
+PLAN_TEMPLATES = os.environ.get("PLAN_TEMPLATES", "1") != "0"
+
 # ──────────────────────────────────────────────────────────────────
 # 2.  Robust unwrap helper (works with all FastMCP versions)
 # ──────────────────────────────────────────────────────────────────
@@ -70,83 +108,184 @@ def unwrap(obj):
     return obj
 
 # ──────────────────────────────────────────────────────────────────
-# 3.  LLM-only city extractor
+# 3.  Long-lived MCP session (reconnects when the server went away)
 # ──────────────────────────────────────────────────────────────────
-extract_llm = ChatOllama(model="llama3.2", temperature=0.0)
+class MCPSession:
+    """
+    Keep one FastMCP `Client` connected across questions.
 
-def extract_city(prompt: str) -> Optional[str]:
+    `call_tool` opens the connection lazily; if the call fails for any
+    reason other than the tool itself raising (`ToolError`), the
+    connection is dropped, re-opened and the call retried once.
     """
-    Ask the LLM to pull a city name from a prompt.
+
+    def __init__(self, url: str = MCP_URL):
+        self.url = url
+        self._client: Optional[Client] = None
+        self._stack: Optional[contextlib.AsyncExitStack] = None
+
+    async def connect(self) -> Client:
+        if self._client is None or not self._client.is_connected():
+            await self.close()
+            stack = contextlib.AsyncExitStack()
+            self._client = await stack.enter_async_context(Client(self.url))
+            self._stack = stack
+        return self._client
+
+    async def close(self) -> None:
+        stack, self._stack, self._client = self._stack, None, None
+        if stack is not None:
+            with contextlib.suppress(Exception):
+                await stack.aclose()
+
+    async def call_tool(self, name: str, args: dict):
+        with tracing.span("mcp.call_tool", tool=name) as sp:
+            for attempt in (1, 2):
+                sp.set(attempts=attempt)
+                client = await self.connect()
+                try:
+                    return await client.call_tool(name, args)
+                except ToolError:
+                    raise                       # the tool ran and failed: no retry
+                except Exception:
+                    await self.close()          # stale/broken connection
+                    if attempt == 2:
+                        raise
+
+# ──────────────────────────────────────────────────────────────────
+# 4.  City extractor (local gazetteer match, LLM fallback)
+# ──────────────────────────────────────────────────────────────────
+# One ChatOllama (and its pooled HTTP client) for the whole process;
+# the Ollama client honours OLLAMA_HOST (e.g. the benchmarks/ stub)
+llm = ChatOllama(model="llama3.2", temperature=0.0)
+
+async def extract_city(prompt: str) -> Optional[str]:
+    """
+    Pull a city name from a prompt.  Known cities are matched locally
+    (code/city_extractor.py); only otherwise is the LLM asked.
     Returns None if it replies 'NONE'.
     """
-    ask = (
-        "Return ONLY the city name mentioned here (no country or state). "
-        "If none, reply exactly 'NONE'.\n\n"
-        + prompt
-    )
-    reply = extract_llm.invoke(ask).content.strip()
-    return None if reply.upper() == "NONE" else reply
+    with tracing.span("extract_city") as sp:
+        city = get_extractor().extract(prompt)
+        sp.set(source="local" if city else "llm")
+        if city:
+            return city
+        ask = (
+            "Return ONLY the city name mentioned here (no country or state). "
+            "If none, reply exactly 'NONE'.\n\n"
+            + prompt
+        )
+        with tracing.span("llm.extract_city", model=llm.model):
+            reply = (await llm.ainvoke(ask)).content.strip()
+        return None if reply.upper() == "NONE" else reply
 
 # ──────────────────────────────────────────────────────────────────
-# 4.  One TAO episode (async because MCP calls are async)
+# 5.  Plan templates for deterministic steps
 # ──────────────────────────────────────────────────────────────────
-async def run(question: str) -> None:
-    llm = ChatOllama(model="llama3.2", temperature=0.0)
+def format_plan(thought: str, action: str, args: dict) -> str:
+    """Render a step in exactly the three-line format the LLM is asked for."""
+    return f"Thought: {thought}\nAction: {action}\nArgs: {json.dumps(args)}"
 
-    async with Client("http://127.0.0.1:8000/mcp/") as mcp:
-        messages = [
-            {"role": "system", "content": SYSTEM},
-            {"role": "user",   "content": question},
-        ]
+def template_get_weather(city: Optional[str]) -> Optional[str]:
+    """Step 1 without the LLM, when the city's coordinates are known locally."""
+    coords = get_gazetteer().lookup(city) if city else None
+    if coords is None:
+        return None
+    lat, lon = coords
+    return format_plan(f"I need the current weather in {city}.",
+                       "get_weather", {"lat": lat, "lon": lon})
 
-        print("\n--- Thought → Action → Observation → Final ---\n")
+def template_after_get_weather(observation: dict) -> str:
+    """Step 2 is always the Celsius → Fahrenheit conversion."""
+    return format_plan("I have the temperature in °C; convert it to °F.",
+                       "convert_c_to_f", {"c": observation.get("temperature")})
 
-        # 1. Planning step → get_weather
-        plan1 = llm.invoke(messages).content.strip()
-        print(plan1 + "\n")
-        args1 = json.loads(ARGS_RE.search(plan1).group(1))
+def print_plan(plan: str, synthesized: bool) -> None:
+    print(plan + ("\n[template] step synthesized, no LLM call" if synthesized else "") + "\n")
 
-        try:
-            res1 = unwrap(await mcp.call_tool("get_weather", args1))
-        except ToolError as e:
-            print(f"Error: get_weather failed ({e})\n")
-            return
+# ──────────────────────────────────────────────────────────────────
+# 6.  One TAO episode (async because MCP calls are async)
+# ──────────────────────────────────────────────────────────────────
+async def run(question: str, mcp: MCPSession, city: Optional[str] = None) -> None:
+    messages = [
+        {"role": "system", "content": SYSTEM},
+        {"role": "user",   "content": question},
+    ]
+
+    print("\n--- Thought → Action → Observation → Final ---\n")
+
+    # 1. Planning step → get_weather
+    plan1 = template_get_weather(city) if PLAN_TEMPLATES else None
+    if plan1 is not None:
+        print_plan(plan1, synthesized=True)
+    else:
+        with tracing.span("llm.plan", model=llm.model, step=1):
+            plan1 = (await llm.ainvoke(messages)).content.strip()
+        print_plan(plan1, synthesized=False)
+    args1 = json.loads(ARGS_RE.search(plan1).group(1))
 
-        temp_c = res1.get("temperature")
-        cond   = res1.get("conditions", "Unknown")
-        print(f"Observation: {{'temperature': {temp_c}, 'conditions': '{cond}'}}\n")
+    try:
+        res1 = unwrap(await mcp.call_tool("get_weather", args1))
+    except ToolError as e:
+        print(f"Error: get_weather failed ({e})\n")
+        return
 
-        # 2. Planning step → convert_c_to_f
+    temp_c = res1.get("temperature")
+    cond   = res1.get("conditions", "Unknown")
+    print(f"Observation: {{'temperature': {temp_c}, 'conditions': '{cond}'}}\n")
+
+    # 2. Planning step → convert_c_to_f
+    if PLAN_TEMPLATES:
+        print_plan(template_after_get_weather(res1), synthesized=True)
+    else:
         messages += [
             {"role": "assistant", "content": plan1},
             {"role": "user",      "content": f"Observation: {temp_c}"},
         ]
-        plan2 = llm.invoke(messages).content.strip()
-        print(plan2 + "\n")
+        with tracing.span("llm.plan", model=llm.model, step=2):
+            plan2 = (await llm.ainvoke(messages)).content.strip()
+        print_plan(plan2, synthesized=False)
 
-        try:
-            raw = await mcp.call_tool("convert_c_to_f", {"c": temp_c})
-            temp_f = float(unwrap(raw))
-        except (ToolError, ValueError) as e:
-            print(f"Error: convert_c_to_f failed ({e})\n")
-            return
+    try:
+        raw = await mcp.call_tool("convert_c_to_f", {"c": temp_c})
+        temp_f = float(unwrap(raw))
+    except (ToolError, ValueError) as e:
+        print(f"Error: convert_c_to_f failed ({e})\n")
+        return
 
-        print(f"Observation: {{'temperature_f': {temp_f}}}\n")
-        print(f"Final: {cond} ({temp_f:.1f} °F)\n")
+    print(f"Observation: {{'temperature_f': {temp_f}}}\n")
+    print(f"Final: {cond} ({temp_f:.1f} °F)\n")
 
 # ──────────────────────────────────────────────────────────────────
-# 5.  Simple REPL
+# 7.  Simple REPL (one event loop + one MCP session for all questions)
 # ──────────────────────────────────────────────────────────────────
-if __name__ == "__main__":
-    print("Weather TAO agent (LLM extraction, 'exit' to quit)\n")
-    while True:
-        raw_prompt = input("Ask about the weather: ").strip()
-        if raw_prompt.lower() == "exit":
-            break
+async def repl() -> None:
+    mcp = MCPSession()
+    try:
+        while True:
+            # input() blocks, so run it off the loop
+            raw_prompt = (await asyncio.to_thread(input, "Ask about the weather: ")).strip()
+            if raw_prompt.lower() == "exit":
+                break
 
-        city = extract_city(raw_prompt)
-        if not city or len(city) < 3:
-            print("No city detected; please try again.\n")
-            continue
+            with tracing.span("mcp_agent.question", prompt_chars=len(raw_prompt)) as sp:
+                city = await extract_city(raw_prompt)
+                sp.set(city=city)
+                if not city or len(city) < 3:
+                    print("No city detected; please try again.\n")
+                    continue
 
-        asyncio.run(run(f"What is the current weather in {city}?"))
+                try:
+                    await run(f"What is the current weather in {city}?", mcp, city)
+                except Exception as e:          # e.g. MCP server unreachable
+                    sp.set(failed=True)
+                    print(f"Error: {e}\n")
+    except EOFError:
+        pass
+    finally:
+        await mcp.close()
+        print(get_extractor().summary())
+
+if __name__ == "__main__":
+    print("Weather TAO agent (LLM extraction, 'exit' to quit)\n")
+    asyncio.run(repl())
@@ -2,16 +2,34 @@
 """
 weather_server.py
 ────────────────────────────────────────────────────────────────────────
-A *minimal* FastMCP server that exposes two JSON-RPC tools:
+A *minimal* FastMCP server that exposes these JSON-RPC tools:
 
-    1. get_weather(lat, lon)  → dict with °C, WMO code, description
-    2. convert_c_to_f(c)      → float (°F)
+    1. get_weather(lat, lon)       → dict with °C, WMO code, description
+    2. get_weather_many(points)    → one such dict (or error) per point
+    3. convert_c_to_f(c)           → float (°F)
+    4. weather_cache_stats()       → cache hit ratio + upstream call counts
 
 Key design points
 -----------------
-* **Retry logic**: get_weather will automatically retry the upstream
-  Open-Meteo call up to three total attempts (initial + 2 retries) on
-  quota (429) or transient (5xx) errors, waiting 1.5 s, then 2.25 s.
+* **Weather cache**: current conditions barely change within minutes, so
+  results are cached per lat/lon grid cell (WEATHER_GRID_DEG, default
+  0.01° ≈ 1 km) for WEATHER_CACHE_TTL seconds (default 300), keeping at
+  most WEATHER_CACHE_SIZE cells (default 4096, least recently used
+  evicted).  Concurrent misses for the same cell share one in-flight
+  upstream request ("single-flight"), so a burst of agents asking about
+  one city costs a single Open-Meteo call.
+* **Batching**: get_weather_many dedupes points, serves cached cells,
+  and groups the rest into multi-location Open-Meteo requests; a bad
+  point only fails its own entry.
+* **Non-blocking upstream calls**: get_weather is an ``async`` tool that
+  talks to Open-Meteo through one pooled ``httpx.AsyncClient``, so a
+  single server process can have many weather requests in flight
+  without tying up workers.
+* **Retry logic**: one policy, in our own code (no transport-level
+  retries stacked underneath): up to three total attempts (initial + 2
+  retries) on network errors, quota (429) or transient (5xx) errors,
+  sleeping 1.5 s, then 2.25 s with ``asyncio.sleep``.  Each attempt has
+  a REQUEST_TIMEOUT and the whole call a REQUEST_DEADLINE.
 * **No custom FastMCP options**: we rely on the *default* HTTP transport,
   which means clients must send the usual three headers:
 
@@ -25,15 +43,22 @@ Key design points
 from __future__ import annotations
 
 # ── stdlib ──────────────────────────────────────────────────────────
+import asyncio
+import os
+import sys
 import time
-from typing import Final
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Final, Optional
 
 # ── 3rd-party ───────────────────────────────────────────────────────
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import httpx
 from fastmcp import FastMCP
 
+# ── shared helpers from code/ ───────────────────────────────────────
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "code"))
+import tracing                           # spans, recorded when TRACE is set
+
 # ╔══════════════════════════════════════════════════════════════════╗
 # 1.  Weather-code ➜ human-readable description lookup table         ║
 # ╚══════════════════════════════════════════════════════════════════╝
@@ -56,80 +81,321 @@ WEATHER_CODES: Final[dict[int, str]] = {
 }
 
 # ╔══════════════════════════════════════════════════════════════════╗
-# 2.  Build a requests.Session with automatic retries                ║
+# 2.  Pooled async HTTP client + retry policy                        ║
 # ╚══════════════════════════════════════════════════════════════════╝
-MAX_RETRIES    = 3       # total attempts = 1 original + 2 retries
-BACKOFF_FACTOR = 1.5     # 1.5 s, then 2.25 s, …
-TRANSIENT_CODES = {429, 500, 502, 503, 504}
+OPEN_METEO_URL   = os.environ.get("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+MAX_RETRIES      = 3       # total attempts = 1 original + 2 retries
+BACKOFF_FACTOR   = 1.5     # 1.5 s, then 2.25 s, …
+TRANSIENT_CODES  = {429, 500, 502, 503, 504}
+REQUEST_TIMEOUT  = 15.0    # seconds, per attempt
+REQUEST_DEADLINE = 30.0    # seconds, whole call incl. retries + back-off
+MAX_CONNECTIONS  = 20      # pooled upstream connections
+
+class TransientUpstreamError(Exception):
+    """Open-Meteo answered 429/5xx — worth retrying."""
 
-retry_cfg = Retry(
-    total=MAX_RETRIES - 1,          # urllib3 counts *retries*
-    backoff_factor=BACKOFF_FACTOR,  # exponential delay
-    status_forcelist=list(TRANSIENT_CODES),
-    allowed_methods=["GET"],
-    raise_on_status=False,          # we raise manually after inspecting code
-)
+_http: Optional[httpx.AsyncClient] = None
 
-session = requests.Session()
-session.mount("https://", HTTPAdapter(max_retries=retry_cfg))
+def http_client() -> httpx.AsyncClient:
+    """
+    Shared keep-alive client, created on first use so it binds to the
+    server's running event loop.
+    """
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                max_keepalive_connections=MAX_CONNECTIONS),
+        )
+    return _http
 
 # ╔══════════════════════════════════════════════════════════════════╗
-# 3.  Instantiate FastMCP and define tool functions                  ║
+# 3.  Grid-keyed TTL cache with single-flight request coalescing     ║
+# ╚══════════════════════════════════════════════════════════════════╝
+CACHE_TTL = float(os.environ.get("WEATHER_CACHE_TTL", 300))   # seconds
+GRID_DEG  = float(os.environ.get("WEATHER_GRID_DEG", 0.01))   # cell size
+CACHE_SIZE = int(os.environ.get("WEATHER_CACHE_SIZE", 4096))  # cells kept (LRU)
+MAX_POINTS_PER_REQUEST = 100   # Open-Meteo multi-location batch size
+
+Cell = tuple[int, int]
+# fetch_many(coords) → one weather dict *or* exception per coordinate
+FetchMany = Callable[[list[tuple[float, float]]], Awaitable[list]]
+
+class WeatherCache:
+    """
+    Cache of weather dicts keyed on (lat, lon) snapped to a GRID_DEG grid.
+
+    The first caller that misses a cell becomes the *leader* and starts
+    the upstream fetch as a task of its own (so it completes even if the
+    leader is cancelled); callers that miss the same cell while that
+    fetch is running await its Future instead of issuing their own request.
+    Failures are not cached: every waiter sees the exception and the next
+    call retries.
+
+    Lookups are batch-shaped: `get_many()` dedupes cells, answers what it
+    can from the cache, and fetches the rest in as few upstream requests
+    as `max_batch` allows.  `get_or_fetch()` is the one-point case.
+    At most `max_entries` cells are kept (least recently used go first)
+    and an expired cell is dropped when it is next looked up.
+
+    All bookkeeping happens between ``await`` points on the server's
+    event loop, so no lock is needed.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL, grid: float = GRID_DEG,
+                 max_entries: int = CACHE_SIZE) -> None:
+        self.ttl  = ttl
+        self.grid = grid
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Cell, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[Cell, asyncio.Future] = {}
+        self._tasks: set[asyncio.Task] = set()       # running batch fetches
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+
+    def cell(self, lat: float, lon: float) -> Cell:
+        """Integer grid cell for a coordinate (stable dict key)."""
+        return round(lat / self.grid), round(lon / self.grid)
+
+    def centre(self, key: Cell) -> tuple[float, float]:
+        """Coordinate we actually ask upstream for: the cell centre."""
+        return round(key[0] * self.grid, 6), round(key[1] * self.grid, 6)
+
+    async def get_or_fetch(self, lat: float, lon: float, fetch_many: FetchMany) -> dict:
+        """Weather for one point; raises if the upstream fetch failed."""
+        (result,) = await self.get_many([(lat, lon)], fetch_many)
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    async def get_many(self, points: list[tuple[float, float]], fetch_many: FetchMany,
+                       max_batch: int = MAX_POINTS_PER_REQUEST) -> list:
+        """
+        One result per point, in order: a weather dict, or the exception
+        that prevented fetching it.
+        """
+        keys = [self.cell(lat, lon) for lat, lon in points]
+        outcomes: dict[Cell, object] = {}
+        waiting: dict[Cell, asyncio.Future] = {}
+        to_fetch: list[Cell] = []
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+
+        for key in dict.fromkeys(keys):               # dedupe, keep order
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                outcomes[key] = entry[1]
+                continue
+            if entry:
+                del self._entries[key]                # expired
+            self.misses += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                waiting[key] = future
+            else:
+                waiting[key] = self._inflight[key] = loop.create_future()
+                to_fetch.append(key)
+
+        batches = [to_fetch[i:i + max_batch] for i in range(0, len(to_fetch), max_batch)]
+        self.upstream_calls += len(batches)
+        tracing.annotate(cache_hits=len(outcomes),
+                         coalesced=len(waiting) - len(to_fetch), fetched=len(to_fetch))
+        # Each batch runs as its own task: if this caller is cancelled, the
+        # fetch still finishes for everyone coalesced onto its cells.
+        for batch in batches:
+            task = asyncio.create_task(self._fetch_batch(batch, fetch_many))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        for key, future in waiting.items():
+            try:
+                # shield: one cancelled waiter must not cancel the shared fetch
+                outcomes[key] = await asyncio.shield(future)
+            except Exception as exc:
+                outcomes[key] = exc
+
+        return [dict(r) if isinstance(r, dict) else r for r in (outcomes[k] for k in keys)]
+
+    async def _fetch_batch(self, batch: list[Cell], fetch_many: FetchMany) -> None:
+        """Fetch one upstream batch and resolve the futures of its cells."""
+        try:
+            results = await fetch_many([self.centre(k) for k in batch])
+        except asyncio.CancelledError:
+            # only at shutdown: waiters get an error result, not a CancelledError
+            results = [RuntimeError("weather fetch cancelled")] * len(batch)
+        except Exception as exc:
+            self.upstream_errors += 1
+            results = [exc] * len(batch)
+
+        for key, result in zip(batch, results):
+            future = self._inflight.pop(key)
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+                future.exception()        # mark retrieved if nobody was waiting
+            else:
+                self._remember(key, result)
+                future.set_result(result)
+
+    def _remember(self, key: Cell, result: dict) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits":            self.hits,
+            "misses":          self.misses,
+            "coalesced":       self.coalesced,
+            "hit_ratio":       self.hits / lookups if lookups else 0.0,
+            "upstream_calls":  self.upstream_calls,
+            "upstream_errors": self.upstream_errors,
+            "entries":         len(self._entries),
+        }
+
+weather_cache = WeatherCache()
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# 4.  Instantiate FastMCP and define tool functions                  ║
 # ╚══════════════════════════════════════════════════════════════════╝
 mcp = FastMCP("WeatherServer")
 
-@mcp.tool
-def get_weather(lat: float, lon: float) -> dict:
+async def fetch_forecast_json(params: dict):
     """
-    Fetch **current weather** from Open-Meteo and return a concise dict.
+    GET Open-Meteo with our single retry policy and return the JSON body.
 
     Retry policy
     ------------
-    * Up to MAX_RETRIES total attempts.
-    * Retries on network errors **or** HTTP 429/5xx.
-    * Exponential back-off (1.5 s, 2.25 s, …).
-
-    Parameters
-    ----------
-    lat, lon : float
-        Geographic coordinates in decimal degrees.
-
-    Returns
-    -------
-    dict
+    * Up to MAX_RETRIES total attempts, each limited to REQUEST_TIMEOUT.
+    * Retries on network errors **or** HTTP 429/5xx; other 4xx fail fast.
+    * Exponential back-off (1.5 s, 2.25 s, …) without blocking the loop.
+    * The whole call, back-off included, is capped at REQUEST_DEADLINE.
+    """
+    async def attempt_loop():
+        for attempt in range(1, MAX_RETRIES + 1):
+            tracing.annotate(attempts=attempt)
+            try:
+                resp = await http_client().get(OPEN_METEO_URL, params=params)
+
+                if resp.status_code in TRANSIENT_CODES:
+                    # Force a retry for quota / backend errors
+                    raise TransientUpstreamError(f"Open-Meteo HTTP {resp.status_code}")
+                resp.raise_for_status()
+                return resp.json()
+
+            except (httpx.TransportError, TransientUpstreamError, ValueError):
+                # Re-raise on final attempt, otherwise wait and retry
+                if attempt == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(BACKOFF_FACTOR ** (attempt - 1))
+
+    with tracing.span("http.open_meteo"):
+        return await asyncio.wait_for(attempt_loop(), timeout=REQUEST_DEADLINE)
+
+def parse_current_weather(item: dict) -> dict:
+    """
+    Turn one Open-Meteo location object into our concise dict:
+
         {
             "temperature": <float °C>,
             "code":        <int WMO weathercode>,
             "conditions":  <friendly description>
         }
     """
-    url = (
-        "https://api.open-meteo.com/v1/forecast"
-        f"?latitude={lat}&longitude={lon}&current_weather=true"
-    )
+    cw = item["current_weather"]
+    code = cw["weathercode"]
+    return {
+        "temperature": cw["temperature"],
+        "code":        code,
+        "conditions":  WEATHER_CODES.get(code, "Unknown"),
+    }
+
+async def fetch_current_weather_many(coords: list[tuple[float, float]]) -> list:
+    """
+    Fetch **current weather** for several coordinates in one request
+    (Open-Meteo accepts comma-separated latitude/longitude lists).
+
+    Returns one weather dict per coordinate, in order — or, for a
+    location whose entry is malformed, the exception describing why.
+    """
+    params = {
+        "latitude":        ",".join(str(lat) for lat, _ in coords),
+        "longitude":       ",".join(str(lon) for _, lon in coords),
+        "current_weather": "true",
+    }
+    data = await fetch_forecast_json(params)
+    items = data if isinstance(data, list) else [data]   # 1 location → object
+    if len(items) != len(coords):
+        raise ValueError(f"Open-Meteo returned {len(items)} locations for {len(coords)}")
 
-    for attempt in range(1, MAX_RETRIES + 1):
+    results = []
+    for item in items:
         try:
-            resp = session.get(url, timeout=15)
-
-            if resp.status_code in TRANSIENT_CODES:
-                # Force a retry for quota / backend errors
-                raise requests.HTTPError(resp.status_code)
-            resp.raise_for_status()
-
-            cw = resp.json()["current_weather"]
-            code = cw["weathercode"]
-            return {
-                "temperature": cw["temperature"],
-                "code":        code,
-                "conditions":  WEATHER_CODES.get(code, "Unknown"),
-            }
-
-        except (requests.RequestException, KeyError, ValueError):
-            # Re-raise on final attempt, otherwise wait and retry
-            if attempt == MAX_RETRIES:
-                raise
-            time.sleep(BACKOFF_FACTOR ** (attempt - 1))
+            results.append(parse_current_weather(item))
+        except (KeyError, TypeError) as exc:
+            results.append(ValueError(f"malformed Open-Meteo entry: {exc!r}"))
+    return results
+
+@mcp.tool
+async def get_weather(lat: float, lon: float) -> dict:
+    """
+    Current weather at (lat, lon): temperature (°C), WMO code and a
+    description.  Served from a short-lived cache when possible.
+    """
+    with tracing.span("tool.get_weather", lat=lat, lon=lon):
+        return await weather_cache.get_or_fetch(lat, lon, fetch_current_weather_many)
+
+@mcp.tool
+async def get_weather_many(points: list[dict]) -> list[dict]:
+    """
+    Current weather for many points at once.
+
+    `points` is a list of {"lat": float, "lon": float}.  Returns one dict
+    per point, in the same order: {"lat", "lon", "temperature", "code",
+    "conditions"} on success or {"lat", "lon", "error"} if that point
+    failed.  Duplicate and cached points cost no upstream requests, and
+    the rest are fetched in batches of up to MAX_POINTS_PER_REQUEST.
+    """
+    coords: list[Optional[tuple[float, float]]] = []
+    for point in points:
+        try:
+            lat, lon = float(point["lat"]), float(point["lon"])
+        except (KeyError, TypeError, ValueError):
+            coords.append(None)
+            continue
+        coords.append((lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None)
+
+    valid = [c for c in coords if c is not None]
+    with tracing.span("tool.get_weather_many", points=len(points), valid=len(valid)):
+        fetched = iter(await weather_cache.get_many(valid, fetch_current_weather_many))
+
+    results = []
+    for point, coord in zip(points, coords):
+        if coord is None:
+            results.append({"lat": point.get("lat") if isinstance(point, dict) else None,
+                            "lon": point.get("lon") if isinstance(point, dict) else None,
+                            "error": "expected numeric lat in [-90, 90] and lon in [-180, 180]"})
+            continue
+        outcome = next(fetched)
+        if isinstance(outcome, BaseException):
+            results.append({"lat": coord[0], "lon": coord[1],
+                            "error": str(outcome) or type(outcome).__name__})
+        else:
+            results.append({"lat": coord[0], "lon": coord[1], **outcome})
+    return results
+
+@mcp.tool
+def weather_cache_stats() -> dict:
+    """Weather cache hit ratio and how many upstream requests were made."""
+    return weather_cache.stats()
 
 @mcp.tool
 def convert_c_to_f(c: float) -> float:
@@ -137,14 +403,14 @@ def convert_c_to_f(c: float) -> float:
     return c * 9 / 5 + 32
 
 # ╔══════════════════════════════════════════════════════════════════╗
-# 4.  Start the FastMCP HTTP server                                  ║
+# 5.  Start the FastMCP HTTP server                                  ║
 # ╚══════════════════════════════════════════════════════════════════╝
 if __name__ == "__main__":
     # `transport="http"` uses FastAPI + Uvicorn under the hood
-    # Endpoint: POST http://127.0.0.1:8000/mcp/
+    # Endpoint: POST http://127.0.0.1:8000/mcp/  (MCP_HOST / MCP_PORT override)
     mcp.run(
         transport="http",
-        host="127.0.0.1",
-        port=8000,
+        host=os.environ.get("MCP_HOST", "127.0.0.1"),
+        port=int(os.environ.get("MCP_PORT", 8000)),
         path="/mcp/",
     )
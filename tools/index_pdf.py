@@ -3,8 +3,8 @@
 """
 index_pdfs.py
 ────────────────────────────────────────────────────────────────────
-Create a **fresh** ChromaDB vector-index from the contents of every PDF
-inside `./data/`, embedding **each non-blank line** with the
+Create a ChromaDB vector-index from the contents of every PDF inside
+`./data/`, embedding **token-bounded windows of lines** with the
 *all-MiniLM-L6-v2* Sentence-BERT model.
 
 High-level flow
@@ -13,24 +13,63 @@ High-level flow
    embeddings from previous runs.
 2. **Collect PDFs** – scan `./data/*.pdf`.
 3. **Extract lines** – use *pdfplumber* to pull plain text from each page,
-   split on newlines, drop blank lines.
-4. **Embed** – convert each line to a 384-dimensional vector
-   (MiniLM-L6-v2).
-5. **Store** – write `(vector, raw line, metadata)` into a persistent
-   Chroma collection called `"codebase"`.
+   split on newlines, drop blank lines; remember each line's page and
+   line number.
+4. **Chunk** – pack consecutive lines into windows of at most
+   `--chunk-tokens` tokens (counted with *tiktoken*), each window
+   repeating the last `--chunk-overlap` tokens' worth of lines of the one
+   before, so a fact is never cut off at a window edge.  Lines are never
+   split unless a single line is longer than a whole window.
+   `--chunking lines` restores the old one-vector-per-line index.
+5. **Embed** – convert chunks to 384-dimensional vectors (MiniLM-L6-v2)
+   in batches of `--batch-size` chunks per forward pass; vectors are
+   L2-normalised float32.
+6. **Store** – write each batch of `(vector, chunk text, metadata)` into a
+   persistent Chroma collection called `"codebase"` with one bulk `add`.
+   Metadata carries `path`, `chunk_index`, `page`/`line_start` and
+   `page_end`/`line_end`, so `tools/search.py` can cite its sources.
+
+Fewer, larger vectors make the collection smaller and every query
+cheaper; `benchmarks/chunking.py` compares both modes on vector count,
+query latency and recall.  Throughput (chunks/sec) is printed at the end
+so the batch size can be tuned against available memory:
+
+    python tools/index_pdf.py --batch-size 128
+
+Incremental mode
+----------------
+`--incremental` skips step 1.  A manifest (`./chroma_db/manifest.json`)
+records a SHA-256 per PDF and a hash per chunk; on the next run
+
+* unchanged PDFs (same file hash) are not even parsed,
+* changed PDFs only re-embed chunks whose hash differs and `upsert` them,
+* IDs of chunks past the new end of a file, and of PDFs that were
+  removed from `./data/`, are deleted from the collection.
+
+A no-op re-index therefore never loads the embedding model.  If the
+manifest is missing or was built with another model or other chunking
+settings the run falls back to a full rebuild.  `index_is_stale()` answers "would a re-index change
+anything?" from the manifest alone; `code/rag.py` uses it to decide
+whether it can open the existing index as-is.
 
 After it finishes you can query the vectors with any Chroma-compatible
 client or the companion RAG script.
 """
 
 # ───────────────────── standard-library imports ────────────────────
+import argparse
+import hashlib
+import json
 import shutil
 import re
+import time
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 
 # ───────────────────── 3rd-party imports ───────────────────────────
+import numpy as np
 import pdfplumber                               # PDF text extractor
+import tiktoken                                 # token counts for chunking
 from sentence_transformers import SentenceTransformer
 from chromadb import PersistentClient
 from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
@@ -40,8 +79,18 @@ from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
 # ╚════════════════════════════════════════════════════════════════╝
 PDF_DIR          = Path("./data")              # where to look for *.pdf
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"          # SBERT model on HF Hub
-CHROMA_PATH      = Path("./chroma_db")         # output folder (wiped each run)
+CHROMA_PATH      = Path("./chroma_db")         # output folder
 COLLECTION_NAME  = "codebase"                  # logical collection inside DB
+BATCH_SIZE       = 64                          # chunks per encode/add call
+MANIFEST_NAME    = "manifest.json"             # content hashes (incremental)
+CHUNKING         = "tokens"                    # "tokens" (windows) or "lines"
+CHUNK_TOKENS     = 96                          # max tokens per window
+CHUNK_OVERLAP    = 24                          # tokens repeated between windows
+TOKEN_ENCODING   = "cl100k_base"               # tiktoken encoding used to count
+
+Record = Tuple[str, str, dict]                 # (id, text, metadata)
+Line   = Tuple[int, int, str]                  # (page, line, text), 1-based
+Chunk  = Tuple[str, dict]                      # (text, location metadata)
 
 # ╔════════════════════════════════════════════════════════════════╗
 # 2.  Regex helper: split lines & trim whitespace                  ║
@@ -50,9 +99,9 @@ COLLECTION_NAME  = "codebase"                  # logical collection inside DB
 #   • `[^\S\r\n]*` = optional leading/trailing spaces or tabs
 LINE_RE = re.compile(r"[^\S\r\n]*\r?\n[^\S\r\n]*")
 
-def extract_lines(path: Path) -> List[str]:
+def extract_page_lines(path: Path) -> List[Line]:
     """
-    Read a PDF and return *every* non-blank line, preserving order.
+    Read a PDF and return *every* non-blank line with its position.
 
     Parameters
     ----------
@@ -61,19 +110,24 @@ def extract_lines(path: Path) -> List[str]:
 
     Returns
     -------
-    List[str]
-        One entry per non-empty line (page order kept).
+    List[Line]
+        `(page, line, text)` per non-empty line, page order kept; `line`
+        counts the lines of the page's extracted text, blanks included.
     """
-    lines: List[str] = []
+    lines: List[Line] = []
     with pdfplumber.open(path) as pdf:
-        for page in pdf.pages:
+        for page_no, page in enumerate(pdf.pages, start=1):
             text = page.extract_text() or ""
-            for raw_line in LINE_RE.split(text):
+            for line_no, raw_line in enumerate(LINE_RE.split(text), start=1):
                 line = raw_line.strip()
                 if line:                      # skip blanks
-                    lines.append(line)
+                    lines.append((page_no, line_no, line))
     return lines
 
+def extract_lines(path: Path) -> List[str]:
+    """Every non-blank line of a PDF as plain text, page order kept."""
+    return [text for _, _, text in extract_page_lines(path)]
+
 def reset_chroma(db_path: Path) -> None:
     """
     Delete any existing `db_path` directory so we always start clean.
@@ -83,59 +137,335 @@ def reset_chroma(db_path: Path) -> None:
     db_path.mkdir(parents=True, exist_ok=True)
 
 # ╔════════════════════════════════════════════════════════════════╗
-# 3.  Main routine                                                 ║
+# 3.  Chunking: one vector per line, or token windows of lines     ║
+# ╚════════════════════════════════════════════════════════════════╝
+_encoding = None
+
+def get_encoding():
+    """The tiktoken encoding used to count tokens, loaded on first use."""
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+    return _encoding
+
+def chunk_settings(chunking: str = CHUNKING, max_tokens: int = CHUNK_TOKENS,
+                   overlap: int = CHUNK_OVERLAP) -> dict:
+    """Chunking parameters as stored in the manifest (a change forces a rebuild)."""
+    if chunking == "lines":
+        return {"mode": "lines"}
+    if chunking != "tokens":
+        raise ValueError(f"unknown chunking mode {chunking!r}")
+    if not 0 <= overlap < max_tokens:
+        raise ValueError("chunk overlap must be >= 0 and smaller than the window")
+    return {"mode": "tokens", "max_tokens": max_tokens, "overlap": overlap,
+            "encoding": TOKEN_ENCODING}
+
+def location(first: Line, last: Line) -> dict:
+    """Chunk metadata pointing back into the PDF."""
+    return {"page": first[0], "line_start": first[1],
+            "page_end": last[0], "line_end": last[1]}
+
+def line_chunks(lines: List[Line]) -> List[Chunk]:
+    """The original scheme: every line is its own chunk."""
+    return [(line[2], location(line, line)) for line in lines]
+
+def token_chunks(lines: List[Line], max_tokens: int = CHUNK_TOKENS,
+                 overlap: int = CHUNK_OVERLAP) -> List[Chunk]:
+    """
+    Pack consecutive lines into windows of at most `max_tokens` tokens.
+
+    Each new window starts with as many trailing lines of the previous
+    one as it takes to repeat at least `overlap` tokens (never the whole
+    previous window, and only what still fits).  A line longer than
+    `max_tokens` is cut into token windows of its own that overlap by
+    `overlap` tokens.  Token counts include one token per joining newline.
+    """
+    enc = get_encoding()
+    step = max_tokens - overlap
+
+    # (line, token count); over-long lines become several pieces first
+    pieces: List[Tuple[Line, int]] = []
+    for page, line_no, text in lines:
+        tokens = enc.encode(text)
+        if len(tokens) <= max_tokens:
+            pieces.append(((page, line_no, text), len(tokens)))
+            continue
+        for pos in range(0, max(len(tokens) - overlap, 1), step):
+            window = tokens[pos:pos + max_tokens]
+            pieces.append(((page, line_no, enc.decode(window)), len(window)))
+
+    def size(window: List[Tuple[Line, int]]) -> int:
+        return sum(n for _, n in window) + len(window) - 1
+
+    def emit(window: List[Tuple[Line, int]]) -> Chunk:
+        meta = location(window[0][0], window[-1][0])
+        meta["tokens"] = size(window)
+        return "\n".join(line[2] for line, _ in window), meta
+
+    chunks: List[Chunk] = []
+    window: List[Tuple[Line, int]] = []
+    for piece in pieces:
+        if window and size(window + [piece]) > max_tokens:
+            chunks.append(emit(window))
+            carry: List[Tuple[Line, int]] = []
+            while len(carry) < len(window) - 1 and sum(n for _, n in carry) < overlap:
+                carry.insert(0, window[-len(carry) - 1])
+            window = carry
+            while window and size(window + [piece]) > max_tokens:
+                window.pop(0)
+        window.append(piece)
+    if window:
+        chunks.append(emit(window))
+    return chunks
+
+def make_chunker(settings: dict) -> Callable[[List[Line]], List[Chunk]]:
+    """Chunking function for the settings returned by `chunk_settings()`."""
+    if settings["mode"] == "lines":
+        return line_chunks
+    return lambda lines: token_chunks(lines, settings["max_tokens"], settings["overlap"])
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 4.  Content hashing + manifest (incremental mode)                ║
+# ╚════════════════════════════════════════════════════════════════╝
+def doc_key(pdf_path: Path, pdf_dir: Path) -> str:
+    """
+    Manifest key / ID prefix for a PDF, e.g. `data/offices.pdf`.
+
+    Built from the folder *name* rather than the path we were given, so
+    IDs are identical whether the indexer runs from the repo root or is
+    called from another directory with an absolute `pdf_dir`.
+    """
+    return str(Path(pdf_dir.resolve().name) / pdf_path.name)
+
+def chunk_id(pdf_key: str, idx: int) -> str:
+    """Stable Chroma ID of chunk `idx` in the PDF stored under `pdf_key`."""
+    return f"{pdf_key}-{idx}"
+
+def file_sha256(path: Path) -> str:
+    """Hash a file's raw bytes without loading it all into memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_hash(text: str, meta: dict) -> str:
+    """Short hash of a chunk's text and position (a moved chunk is re-stored)."""
+    payload = json.dumps([text, meta], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+def load_manifest(db_path: Path, chunking: Optional[dict] = None) -> Optional[dict]:
+    """
+    Return the manifest stored in `db_path`, or None if unusable (missing,
+    another model, or built with chunking settings other than `chunking`).
+    """
+    try:
+        manifest = json.loads((db_path / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return None
+    if manifest.get("model") != EMBED_MODEL_NAME:
+        return None
+    if manifest.get("chunking") != (chunking or chunk_settings()):
+        return None
+    return manifest
+
+def save_manifest(db_path: Path, files: Dict[str, dict],
+                  chunking: Optional[dict] = None) -> None:
+    """Atomically write the manifest for the current index state."""
+    manifest = {"model": EMBED_MODEL_NAME,
+                "collection": COLLECTION_NAME,
+                "chunking": chunking or chunk_settings(),
+                "files": files}
+    tmp = db_path / (MANIFEST_NAME + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1))
+    tmp.replace(db_path / MANIFEST_NAME)
+
+def plan_file(pdf_path: Path, key: str, digest: str, previous: Optional[dict],
+              chunker: Optional[Callable[[List[Line]], List[Chunk]]] = None,
+              ) -> Optional[Tuple[List[Record], List[str], dict]]:
+    """
+    Chunk one PDF with `chunker` (default: `chunk_settings()`) and diff it
+    against its manifest entry.
+
+    Returns `(records to upsert, ids to delete, new manifest entry)`, or
+    None if the file could not be read.  Chunker errors (tokenizer,
+    settings) are not about the file and propagate.
+    """
+    print(f"→ Indexing {pdf_path.name}")
+    try:
+        lines = extract_page_lines(pdf_path)
+    except Exception as err:
+        print(f"[WARN] Could not read {pdf_path}: {err}")
+        return None
+    chunks = (chunker or make_chunker(chunk_settings()))(lines)
+
+    hashes = [chunk_hash(text, meta) for text, meta in chunks]
+    old_hashes = previous["chunks"] if previous else []
+
+    records: List[Record] = [
+        (chunk_id(key, idx), text, {"path": key, "chunk_index": idx, **meta})
+        for idx, ((text, meta), h) in enumerate(zip(chunks, hashes))
+        if idx >= len(old_hashes) or old_hashes[idx] != h
+    ]
+    stale = [chunk_id(key, idx) for idx in range(len(chunks), len(old_hashes))]
+    return records, stale, {"sha256": digest, "chunks": hashes}
+
+def index_is_stale(pdf_dir: Path = PDF_DIR, db_path: Path = CHROMA_PATH,
+                   chunking: Optional[dict] = None) -> bool:
+    """
+    True if the index at `db_path` is missing, was built with chunking
+    other than `chunking` (default: `chunk_settings()`), or does not match
+    the PDFs currently in `pdf_dir` (added, removed or modified files).
+    """
+    manifest = load_manifest(db_path, chunking)
+    if manifest is None:
+        return True
+    indexed = manifest["files"]
+    current = {doc_key(p, pdf_dir): p for p in pdf_dir.glob("*.pdf")}
+    if set(current) != set(indexed):
+        return True
+    return any(file_sha256(path) != indexed[key]["sha256"]
+               for key, path in current.items())
+
+def embed_batch(embed_model: SentenceTransformer,
+                lines: List[str],
+                batch_size: int) -> np.ndarray:
+    """
+    Encode `lines` in one call and return an `(n, dim)` float32 array of
+    L2-normalised vectors.
+    """
+    vectors = embed_model.encode(
+        lines,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    return np.asarray(vectors, dtype=np.float32)
+
+def write_batch(coll, embed_model: SentenceTransformer,
+                batch: List[Record], batch_size: int) -> None:
+    """Embed one batch of records and store it with a single bulk `upsert`."""
+    ids, lines, metas = (list(col) for col in zip(*batch))
+    vectors = embed_batch(embed_model, lines, batch_size)
+    coll.upsert(
+        ids        =ids,
+        embeddings =vectors.tolist(),
+        documents  =lines,
+        metadatas  =metas,
+    )
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 5.  Main routine                                                 ║
 # ╚════════════════════════════════════════════════════════════════╝
-def index_pdfs() -> None:
+def index_pdfs(batch_size: int = BATCH_SIZE, incremental: bool = False,
+               pdf_dir: Path = PDF_DIR, db_path: Path = CHROMA_PATH,
+               chunking: str = CHUNKING, chunk_tokens: int = CHUNK_TOKENS,
+               chunk_overlap: int = CHUNK_OVERLAP) -> None:
     """
-    Walk `PDF_DIR`, embed every line of every PDF, and store everything
-    into a *new* ChromaDB at `CHROMA_PATH`.
+    Walk `pdf_dir`, chunk every PDF (`chunking` = "tokens" or "lines"),
+    embed every new or changed chunk in batches of `batch_size`, and
+    store everything into the ChromaDB at `db_path`.
+
+    Without `incremental` the DB is wiped and rebuilt from scratch.
     """
-    pdf_files = sorted(PDF_DIR.glob("*.pdf"))
+    if batch_size < 1:
+        raise ValueError("batch_size must be >= 1")
+    settings = chunk_settings(chunking, chunk_tokens, chunk_overlap)
+    chunker = make_chunker(settings)
+
+    pdf_files = sorted(pdf_dir.glob("*.pdf"))
     if not pdf_files:
-        print(f"No PDF files found in {PDF_DIR.resolve()}")
+        print(f"No PDF files found in {pdf_dir.resolve()}")
         return
 
-    # ── 1. Load embedding model (one-off) ─────────────────────────
-    print(f"Embedding model: {EMBED_MODEL_NAME}")
-    embed_model = SentenceTransformer(EMBED_MODEL_NAME)
+    start = time.perf_counter()
 
-    # ── 2. Fresh DB on disk ───────────────────────────────────────
-    reset_chroma(CHROMA_PATH)
+    # ── 1. Fresh DB on disk, or diff against the manifest ─────────
+    manifest = load_manifest(db_path, settings) if incremental else None
+    if manifest is None:
+        if incremental:
+            print("No usable manifest — doing a full rebuild")
+        reset_chroma(db_path)
+        old_files: Dict[str, dict] = {}
+    else:
+        old_files = manifest["files"]
+
+    # ── 2. Work out what to embed and what to delete ──────────────
+    new_files: Dict[str, dict] = {}
+    upserts: List[Record] = []
+    deletes: List[str] = []
+    for pdf_path in pdf_files:
+        key = doc_key(pdf_path, pdf_dir)
+        previous = old_files.get(key)
+        digest = file_sha256(pdf_path)
+        if previous and previous["sha256"] == digest:
+            new_files[key] = previous             # untouched file
+            continue
+
+        plan = plan_file(pdf_path, key, digest, previous, chunker)
+        if plan is None:
+            if previous:
+                new_files[key] = previous         # keep what we had
+            continue
+        records, stale, new_files[key] = plan
+        upserts.extend(records)
+        deletes.extend(stale)
+
+    for key, previous in old_files.items():
+        if key not in new_files:
+            print(f"→ Removing {key}")
+            deletes.extend(chunk_id(key, idx)
+                           for idx in range(len(previous["chunks"])))
 
     # ── 3. Connect to persistent Chroma client ────────────────────
     client = PersistentClient(
-        path=str(CHROMA_PATH),
+        path=str(db_path),
         settings=Settings(),                  # defaults are fine
         tenant=DEFAULT_TENANT,
         database=DEFAULT_DATABASE,
     )
     coll = client.get_or_create_collection(COLLECTION_NAME)
 
-    # ── 4. Iterate over every PDF ─────────────────────────────────
-    for pdf_path in pdf_files:
-        print(f"→ Indexing {pdf_path.name}")
-        try:
-            lines = extract_lines(pdf_path)
-        except Exception as err:
-            print(f"[WARN] Could not read {pdf_path}: {err}")
-            continue
+    if deletes:
+        coll.delete(ids=deletes)
 
-        # Embed and write each line
-        for idx, line in enumerate(lines):
-            vector = embed_model.encode(line).tolist()
+    # ── 4. Embed + write in fixed-size batches ────────────────────
+    if upserts:
+        # Load embedding model only when there is something to embed
+        print(f"Embedding model: {EMBED_MODEL_NAME}")
+        embed_model = SentenceTransformer(EMBED_MODEL_NAME)
+        embed_start = time.perf_counter()
+        for pos in range(0, len(upserts), batch_size):
+            write_batch(coll, embed_model, upserts[pos:pos + batch_size], batch_size)
+        embed_elapsed = time.perf_counter() - embed_start
+        rate = len(upserts) / embed_elapsed if embed_elapsed > 0 else 0.0
+        print(f"Embedded {len(upserts)} chunks in {embed_elapsed:.2f}s "
+              f"({rate:.1f} chunks/sec, batch size {batch_size})")
 
-            coll.add(
-                ids        =[f"{pdf_path}-{idx}"],            # unique ID
-                embeddings =[vector],                         # the vector
-                documents  =[line],                           # raw text
-                metadatas  =[{"path": str(pdf_path),
-                              "chunk_index": idx}],           # extra info
-            )
+    save_manifest(db_path, new_files, settings)
 
-    print("Indexing complete — new DB stored in ./chroma_db")
+    elapsed = time.perf_counter() - start
+    print(f"Indexing complete in {elapsed:.2f}s — {len(upserts)} chunks "
+          f"written, {len(deletes)} removed ({settings['mode']} chunking); "
+          f"DB stored in {db_path}")
 
 # ╔════════════════════════════════════════════════════════════════╗
-# 4.  Script entry-point                                           ║
+# 6.  Script entry-point                                           ║
 # ╚════════════════════════════════════════════════════════════════╝
 if __name__ == "__main__":
-    index_pdfs()
+    parser = argparse.ArgumentParser(description="Index ./data/*.pdf into ChromaDB.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"chunks per embedding/add batch (default {BATCH_SIZE})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only embed new/changed chunks instead of rebuilding")
+    parser.add_argument("--chunking", choices=["tokens", "lines"], default=CHUNKING,
+                        help=f"token windows of lines, or one vector per line (default {CHUNKING})")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS,
+                        help=f"max tokens per window (default {CHUNK_TOKENS})")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP,
+                        help=f"tokens repeated between windows (default {CHUNK_OVERLAP})")
+    args = parser.parse_args()
+    index_pdfs(batch_size=args.batch_size, incremental=args.incremental,
+               chunking=args.chunking, chunk_tokens=args.chunk_tokens,
+               chunk_overlap=args.chunk_overlap)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+quant_store.py
+────────────────────────────────────────────────────────────────────
+Compact, memory-mapped copy of the Chroma vectors for fast search.
+
+`./chroma_db/quantized/` holds the collection's L2-normalised float32
+vectors plus two quantized codes of them:
+
+* **int8** – every dimension scaled by its largest magnitude into
+  [-127, 127]: 1 byte per value, 4× smaller than float32.
+* **binary** – only the sign of every dimension, packed 8 per byte:
+  32× smaller.  Similarity is the (negated) Hamming distance.
+
+A query scans *only the codes* to pick `candidates` rows (default 8×k),
+then reranks those rows with the exact float32 cosine, so the answer is
+exact whenever the true top-k is among the candidates.  All files are
+`np.memmap`s: the OS pages in the codes for the first pass and just the
+few float rows needed for the rerank, so resident memory follows the
+code size rather than the float matrix.
+
+The store records a fingerprint of the index manifest written by
+`index_pdf.py`; `QuantizedStore.open(..., coll=...)` rebuilds it from
+the collection whenever the index changed.
+
+    python tools/quant_store.py              # (re)build ./chroma_db/quantized
+    python tools/search.py --quantized int8  # search through it
+
+`benchmarks/quantization.py` reports memory, latency and recall@k of
+both codes against the exact search.
+"""
+
+# ───────────────────── standard-library imports ────────────────────
+import argparse
+import hashlib
+import json
+import shutil
+import sys
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+# ───────────────────── 3rd-party imports ───────────────────────────
+import numpy as np
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Configuration / constants                                    ║
+# ╚════════════════════════════════════════════════════════════════╝
+CHROMA_PATH     = Path("./chroma_db")            # index built by index_pdf.py
+COLLECTION_NAME = "codebase"
+STORE_DIRNAME   = "quantized"                    # sub-folder of the Chroma dir
+MODES           = ("int8", "binary")
+RERANK_FACTOR   = 8                              # candidates = k × this
+PAGE_SIZE       = 1024                           # rows per coll.get() page
+BLOCK_ROWS      = 1024                          # int8 rows upcast per step (cache-sized)
+
+FLOAT_FILE   = "vectors.f32"
+CODE_FILES   = {"int8": "codes.i8", "binary": "codes.bin"}
+SCALE_FILE   = "scale.npy"
+RECORDS_FILE = "records.json"
+META_FILE    = "meta.json"
+
+Hit = Tuple[int, float]                          # (row, exact cosine)
+
+# popcount of every byte value, for Hamming distances on NumPy < 2.0
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+def hamming(codes: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    """Hamming distance from every row of packed `codes` to `query_bits`."""
+    diff = np.bitwise_xor(codes, query_bits)
+    if hasattr(np, "bitwise_count"):                # NumPy >= 2.0: one popcount per word
+        if diff.shape[1] % 8 == 0:
+            diff = diff.view(np.uint64)
+        return np.bitwise_count(diff).sum(axis=1, dtype=np.int32)
+    return POPCOUNT[diff].sum(axis=1, dtype=np.int32)
+
+def store_path(db_path: Path = CHROMA_PATH) -> Path:
+    return db_path / STORE_DIRNAME
+
+def index_fingerprint(db_path: Path = CHROMA_PATH) -> Optional[str]:
+    """Hash of the index manifest; changes whenever index_pdf.py changed the index."""
+    try:
+        return hashlib.sha256((db_path / "manifest.json").read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Quantization                                                 ║
+# ╚════════════════════════════════════════════════════════════════╝
+def int8_scale(vectors: np.ndarray) -> np.ndarray:
+    """Per-dimension step so the largest magnitude maps to ±127."""
+    peak = np.abs(vectors).max(axis=0) if len(vectors) else np.ones(vectors.shape[1])
+    return (np.where(peak > 0, peak, 1.0) / 127.0).astype(np.float32)
+
+def quantize_int8(vectors: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    return np.packbits(vectors > 0, axis=1)
+
+def normalise(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 3.  Writing a store                                              ║
+# ╚════════════════════════════════════════════════════════════════╝
+def write_store(out_dir: Path, vectors: np.ndarray, ids: Sequence[str],
+                documents: Sequence[str], metadatas: Sequence[dict],
+                fingerprint: Optional[str] = None) -> None:
+    """
+    Write floats, both codes and the records to `out_dir` (replaced).
+
+    Parameters
+    ----------
+    vectors : np.ndarray
+        `(n, dim)` embeddings; normalised here if they are not already.
+    ids, documents, metadatas : sequences of length n
+        What a search returns for each row.
+    fingerprint : str, optional
+        `index_fingerprint()` of the index the vectors came from.
+    """
+    vectors = normalise(vectors)
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    scale = int8_scale(vectors)
+    vectors.tofile(tmp / FLOAT_FILE)
+    quantize_int8(vectors, scale).tofile(tmp / CODE_FILES["int8"])
+    quantize_binary(vectors).tofile(tmp / CODE_FILES["binary"])
+    np.save(tmp / SCALE_FILE, scale)
+    (tmp / RECORDS_FILE).write_text(json.dumps(
+        {"ids": list(ids), "documents": list(documents), "metadatas": list(metadatas)},
+        ensure_ascii=False))
+    (tmp / META_FILE).write_text(json.dumps(
+        {"count": int(vectors.shape[0]), "dim": int(vectors.shape[1]),
+         "fingerprint": fingerprint}, indent=1))
+
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    tmp.replace(out_dir)
+
+def read_collection(coll) -> Tuple[np.ndarray, List[str], List[str], List[dict]]:
+    """Page every vector, id, document and metadata out of a Chroma collection."""
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[dict] = []
+    blocks: List[np.ndarray] = []
+    total = coll.count()
+    for offset in range(0, total, PAGE_SIZE):
+        page = coll.get(include=["embeddings", "documents", "metadatas"],
+                        limit=PAGE_SIZE, offset=offset)
+        ids += page["ids"]
+        documents += page["documents"]
+        metadatas += page["metadatas"]
+        blocks.append(np.asarray(page["embeddings"], dtype=np.float32))
+    if not blocks:
+        raise ValueError("collection is empty")
+    return np.concatenate(blocks), ids, documents, metadatas
+
+def export_collection(coll, out_dir: Path, fingerprint: Optional[str] = None) -> int:
+    """Write a store for everything in `coll`; row count."""
+    vectors, ids, documents, metadatas = read_collection(coll)
+    write_store(out_dir, vectors, ids, documents, metadatas, fingerprint)
+    return len(ids)
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 4.  Searching a store                                            ║
+# ╚════════════════════════════════════════════════════════════════╝
+class QuantizedStore:
+    """Memory-mapped floats + codes: quantized first pass, exact rerank."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.meta = json.loads((path / META_FILE).read_text())
+        n, dim = self.meta["count"], self.meta["dim"]
+        self.vectors = np.memmap(path / FLOAT_FILE, dtype=np.float32, mode="r", shape=(n, dim))
+        self.codes = {
+            "int8":   np.memmap(path / CODE_FILES["int8"], dtype=np.int8, mode="r", shape=(n, dim)),
+            "binary": np.memmap(path / CODE_FILES["binary"], dtype=np.uint8, mode="r",
+                                shape=(n, (dim + 7) // 8)),
+        }
+        self.scale = np.load(path / SCALE_FILE)
+        self._records: Optional[dict] = None
+
+    @classmethod
+    def open(cls, db_path: Path = CHROMA_PATH, coll=None) -> "QuantizedStore":
+        """
+        Open the store next to the index at `db_path`.  With `coll`, build
+        or rebuild it first if it is missing or older than the index.
+        """
+        path = store_path(db_path)
+        fingerprint = index_fingerprint(db_path)
+        if coll is not None:
+            try:
+                current = json.loads((path / META_FILE).read_text())
+            except (OSError, ValueError):
+                current = None
+            if (current is None or current.get("fingerprint") != fingerprint
+                    or current.get("count") != coll.count()):
+                # stderr: stdout may be carrying results (search.py --batch)
+                print(f"Building quantized store in {path} ...", file=sys.stderr)
+                export_collection(coll, path, fingerprint)
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def record(self, row: int) -> Tuple[str, str, dict]:
+        """(id, document, metadata) of a row."""
+        if self._records is None:
+            self._records = json.loads((self.path / RECORDS_FILE).read_text())
+        rec = self._records
+        return rec["ids"][row], rec["documents"][row], rec["metadatas"][row]
+
+    def memory(self) -> dict:
+        """Bytes of the float matrix and of each code (what a first pass reads)."""
+        floats = self.vectors.nbytes
+        return {"float32": floats,
+                **{mode: codes.nbytes for mode, codes in self.codes.items()},
+                **{f"{mode}_ratio": round(floats / codes.nbytes, 1)
+                   for mode, codes in self.codes.items() if codes.nbytes}}
+
+    def approximate(self, queries: np.ndarray, mode: str) -> np.ndarray:
+        """`(m, n)` first-pass scores from the codes alone (higher = closer)."""
+        if mode == "int8":
+            scaled = queries * self.scale                 # x·q ≈ codes · (q × scale)
+            codes = self.codes["int8"]
+            return np.concatenate([
+                codes[pos:pos + BLOCK_ROWS].astype(np.float32) @ scaled.T
+                for pos in range(0, len(self), BLOCK_ROWS)
+            ], axis=0).T
+        if mode == "binary":
+            codes = self.codes["binary"]
+            qbits = quantize_binary(queries)
+            return -np.stack([hamming(codes, q) for q in qbits]).astype(np.float32)
+        raise ValueError(f"unknown quantization {mode!r} (expected one of {MODES})")
+
+    def search(self, queries: np.ndarray, k: int, mode: str = "int8",
+               candidates: Optional[int] = None) -> List[List[Hit]]:
+        """
+        Top-`k` rows per query, best first, with exact cosine scores.
+
+        Parameters
+        ----------
+        queries : np.ndarray
+            `(dim,)` or `(m, dim)` query embeddings.
+        mode : {"int8", "binary"}
+            Which code the first pass scans.
+        candidates : int, optional
+            Rows kept by the first pass and reranked exactly
+            (default `k × RERANK_FACTOR`).
+        """
+        queries = normalise(np.atleast_2d(queries))
+        n = len(self)
+        k = min(k, n)
+        keep = min(n, max(k, candidates or k * RERANK_FACTOR))
+        approx = self.approximate(queries, mode)
+
+        results: List[List[Hit]] = []
+        for q, scores in zip(queries, approx):
+            rows = np.argpartition(-scores, keep - 1)[:keep] if keep < n else np.arange(n)
+            rows.sort()                                   # sequential memmap reads
+            exact = self.vectors[rows] @ q
+            best = np.argsort(-exact)[:k]
+            results.append([(int(rows[i]), float(exact[i])) for i in best])
+        return results
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 5.  Script entry-point                                           ║
+# ╚════════════════════════════════════════════════════════════════╝
+if __name__ == "__main__":
+    from chromadb import PersistentClient
+    from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
+
+    parser = argparse.ArgumentParser(description="Build the quantized copy of the Chroma index.")
+    parser.add_argument("--db", type=Path, default=CHROMA_PATH, help="Chroma folder")
+    args = parser.parse_args()
+
+    client = PersistentClient(path=str(args.db), settings=Settings(),
+                              tenant=DEFAULT_TENANT, database=DEFAULT_DATABASE)
+    coll = client.get_collection(COLLECTION_NAME)
+    rows = export_collection(coll, store_path(args.db), index_fingerprint(args.db))
+    store = QuantizedStore(store_path(args.db))
+    mem = store.memory()
+    print(f"{rows} vectors → {store.path}: float32 {mem['float32']:,} B, "
+          f"int8 {mem['int8']:,} B ({mem['int8_ratio']}×), "
+          f"binary {mem['binary']:,} B ({mem['binary_ratio']}×)")
@@ -1,12 +1,42 @@
 #!/usr/bin/env python3
 # search.py — colourised, similarity-aware search with numbered, clearly-
 #             separated results and explicit cosine-similarity labels.
+#
+#   python tools/search.py                    # NumPy brute force for small
+#                                             # indexes, else Chroma (HNSW)
+#   python tools/search.py --backend chroma   # force one (vector_backend.py)
+#   python tools/search.py --quantized int8   # int8/binary first pass over
+#                                             # quant_store.py's memmapped
+#                                             # codes, exact float rerank
+#   python tools/search.py --batch queries.txt -o results.jsonl
+#   cat queries.txt | python tools/search.py --batch -
+#
+# Batch mode reads one query per line (or a JSON object with a "query";
+# its other fields are copied to the output), embeds each --batch-size
+# block of queries with one encode call, runs them as one multi-query
+# search (a single `query_embeddings` request for Chroma, one matrix
+# product for NumPy), and writes one JSON line of ranked results per
+# query.  Throughput goes to stderr.
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, List, Tuple
 
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from chromadb import PersistentClient
 from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
 
+# ── Tracing spans (TRACE=1 to record, see code/tracing.py) ───────────────
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "code"))
+import tracing
+
+from quant_store import MODES, QuantizedStore
+from vector_backend import open_backend
+
 # ── ANSI colours (works on most POSIX terminals) ─────────────────────────
 GREEN = "\033[92m"   # best match
 BLUE  = "\033[94m"   # other matches
@@ -23,37 +53,91 @@ db_client = PersistentClient(
 
 embed_model = SentenceTransformer("all-MiniLM-L6-v2")  # same model as indexers
 
-# ── Utility: exact cosine similarity ─────────────────────────────────────
-def cosine_sim(a: np.ndarray, b: np.ndarray) -> float:
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-10))
+# ── Quantized copy of the collection, built/refreshed on first use ───────
+_store = None
+
+def quantized_store() -> QuantizedStore:
+    global _store
+    if _store is None:
+        coll = db_client.get_or_create_collection(name="codebase")
+        _store = QuantizedStore.open(Path("./chroma_db"), coll)
+    return _store
+
+# ── Exact search backend (NumPy or Chroma), chosen on first use ──────────
+_backend = None
+
+def vector_backend(kind: str = None):
+    global _backend
+    if _backend is None:
+        _backend = open_backend(db_client.get_or_create_collection(name="codebase"), kind)
+    return _backend
+
+# ── Utility: where a chunk came from ─────────────────────────────────────
+def cite(meta: dict) -> str:
+    """`data/offices.pdf p.1 l.6–12 (chunk 1)`; page/line offsets when the index has them."""
+    where = meta["path"]
+    if "page" in meta:
+        start, end = meta["line_start"], meta["line_end"]
+        if meta["page_end"] != meta["page"]:
+            where += f" p.{meta['page']} l.{start} – p.{meta['page_end']} l.{end}"
+        else:
+            where += f" p.{meta['page']} l.{start}" + (f"–{end}" if end != start else "")
+    return f"{where}  (chunk {meta['chunk_index']})"
+
+# ── Retrieval shared by the REPL and batch mode ──────────────────────────
+Match = Tuple[str, dict, float]                         # (document, metadata, cosine)
+
+def retrieve(query_vecs: np.ndarray, top_k: int, quantized: str = None,
+             backend: str = None) -> List[List[Match]]:
+    """Top-k matches for every row of `query_vecs`, in one multi-query call."""
+    if quantized:
+        store = quantized_store()
+        with tracing.span("quantized.search", mode=quantized, n_results=top_k,
+                          queries=len(query_vecs)):
+            results = store.search(query_vecs, top_k, quantized)
+        # exact cosine from the rerank
+        return [[(*store.record(row)[1:], score) for row, score in hits] for hits in results]
+
+    searcher = vector_backend(backend)
+    with tracing.span(f"{searcher.name}.query", n_results=top_k, queries=len(query_vecs)):
+        results = searcher.query(query_vecs, top_k)
+    return [[(doc, meta, score) for _, doc, meta, score in hits] for hits in results]
+
+def corpus_size(quantized: str = None, backend: str = None) -> int:
+    """Number of stored chunks, without reading any of them."""
+    with tracing.span("count"):
+        if quantized:
+            # an empty index has nothing to quantize: don't build a store for it
+            if db_client.get_or_create_collection(name="codebase").count() == 0:
+                return 0
+            return len(quantized_store())
+        return vector_backend(backend).count()
 
 # ── Core search routine ──────────────────────────────────────────────────
-def search(query: str, top_k: int = 3) -> None:
-    coll = db_client.get_or_create_collection(name="codebase")
+def search(query: str, top_k: int = 3, quantized: str = None, backend: str = None) -> None:
+    with tracing.span("search.query", top_k=top_k, quantized=quantized) as sp:
+        _search(query, top_k, sp, quantized, backend)
 
-    total_chunks = len(coll.get().get("documents", []))
+def _search(query: str, top_k: int, sp, quantized: str = None, backend: str = None) -> None:
+    total_chunks = corpus_size(quantized, backend)
     if total_chunks == 0:
         print("Collection is empty — nothing to search.")
         return
     print(f"Collection contains {total_chunks} chunks.\n")
 
-    query_vec = embed_model.encode(query)
-
-    results = coll.query(
-        query_embeddings=[query_vec.tolist()],
-        n_results=top_k,
-        include=["documents", "metadatas", "embeddings"],
-    )
+    with tracing.span("embed", model="all-MiniLM-L6-v2"):
+        query_vec = embed_model.encode(query)
 
-    docs   = results["documents"][0]
-    metas  = results["metadatas"][0]
-    embeds = results["embeddings"][0]
+    matches = retrieve(np.atleast_2d(query_vec), top_k, quantized, backend)[0]
+    docs  = [doc for doc, _, _ in matches]
+    metas = [meta for _, meta, _ in matches]
+    sims  = [score for _, _, score in matches]          # cosine similarity
 
+    sp.set(hits=len(docs), corpus=total_chunks)
     if not docs:
         print("No matches found.")
         return
 
-    sims = [cosine_sim(query_vec, np.array(e)) for e in embeds]
     best_idx = int(np.argmax(sims))
 
     for i, (doc, meta, sim) in enumerate(zip(docs, metas, sims), start=1):
@@ -65,18 +149,103 @@ def search(query: str, top_k: int = 3) -> None:
             f"{separator}{RESET}\n"
             f"{doc}\n\n"
             f"{RED}Cosine similarity: {sim:.4f}{RESET}\n"
-            f"Source: {meta['path']}  (chunk {meta['chunk_index']})\n"
+            f"Source: {cite(meta)}\n"
         )
 
+# ── Batch mode ───────────────────────────────────────────────────────────
+def read_queries(fh) -> Iterator[Tuple[int, dict]]:
+    """(line number, {"query": ..., extra fields}) for every non-blank line."""
+    for number, raw in enumerate(fh, start=1):
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                item = None
+            if isinstance(item, dict) and isinstance(item.get("query"), str):
+                yield number, item
+                continue
+        yield number, {"query": line}
+
+def search_batch(src, out, top_k: int = 3, quantized: str = None, backend: str = None,
+                 batch_size: int = 256) -> dict:
+    """Answer every query in `src`, writing JSONL to `out`; returns timing totals."""
+    totals = {"queries": 0, "encode_s": 0.0, "search_s": 0.0}
+    started = time.perf_counter()
+    corpus = corpus_size(quantized, backend)
+
+    def flush(batch: List[Tuple[int, dict]]) -> None:
+        t0 = time.perf_counter()
+        with tracing.span("embed", model="all-MiniLM-L6-v2", queries=len(batch)):
+            vecs = embed_model.encode([item["query"] for _, item in batch],
+                                      batch_size=batch_size, convert_to_numpy=True,
+                                      normalize_embeddings=True, show_progress_bar=False)
+        t1 = time.perf_counter()
+        results = retrieve(vecs, top_k, quantized, backend) if corpus else [[] for _ in batch]
+        t2 = time.perf_counter()
+        for (number, item), matches in zip(batch, results):
+            out.write(json.dumps({**item, "line": number, "results": [
+                {"rank": rank, "score": round(score, 6), "document": doc,
+                 "source": cite(meta), "metadata": meta}
+                for rank, (doc, meta, score) in enumerate(matches, start=1)
+            ]}, ensure_ascii=False) + "\n")
+        totals["queries"] += len(batch)
+        totals["encode_s"] += t1 - t0
+        totals["search_s"] += t2 - t1
+
+    batch: List[Tuple[int, dict]] = []
+    for entry in read_queries(src):
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    out.flush()
+    totals["wall_s"] = time.perf_counter() - started
+    totals["corpus"] = corpus
+    return totals
+
 # ── Simple REPL ──────────────────────────────────────────────────────────
 if __name__ == "__main__":
-    print("Enter your search query (type 'exit' to quit):")
-    while True:
-        user_input = input("🔍 Search: ").strip()
-        if user_input.lower() == "exit":
-            print("Exiting search.")
-            break
-        if user_input:
-            search(user_input)
-        else:
-            print("Please enter a valid query.")
+    parser = argparse.ArgumentParser(description="Search the office index.")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--backend", choices=["auto", "numpy", "chroma"],
+                        help="exact search backend (default: VECTOR_BACKEND or auto)")
+    parser.add_argument("--quantized", choices=MODES,
+                        help="first pass over int8/binary codes, then exact rerank")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="answer the queries in FILE (one per line, - for stdin) as JSONL")
+    parser.add_argument("-o", "--output", help="batch results file (default: stdout)")
+    parser.add_argument("--batch-size", type=int, default=256,
+                        help="queries per encode/search call (default 256)")
+    args = parser.parse_args()
+
+    if args.batch:
+        src = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            t = search_batch(src, out, args.top_k, args.quantized, args.backend,
+                             max(1, args.batch_size))
+        finally:
+            if src is not sys.stdin:
+                src.close()
+            if out is not sys.stdout:
+                out.close()
+        rate = t["queries"] / t["wall_s"] if t["wall_s"] else 0.0
+        print(f"{t['queries']} queries against {t['corpus']} chunks in {t['wall_s']:.2f}s "
+              f"= {rate:.1f} queries/s (encode {t['encode_s']:.2f}s, "
+              f"search {t['search_s']:.2f}s)", file=sys.stderr)
+    else:
+        print("Enter your search query (type 'exit' to quit):")
+        while True:
+            user_input = input("🔍 Search: ").strip()
+            if user_input.lower() == "exit":
+                print("Exiting search.")
+                break
+            if user_input:
+                search(user_input, args.top_k, args.quantized, args.backend)
+            else:
+                print("Please enter a valid query.")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+vector_backend.py
+────────────────────────────────────────────────────────────────────
+Pluggable top-k retrieval over the office index: Chroma or plain NumPy.
+
+For a corpus the size of `offices.pdf` a Chroma query (HNSW graph walk
+plus SQLite look-ups for documents and metadata) costs far more than
+the arithmetic.  `NumpyBackend` keeps every L2-normalised embedding in
+one contiguous float32 matrix and answers
+
+    scores = queries @ matrix.T          # one mat-vec (or mat-mat) product
+    top    = argpartition(-scores, k)    # O(n) selection, then sort k
+
+which is exact and, up to tens of thousands of vectors, faster than the
+index.  Several queries are answered with a single matrix-matrix product.
+With `mmap=True` the matrix is the memory-mapped float file of
+`quant_store.py` (rebuilt when the index changes) instead of a copy in
+RAM, so processes share it through the page cache.
+
+`open_backend()` picks NumPy while the collection has at most
+`BRUTE_FORCE_MAX` vectors and Chroma above that; `VECTOR_BACKEND`
+(auto | numpy | chroma) and `VECTOR_MMAP=1` override it.  Both backends
+return `(id, document, metadata, cosine)` per hit, best first.
+"""
+
+# ───────────────────── standard-library imports ────────────────────
+import os
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+# ───────────────────── 3rd-party imports ───────────────────────────
+import numpy as np
+
+from quant_store import CHROMA_PATH, QuantizedStore, normalise, read_collection
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Configuration / constants                                    ║
+# ╚════════════════════════════════════════════════════════════════╝
+BRUTE_FORCE_MAX = int(os.environ.get("VECTOR_BRUTE_FORCE_MAX", 50_000))  # vectors
+BACKEND         = os.environ.get("VECTOR_BACKEND", "auto")               # auto | numpy | chroma
+MMAP            = os.environ.get("VECTOR_MMAP", "0") == "1"
+
+Hit = Tuple[str, str, dict, float]               # (id, document, metadata, cosine)
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Backends                                                     ║
+# ╚════════════════════════════════════════════════════════════════╝
+class ChromaBackend:
+    """Top-k through the collection's own (HNSW) index."""
+
+    name = "chroma"
+
+    def __init__(self, coll) -> None:
+        self.coll = coll
+        # Chroma reports distances; turn them back into cosine similarity
+        self.space = (coll.metadata or {}).get("hnsw:space", "l2")
+
+    def count(self) -> int:
+        return self.coll.count()
+
+    def query(self, queries: np.ndarray, k: int) -> List[List[Hit]]:
+        """Top-`k` hits for each row of `queries` (`(dim,)` or `(m, dim)`)."""
+        queries = normalise(np.atleast_2d(queries))
+        results = self.coll.query(query_embeddings=queries.tolist(), n_results=k,
+                                  include=["documents", "metadatas", "distances"])
+        return [
+            [(id_, doc, meta, self._cosine(dist))
+             for id_, doc, meta, dist in zip(ids, docs, metas, dists)]
+            for ids, docs, metas, dists in zip(results["ids"], results["documents"],
+                                               results["metadatas"], results["distances"])
+        ]
+
+    def _cosine(self, distance: float) -> float:
+        if self.space == "l2":                   # squared L2 of unit vectors = 2 - 2·cos
+            return 1.0 - distance / 2.0
+        return 1.0 - distance                    # "cosine" and "ip" both store 1 - dot
+
+class NumpyBackend:
+    """Exact top-k by brute force over one contiguous float32 matrix."""
+
+    name = "numpy"
+
+    def __init__(self, vectors: np.ndarray,
+                 record: Callable[[int], Tuple[str, str, dict]]) -> None:
+        self.vectors = vectors                   # (n, dim), rows L2-normalised
+        self.record = record
+
+    @classmethod
+    def from_collection(cls, coll) -> "NumpyBackend":
+        """Copy every vector of `coll` into RAM."""
+        vectors, ids, documents, metadatas = read_collection(coll)
+        return cls(np.ascontiguousarray(normalise(vectors)),
+                   lambda row: (ids[row], documents[row], metadatas[row]))
+
+    @classmethod
+    def from_store(cls, store: QuantizedStore) -> "NumpyBackend":
+        """Search the memory-mapped float file of a `QuantizedStore`."""
+        return cls(store.vectors, store.record)
+
+    def count(self) -> int:
+        return len(self.vectors)
+
+    def query(self, queries: np.ndarray, k: int) -> List[List[Hit]]:
+        """Top-`k` hits for each row of `queries` (`(dim,)` or `(m, dim)`)."""
+        queries = normalise(np.atleast_2d(queries))
+        n = len(self.vectors)
+        k = min(k, n)
+        if k == 0:
+            return [[] for _ in queries]
+        scores = queries @ self.vectors.T                       # (m, n)
+        top = (np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < n
+               else np.broadcast_to(np.arange(n), scores.shape))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return [
+            [(*self.record(int(rows[i])), float(row_scores[i])) for i in ranks]
+            for rows, row_scores, ranks in zip(top, top_scores, order)
+        ]
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 3.  Choosing one                                                 ║
+# ╚════════════════════════════════════════════════════════════════╝
+def open_backend(coll, kind: Optional[str] = None, mmap: Optional[bool] = None,
+                 db_path: Path = CHROMA_PATH):
+    """
+    The backend to search `coll` with.
+
+    Parameters
+    ----------
+    kind : {"auto", "numpy", "chroma"}, optional
+        Default `VECTOR_BACKEND`.  "auto" uses NumPy for collections of at
+        most `BRUTE_FORCE_MAX` vectors and Chroma for larger ones.
+    mmap : bool, optional
+        Default `VECTOR_MMAP`.  NumPy searches the memory-mapped float file
+        next to the index at `db_path` instead of a private copy.
+    """
+    kind = kind or BACKEND
+    mmap = MMAP if mmap is None else mmap
+    if kind not in ("auto", "numpy", "chroma"):
+        raise ValueError(f"unknown vector backend {kind!r}")
+    if kind == "auto":
+        kind = "numpy" if 0 < coll.count() <= BRUTE_FORCE_MAX else "chroma"
+    if kind == "chroma":
+        return ChromaBackend(coll)
+    if mmap:
+        return NumpyBackend.from_store(QuantizedStore.open(db_path, coll))
+    return NumpyBackend.from_collection(coll)